@@ -0,0 +1,458 @@
+"""
+IMD Sales Bot - HTTP/JSON API
+Streamlit 없이 상담 엔진을 호출하는 경량 서버 (index.html / 파트너 사이트 임베드용)
+- 표준 라이브러리 서버: python api_server.py --port 8600
+- ASGI 서버: uvicorn api_server:asgi_app --port 8600
+
+엔드포인트:
+    GET  /healthz                                                    → LLM 설정 + 의미 캐시 적중률
+    GET  /metrics                                                    → 구간별 소요 시간 (Prometheus 텍스트)
+    GET  /funnel                                                     → 페르소나별 단계 전환/체류 시간/전환율
+    POST /sessions                    {"client_id"}                  → 새 세션
+    GET  /sessions/{id}                                              → 현재 상태
+    POST /sessions/{id}/turns         {"text", "type", "client_id"}  → 한 턴 처리
+                                      (Accept: text/event-stream 이면 SSE 스트리밍)
+    POST /sessions/{id}/options       {"key"}                        → 선택 UI 항목 선택
+    POST /sessions/{id}/leads         {폼 필드...}                   → 리드 제출
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import DATA
+from conversation_engine import ConversationEngine
+from conversation_manager import ConversationManager
+from prompt_engine import get_prompt_engine
+from funnel_metrics import funnel_report
+from log_pipeline import get_logger
+from semantic_cache import get_semantic_cache
+from telemetry import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from session_store import (
+    SESSION_CACHE_SIZE,
+    SessionStore,
+    get_session_store,
+    is_valid_session_id,
+    new_session_id,
+)
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+# 임베드를 허용할 사이트 Origin (CORS, 하나 또는 "*")
+ALLOW_ORIGIN = os.getenv("IMD_API_ALLOW_ORIGIN", "*")
+MAX_BODY_BYTES = 16 * 1024
+MAX_TEXT_CHARS = 1000
+INTERNAL_ERROR = (500, {"error": "서버 오류가 발생했습니다."})
+
+
+_SESSION_PATH = re.compile(r"^/sessions/([0-9a-f]{32})(?:/(turns|options|leads))?/?$")
+
+
+class ApiError(Exception):
+    """HTTP 상태 코드를 가진 요청 오류"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ============================================
+# 세션별 엔진 (프로세스 메모리 LRU)
+# ============================================
+class EngineRegistry:
+    """
+    살아 있는 세션의 엔진을 메모리에 유지
+    - 캐시에 없으면 세션 저장소에서 복원
+    - 같은 세션의 요청은 세션 락으로 한 번에 하나씩 처리
+    """
+
+    def __init__(self, store: Optional[SessionStore] = None, max_live: int = SESSION_CACHE_SIZE):
+        self.store = store or get_session_store()
+        self.max_live = max_live
+        self._live: "OrderedDict[str, Tuple[ConversationEngine, threading.Lock]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, sid: str, client_id: Optional[str]) -> Optional[Tuple[ConversationEngine, threading.Lock]]:
+        manager = ConversationManager(state={}, store=self.store, session_id=sid)
+        saved_client = manager.get_context().get("client_id") if manager.resumed else None
+        if saved_client is None and client_id is None:
+            return None
+        engine = ConversationEngine(saved_client or client_id, manager)
+        return engine, threading.Lock()
+
+    def get(self, sid: str, client_id: Optional[str] = None) -> Tuple[ConversationEngine, threading.Lock]:
+        """
+        세션 엔진 + 세션 락
+
+        Args:
+            client_id: 저장된 세션이 없을 때 새로 시작할 페르소나 (None이면 404)
+        """
+        with self._lock:
+            entry = self._live.get(sid)
+            if entry is not None:
+                self._live.move_to_end(sid)
+                return entry
+        entry = self._build(sid, client_id)
+        if entry is None:
+            raise ApiError(404, "세션을 찾을 수 없습니다.")
+        with self._lock:
+            # 동시에 만들어진 경우 먼저 등록된 쪽 사용
+            entry = self._live.setdefault(sid, entry)
+            self._live.move_to_end(sid)
+            while len(self._live) > self.max_live:
+                self._live.popitem(last=False)
+        return entry
+
+
+_REGISTRY: Optional[EngineRegistry] = None
+
+
+def get_registry() -> EngineRegistry:
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = EngineRegistry()
+    return _REGISTRY
+
+
+# ============================================
+# 라우팅 (서버 종류와 무관한 순수 함수)
+# ============================================
+def _client_id(body: Dict) -> Optional[str]:
+    client_id = body.get("client_id")
+    if client_id is not None and not isinstance(client_id, str):
+        raise ApiError(400, "client_id는 문자열이어야 합니다.")
+    if client_id is not None and client_id not in DATA:
+        raise ApiError(400, f"알 수 없는 client_id: {client_id}")
+    return client_id
+
+
+def handle_request(
+    method: str,
+    path: str,
+    body: Optional[Dict] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> Tuple[int, Dict]:
+    """
+    요청 하나 처리
+
+    Args:
+        on_delta: turns 요청의 답변 조각 콜백 (SSE 스트리밍)
+
+    Returns:
+        (HTTP 상태 코드, JSON 응답)
+    """
+    body = body or {}
+    try:
+        if path == "/healthz" and method == "GET":
+            return 200, {"ok": True, **get_prompt_engine(), "semantic_cache": get_semantic_cache().stats()}
+
+        if path == "/funnel" and method == "GET":
+            return 200, funnel_report()
+
+        if path.rstrip("/") == "/sessions":
+            if method != "POST":
+                raise ApiError(405, "허용되지 않는 메서드입니다.")
+            client_id = _client_id(body) or "root"
+            sid = new_session_id()
+            engine, lock = get_registry().get(sid, client_id)
+            with lock:
+                engine.start(force=True)
+                return 201, engine.snapshot()
+
+        match = _SESSION_PATH.match(path)
+        if not match or not is_valid_session_id(match.group(1)):
+            raise ApiError(404, "존재하지 않는 경로입니다.")
+        sid, action = match.group(1), match.group(2)
+
+        if action is None:
+            if method != "GET":
+                raise ApiError(405, "허용되지 않는 메서드입니다.")
+            engine, lock = get_registry().get(sid)
+            with lock:
+                return 200, engine.snapshot()
+
+        if method != "POST":
+            raise ApiError(405, "허용되지 않는 메서드입니다.")
+
+        if action == "turns":
+            text, kind = body.get("text"), body.get("type")
+            if not isinstance(text, (str, type(None))) or not isinstance(kind, (str, type(None))):
+                raise ApiError(400, "text와 type은 문자열이어야 합니다.")
+            text = (text or "").strip()
+            if not text:
+                raise ApiError(400, "text가 비어 있습니다.")
+            if len(text) > MAX_TEXT_CHARS:
+                raise ApiError(400, f"text는 {MAX_TEXT_CHARS}자 이하여야 합니다.")
+            kind = "button" if kind == "button" else "text"
+            # 위젯은 첫 입력 때 세션을 만들므로 client_id가 오면 새 세션 허용
+            engine, lock = get_registry().get(sid, _client_id(body))
+            with lock:
+                engine.start()
+                turn = engine.handle_input(text, kind=kind, on_delta=on_delta)
+                return 200, {"turn": turn, "session": engine.snapshot()}
+
+        engine, lock = get_registry().get(sid)
+        with lock:
+            if action == "options":
+                try:
+                    turn = engine.select_option(str(body.get("key", "")))
+                except KeyError:
+                    raise ApiError(400, "알 수 없는 선택지입니다.")
+                return 200, {"turn": turn, "session": engine.snapshot()}
+
+            # leads
+            form = {field: str(body.get(field, "")) for field in engine.lead_fields()}
+            success, message = engine.submit_lead(form)
+            return (200 if success else 422), {"ok": success, "message": message, "session": engine.snapshot()}
+
+    except ApiError as e:
+        return e.status, {"error": e.message}
+    except Exception:
+        # 엔진 오류도 응답은 반드시 닫히도록 (SSE는 error 이벤트로)
+        logger.exception("요청 처리 실패: %s %s", method, path)
+        return INTERNAL_ERROR
+
+
+def _parse_body(raw: bytes) -> Dict:
+    if not raw:
+        return {}
+    if len(raw) > MAX_BODY_BYTES:
+        raise ApiError(413, "요청 본문이 너무 큽니다.")
+    try:
+        body = json.loads(raw.decode("utf-8"))
+    except ValueError:
+        raise ApiError(400, "JSON 형식이 아닙니다.")
+    if not isinstance(body, dict):
+        raise ApiError(400, "JSON 객체여야 합니다.")
+    return body
+
+
+def _wants_stream(method: str, path: str, accept: str) -> bool:
+    return method == "POST" and path.rstrip("/").endswith("/turns") and "text/event-stream" in (accept or "")
+
+
+def _sse(event: str, payload: Dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _cors_headers() -> Dict[str, str]:
+    return {
+        "Access-Control-Allow-Origin": ALLOW_ORIGIN,
+        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Max-Age": "86400",
+    }
+
+
+# ============================================
+# 표준 라이브러리 서버
+# ============================================
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "IMDSalesBot/1.0"
+
+    def _send(self, status: int, payload: Optional[Dict]):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        for key, value in _cors_headers().items():
+            self.send_header(key, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str):
+        path = urlsplit(self.path).path
+        if method == "GET" and path == "/metrics":
+            self._send_text(200, render_prometheus(), PROMETHEUS_CONTENT_TYPE)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ApiError(413, "요청 본문이 너무 큽니다.")
+            body = _parse_body(self.rfile.read(length)) if length else {}
+        except ApiError as e:
+            self._send(e.status, {"error": e.message})
+            return
+        if _wants_stream(method, path, self.headers.get("Accept", "")):
+            self._stream(path, body)
+            return
+        status, payload = handle_request(method, path, body)
+        self._send(status, payload)
+
+    def _stream(self, path: str, body: Dict):
+        """
+        SSE 응답: 답변 조각마다 delta, 끝나면 done(턴 결과 + 세션 상태)
+        오류도 상태 코드 대신 error 이벤트로 전달
+        """
+        self.send_response(200)
+        for key, value in _cors_headers().items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        self.close_connection = True
+        closed = False
+
+        def write(data: bytes):
+            nonlocal closed
+            if closed:
+                return
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                # 방문자가 창을 닫아도 턴 처리는 끝까지 진행 (세션 상태 일관성)
+                closed = True
+
+        status, payload = INTERNAL_ERROR
+        try:
+            status, payload = handle_request("POST", path, body, on_delta=lambda text: write(_sse("delta", {"text": text})))
+        except Exception:
+            logger.exception("SSE 턴 처리 실패: %s", path)
+        finally:
+            write(_sse("done" if status == 200 else "error", {"status": status, **payload}))
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_OPTIONS(self):
+        self._send(204, None)
+
+    def log_message(self, format, *args):
+        # 요청마다 찍히는 기본 stderr 접근 로그는 끔
+        return
+
+
+def serve(host: str = "127.0.0.1", port: int = 8600):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    print(f"IMD Sales Bot API: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ============================================
+# ASGI 앱 (uvicorn 등)
+# ============================================
+async def asgi_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    cors = [(k.lower().encode(), v.encode()) for k, v in _cors_headers().items()]
+    method = scope["method"]
+
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": cors})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    if method == "GET" and scope["path"] == "/metrics":
+        data = render_prometheus().encode("utf-8")
+        headers = [(b"content-type", PROMETHEUS_CONTENT_TYPE.encode()), (b"content-length", str(len(data)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": data})
+        return
+
+    chunks = []
+    size = 0
+    more = True
+    while more:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size <= MAX_BODY_BYTES:
+            chunks.append(chunk)
+        more = message.get("more_body", False)
+
+    loop = asyncio.get_running_loop()
+    try:
+        if size > MAX_BODY_BYTES:
+            raise ApiError(413, "요청 본문이 너무 큽니다.")
+        body = _parse_body(b"".join(chunks))
+        accept = dict(scope.get("headers") or []).get(b"accept", b"").decode("latin-1")
+        if _wants_stream(method, scope["path"], accept):
+            await _asgi_stream(scope["path"], body, send, cors)
+            return
+        # LLM 호출이 블로킹이므로 스레드 풀에서 처리
+        status, payload = await loop.run_in_executor(None, handle_request, method, scope["path"], body)
+    except ApiError as e:
+        status, payload = e.status, {"error": e.message}
+
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = cors + [
+        (b"content-type", b"application/json; charset=utf-8"),
+        (b"content-length", str(len(data)).encode()),
+    ]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _asgi_stream(path: str, body: Dict, send, cors):
+    """SSE 응답 (엔진은 스레드 풀에서 돌고, 조각은 큐로 이벤트 루프에 전달)"""
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+    def on_delta(text: str):
+        loop.call_soon_threadsafe(queue.put_nowait, _sse("delta", {"text": text}))
+
+    def run():
+        status, payload = INTERNAL_ERROR
+        try:
+            status, payload = handle_request("POST", path, body, on_delta=on_delta)
+        except Exception:
+            logger.exception("SSE 턴 처리 실패: %s", path)
+        finally:
+            # 마지막 이벤트와 종료 표시는 항상 (빠지면 클라이언트가 끝없이 대기)
+            loop.call_soon_threadsafe(queue.put_nowait, _sse("done" if status == 200 else "error", {"status": status, **payload}))
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    headers = cors + [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    task = loop.run_in_executor(None, run)
+    while True:
+        data = await queue.get()
+        if data is None:
+            break
+        await send({"type": "http.response.body", "body": data, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+    await task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IMD Sales Bot HTTP API")
+    parser.add_argument("--host", default=os.getenv("IMD_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("IMD_API_PORT", "8600")))
+    args = parser.parse_args()
+    serve(args.host, args.port)
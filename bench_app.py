@@ -0,0 +1,235 @@
+"""
+IMD Sales Bot - Streamlit Rerun Benchmark
+클릭 한 번 = app.py 전체 재실행 비용을 페르소나별 퍼널 단계마다 측정
+- streamlit.testing.v1.AppTest로 스크립트된 세션 재생 (첫 로드 → 버튼 → 선택 UI → 자유 입력 → 리드 폼 → 완료 후 재실행)
+- LLM은 stub(지연 0), 시트는 stub, 연출용 time.sleep은 실행하지 않고 합계만 따로 기록
+- 단계별 벽시계 시간(ms)과 tracemalloc 최대 할당량(KB)
+- 결과 저장/비교는 benchmark.py와 같은 JSON 형식 (--save / --compare)
+
+사용 예:
+    python bench_app.py
+    python bench_app.py --personas lift,gs --repeat 5 --save .bench/app.json
+    python bench_app.py --compare .bench/app.json
+"""
+
+import argparse
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(_REPO_DIR, "app.py")
+PERSONAS = ("root", "hanbang", "gs", "nana", "law", "math", "lift")
+MAX_CHIP_CLICKS = 4
+FORM_VALUE = "부하테스트 010-0000-0000"
+
+
+class _SleepRecorder:
+    """time.sleep 대체: 이 저장소 코드의 sleep은 건너뛰고 시간만 합산 (Streamlit 내부 sleep은 그대로)"""
+
+    def __init__(self, real_sleep):
+        self.total = 0.0
+        self._real_sleep = real_sleep
+        self._lock = threading.Lock()
+
+    def __call__(self, seconds):
+        caller = sys._getframe(1).f_code.co_filename
+        if not caller.startswith(_REPO_DIR):
+            self._real_sleep(seconds)
+            return
+        with self._lock:
+            self.total += max(0.0, seconds)
+
+    def take(self) -> float:
+        with self._lock:
+            total, self.total = self.total, 0.0
+        return total
+
+
+def _patch_environment(sleep_recorder: _SleepRecorder):
+    """앱을 불러오기 전에 stub LLM / 메모리 세션 / stub 시트 / sleep 기록기 설정"""
+    os.environ["IMD_LLM_BACKEND"] = "stub"
+    os.environ["IMD_STUB_LATENCY_MS"] = "0"
+    os.environ["IMD_STUB_JITTER_MS"] = "0"
+    os.environ["IMD_SESSION_STORE"] = "memory"
+    os.environ["IMD_LEAD_DB"] = ":memory:"
+    # 이벤트 로그 기록 비용은 포함하되 파일은 임시 디렉터리로
+    os.environ["IMD_EVENT_DIR"] = tempfile.mkdtemp(prefix="imd-events-")
+    os.environ["IMD_FUNNEL_PATH"] = ""  # 퍼널 집계는 메모리에서만
+    # 사용량 계측도 운영 usage.db 대신 임시 파일로 (stub 세션/전환이 리포트에 섞이지 않도록)
+    os.environ["IMD_METER_PATH"] = os.path.join(tempfile.mkdtemp(prefix="imd-meter-"), "usage.db")
+
+    import lead_handler
+    from load_test import StubSheet
+
+    def _init_stub_sheet(self):
+        self.sheet = StubSheet(0)
+
+    lead_handler.LeadHandler._init_sheet = _init_stub_sheet
+    time.sleep = sleep_recorder
+
+
+def _timed_run(at, action, sleep_recorder: _SleepRecorder) -> Dict[str, float]:
+    """action()으로 위젯을 조작한 뒤 재실행 1회 측정"""
+    sleep_recorder.take()
+    tracemalloc.reset_peak()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    action()
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    if at.exception:
+        raise RuntimeError(f"앱 예외: {at.exception[0].value}")
+    return {
+        "ms": wall * 1000,
+        "kb": max(0, peak - start_mem) / 1024,
+        "delay_ms": sleep_recorder.take() * 1000,
+    }
+
+
+def _form_submit_button(at):
+    for button in at.button:
+        if button.proto.is_form_submitter:
+            return button
+    return None
+
+
+def replay_session(client_id: str, sleep_recorder: _SleepRecorder, timeout: float = 30) -> List[tuple]:
+    """
+    페르소나 하나의 스크립트 세션 재생
+
+    Returns:
+        [(단계 라벨, {'ms', 'kb', 'delay_ms'}), ...]
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.query_params["client"] = client_id
+    steps = []
+
+    def record(kind, action):
+        steps.append((f"{len(steps):02d}_{kind}", _timed_run(at, action, sleep_recorder)))
+
+    record("load", at.run)
+
+    for _ in range(MAX_CHIP_CLICKS):
+        options = [b for b in at.button if b.key and b.key.startswith("tongue_")]
+        if options:
+            record("option", options[0].click().run)
+            break
+        chips = [b for b in at.button if b.key and b.key.startswith("quick_")]
+        if not chips:
+            break
+        record("chip", chips[0].click().run)
+
+    submit = _form_submit_button(at)
+    if submit is None and at.chat_input:
+        record("text", at.chat_input[0].set_value("가격이 얼마나 하나요?").run)
+        submit = _form_submit_button(at)
+    if submit is not None:
+        for field in at.text_input:
+            field.input(FORM_VALUE)
+        record("lead", _form_submit_button(at).click().run)
+
+    # 아무 조작 없는 재실행 (대화가 쌓인 상태의 기본 비용)
+    record("rerun", at.run)
+    return steps
+
+
+def run_suite(personas: List[str], repeat: int, timeout: float = 30) -> Dict:
+    sleep_recorder = _SleepRecorder(time.sleep)
+    _patch_environment(sleep_recorder)
+
+    # 단계별 측정값을 반복 횟수만큼 모아서 중앙값
+    samples: Dict[str, Dict[str, Dict[str, List[float]]]] = {}
+    # 모듈 import / 첫 실행 비용이 첫 페르소나에만 섞이지 않도록 한 번 예열
+    tracemalloc.start()
+    replay_session(personas[0], sleep_recorder, timeout)
+    try:
+        for client_id in personas:
+            samples[client_id] = {}
+            for _ in range(repeat):
+                for label, metrics in replay_session(client_id, sleep_recorder, timeout):
+                    slot = samples[client_id].setdefault(label, {"ms": [], "kb": [], "delay_ms": []})
+                    for key, value in metrics.items():
+                        slot[key].append(value)
+    finally:
+        tracemalloc.stop()
+
+    results: Dict[str, Dict[str, float]] = {}
+    delays: Dict[str, Dict[str, float]] = {}
+    for client_id, by_step in samples.items():
+        results[f"{client_id}:ms"] = {label: round(statistics.median(m["ms"]), 2) for label, m in by_step.items()}
+        results[f"{client_id}:kb"] = {label: round(statistics.median(m["kb"]), 1) for label, m in by_step.items()}
+        delays[client_id] = {label: round(statistics.median(m["delay_ms"]), 1) for label, m in by_step.items()}
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "unit": "ms / KB per rerun (median)",
+        },
+        "results": results,
+        "skipped_delay_ms": delays,
+    }
+
+
+def print_results(payload: Dict):
+    print(f"{'persona':<9}{'step':<11}{'ms':>10}{'alloc KB':>11}{'delay ms':>10}")
+    for key, by_step in payload["results"].items():
+        client_id, unit = key.rsplit(":", 1)
+        if unit != "ms":
+            continue
+        allocs = payload["results"][f"{client_id}:kb"]
+        delays = payload["skipped_delay_ms"][client_id]
+        for label, ms in by_step.items():
+            print(f"{client_id:<9}{label:<11}{ms:>10.1f}{allocs[label]:>11.1f}{delays[label]:>10.0f}")
+        total = sum(v for label, v in by_step.items() if not label.endswith("_load"))
+        clicks = sum(1 for label in by_step if not label.endswith("_load"))
+        print(f"{client_id:<9}{'click avg':<11}{total / max(1, clicks):>10.1f}")
+    print("\n(delay ms: 연출용 time.sleep 합계 - 측정 시간에는 포함되지 않음)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from benchmark import DEFAULT_THRESHOLD, compare_results, load_results, print_comparison, save_results
+
+    parser = argparse.ArgumentParser(description="페르소나별 Streamlit 재실행 비용 벤치마크 (AppTest)")
+    parser.add_argument("--personas", default=",".join(PERSONAS), help="쉼표 구분")
+    parser.add_argument("--repeat", type=int, default=3, help="페르소나별 세션 반복 횟수 (중앙값)")
+    parser.add_argument("--timeout", type=float, default=30, help="재실행 1회 제한 시간(초)")
+    parser.add_argument("--save", default="", help="결과를 기준값 JSON으로 저장")
+    parser.add_argument("--compare", default="", help="비교할 기준값 JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="회귀 판정 비율 (0.2 = +20%%)")
+    args = parser.parse_args(argv)
+
+    personas = [p for p in args.personas.split(",") if p]
+    unknown = [p for p in personas if p not in PERSONAS]
+    if unknown:
+        parser.error(f"알 수 없는 페르소나: {', '.join(unknown)}")
+
+    payload = run_suite(personas, args.repeat, args.timeout)
+    print_results(payload)
+    if args.save:
+        save_results(args.save, payload)
+        print(f"\n기준값 저장: {args.save}")
+    if args.compare:
+        print()
+        rows = compare_results(load_results(args.compare), payload, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+IMD Sales Bot - Micro Benchmarks
+매 턴 실행되는 핫 패스를 대화 길이별(10 ~ 10,000 메시지)로 측정
+- 결과를 JSON 기준값으로 저장하고, 기준값과 비교해 회귀(기본 +20% 초과)를 표시
+- 최적화 전후 비교용: 같은 머신에서 --save로 기준값 저장 → 수정 후 --compare
+
+사용 예:
+    python benchmark.py --save .bench/baseline.json
+    python benchmark.py --compare .bench/baseline.json --threshold 0.2
+    python benchmark.py --cases build_prompt,add_message --sizes 10,1000
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_THRESHOLD = 0.2
+
+# 합성 대화에 쓰는 문장 (한글 위주, 실제 상담 길이 수준)
+_USER_LINES = [
+    "요즘 눈가 주름이 너무 신경 쓰여요",
+    "가격이 얼마나 하나요? 효과는 진짜 있나요?",
+    "예전에 울쎄라 받아봤는데 별로였어요",
+    "상담 받아보고 싶은데 주말에도 되나요",
+]
+_AI_LINES = [
+    "말씀하신 부분은 40대에 가장 많이 고민하시는 부위예요. 피부 탄력이 떨어지면서 생기는 변화라서 조기에 관리하시면 훨씬 좋아요.",
+    "비용은 부위와 샷 수에 따라 달라지는데, 1:1 분석 후 정확히 안내드릴게요. <b>부담 없이</b> 물어보셔도 됩니다.",
+    "이전 시술 경험을 알려주셔서 감사합니다.\n같은 장비라도 세팅에 따라 결과가 크게 달라져요.",
+]
+
+
+def make_history(n: int) -> List[Dict]:
+    """user/ai가 번갈아 나오는 합성 대화 n개"""
+    history = []
+    for i in range(n):
+        if i % 2 == 0:
+            history.append({"role": "ai", "text": _AI_LINES[i % len(_AI_LINES)], "metadata": {}})
+        else:
+            history.append({"role": "user", "text": _USER_LINES[i % len(_USER_LINES)], "metadata": {"type": "text"}})
+    return history
+
+
+# ============================================
+# 측정 대상 (대화 길이 n → 한 번 호출할 함수)
+# ============================================
+def _case_build_prompt(n: int) -> Callable[[], object]:
+    from prompt_engine import _build_prompt
+    history = make_history(n)
+    context = {"stage": "symptom_explore", "client_id": "lift", "history_summary": ""}
+    return lambda: _build_prompt(context, history, "가격이 궁금해요")
+
+
+def _case_parse_response_tags(n: int) -> Callable[[], object]:
+    from prompt_engine import parse_response_tags
+    reply = _AI_LINES[0] + "\n\n" + _AI_LINES[1] + " [[STAGE:tongue_select]] [[ROUTE:lift]]"
+    return lambda: parse_response_tags(reply, "symptom_explore")
+
+
+def _manager_with_history(n: int):
+    from conversation_manager import ConversationManager
+    manager = ConversationManager(state={})
+    manager.state["chat_history"] = make_history(n)
+    return manager
+
+
+def _case_add_message(n: int) -> Callable[[], object]:
+    manager = _manager_with_history(n)
+    history = manager.state["chat_history"]
+
+    def run():
+        manager.add_message("user", "가격이 얼마나 하나요? 효과는 진짜 있나요?", metadata={"type": "text"})
+        history.pop()  # 길이 n 유지
+    return run
+
+
+def _case_extract_context(n: int) -> Callable[[], object]:
+    manager = _manager_with_history(n)
+    return lambda: manager._extract_context("요즘 너무 고민이라서요. 가격이 얼마나 하나요? 빨리 받고 싶어요", {"type": "text"})
+
+
+def _case_build_row(n: int) -> Callable[[], object]:
+    from lead_handler import LeadHandler
+    handler = LeadHandler.__new__(LeadHandler)  # 시트 연결 없이 컬럼만
+    handler.client, handler.sheet = None, None
+    from lead_handler import DEFAULT_SHEET_COLUMNS
+    handler.columns = DEFAULT_SHEET_COLUMNS.copy()
+    data = {
+        "name": "홍길동",
+        "contact": "010-1234-5678",
+        "symptom": "연령대: 40대 / 고민: 눈가 주름 / 시술경험: 처음",
+        "preferred_date": "즉시 상담 희망",
+        "chat_summary": _manager_with_history(n).get_summary(),
+        "source": "lift",
+        "type": "피부과 리프팅",
+    }
+    return lambda: handler._build_row(data)
+
+
+def _case_transcript_html(n: int) -> Callable[[], object]:
+    from conversation_engine import transcript_html
+    history = make_history(n)
+    return lambda: transcript_html(history)
+
+
+def _case_lift_recommendation(n: int) -> Callable[[], object]:
+    from rule_engine import get_lift_recommendation
+    combos = [
+        ("40대", "눈가 주름", "처음이에요"),
+        ("30대", "턱선 / 이중턱", "울쎄라/슈링크 받아봤어요"),
+        ("50대 이상", "볼 처짐 심해요 ㅠ", "기타"),  # 자유 입력 (메모 경로)
+    ]
+    state = {"i": 0}
+
+    def run():
+        state["i"] += 1
+        return get_lift_recommendation(*combos[state["i"] % len(combos)])
+    return run
+
+
+CASES: Dict[str, Callable[[int], Callable[[], object]]] = {
+    "build_prompt": _case_build_prompt,
+    "parse_response_tags": _case_parse_response_tags,
+    "add_message": _case_add_message,
+    "extract_context": _case_extract_context,
+    "build_row": _case_build_row,
+    "transcript_html": _case_transcript_html,
+    "lift_recommendation": _case_lift_recommendation,
+}
+
+
+# ============================================
+# 측정 / 저장 / 비교
+# ============================================
+def measure(fn: Callable[[], object], min_time: float = 0.05, repeat: int = 5) -> float:
+    """한 번 호출 시간(µs). 반복 횟수를 min_time 이상이 되도록 늘린 뒤 repeat번 중 최솟값"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1e6
+
+
+def run_suite(cases: List[str], sizes: List[int], min_time: float = 0.05, repeat: int = 5) -> Dict:
+    results: Dict[str, Dict[str, float]] = {}
+    for name in cases:
+        results[name] = {}
+        for n in sizes:
+            results[name][str(n)] = round(measure(CASES[name](n), min_time, repeat), 3)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "unit": "us/call",
+        },
+        "results": results,
+    }
+
+
+def save_results(path: str, payload: Dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    기준값 대비 비교 (양쪽에 모두 있는 항목만)
+
+    Returns:
+        [{'case', 'size', 'before', 'after', 'ratio', 'regression'}]
+    """
+    rows = []
+    for name, by_size in current["results"].items():
+        base = baseline.get("results", {}).get(name, {})
+        for size, after in by_size.items():
+            before = base.get(size)
+            if before is None:
+                continue
+            ratio = after / before if before else float("inf")
+            rows.append({
+                "case": name,
+                "size": size,
+                "before": before,
+                "after": after,
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            })
+    return rows
+
+
+def print_results(payload: Dict):
+    sizes = sorted({int(s) for by_size in payload["results"].values() for s in by_size})
+    print(f"{'case':<22}" + "".join(f"{n:>12}" for n in sizes) + "  (µs/call)")
+    for name, by_size in payload["results"].items():
+        print(f"{name:<22}" + "".join(f"{by_size.get(str(n), float('nan')):>12.2f}" for n in sizes))
+
+
+def print_comparison(rows: List[Dict], threshold: float):
+    print(f"{'case':<22}{'size':>7}{'before':>12}{'after':>12}{'change':>9}")
+    for row in rows:
+        mark = "  ▲ 회귀" if row["regression"] else ""
+        print(f"{row['case']:<22}{row['size']:>7}{row['before']:>12.2f}{row['after']:>12.2f}{row['ratio'] - 1:>+9.1%}{mark}")
+    regressions = sum(1 for row in rows if row["regression"])
+    print(f"\n회귀 {regressions}건 (기준 +{threshold:.0%} 초과)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="턴 처리 핫 패스 마이크로 벤치마크")
+    parser.add_argument("--cases", default="", help=f"쉼표 구분 (기본: 전체) - {', '.join(CASES)}")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="대화 길이 (메시지 수)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="측정 1회당 최소 시간(초)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", default="", help="결과를 기준값 JSON으로 저장")
+    parser.add_argument("--compare", default="", help="비교할 기준값 JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="회귀 판정 비율 (0.2 = +20%%)")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in args.cases.split(",") if c] or list(CASES)
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"알 수 없는 case: {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    # 케이스 모듈을 불러오기 전에: add_message의 이벤트 기록 비용은 포함하되 파일은 임시 디렉터리로
+    os.environ["IMD_EVENT_DIR"] = tempfile.mkdtemp(prefix="imd-events-")
+    os.environ["IMD_METER_PATH"] = os.path.join(tempfile.mkdtemp(prefix="imd-meter-"), "usage.db")
+
+    payload = run_suite(cases, sizes, args.min_time, args.repeat)
+    print_results(payload)
+    if args.save:
+        save_results(args.save, payload)
+        print(f"\n기준값 저장: {args.save}")
+    if args.compare:
+        print()
+        rows = compare_results(load_results(args.compare), payload, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
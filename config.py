@@ -50,6 +50,9 @@ DATA = {
             "math": {"label": "📐 수학학원", "desc": "AI 입시 진단"},
             "lift": {"label": "💎 피부과", "desc": "AI 리프팅 진단"},
         },
+        "QUICK_REPLIES": {
+            "initial": ["IMD는 뭐하는 회사야?", "진짜 매출이 올라?", "저는 병원 원장입니다"],
+        },
     },
 
     # ==========================================
@@ -145,6 +148,72 @@ DATA = {
                 ),
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "symptom",
+                "next": "sleep_check",
+                "options": {
+                    "요즘 만성 피로가 심해요": """많이 지치셨겠습니다. 자고 일어나도 피곤이 풀리지 않는다면 단순 과로가 아니라, 몸의 에너지 생산 자체가 떨어졌다는 신호일 수 있습니다.
+
+혹시 수면은 어떠세요?""",
+                    "허리랑 다리가 저려요": """저림은 단순한 근육 문제가 아니라 혈액순환이 막혔다는 경고일 수 있습니다. 방치하면 감각 저하까지 이어지는 경우가 적지 않습니다.
+
+혹시 수면은 어떠세요?""",
+                    "소화가 잘 안 돼요": """소화 불량이 반복되면 몸 전체의 기운이 떨어지기 시작합니다. 위장이 약해지면 다른 장기까지 부담을 떠안게 됩니다.
+
+혹시 수면은 어떠세요?""",
+                },
+            },
+            "sleep_check": {
+                "slot": "sleep",
+                "next": "digestion_check",
+                "options": {
+                    "잠을 잘 못 자요": """수면이 무너지면 몸이 회복할 시간 자체가 사라집니다. 지금 증상이 쉽게 낫지 않는 이유가 여기에 있을 수 있습니다.
+
+소화는요?""",
+                    "자도 개운하지 않아요": """잠을 자도 개운하지 않다는 건, 몸이 밤새 회복하지 못하고 있다는 뜻입니다. 수면의 질이 떨어진 상태가 길어지면 증상이 만성화됩니다.
+
+소화는요?""",
+                    "잠은 잘 자요": """오히려 그게 더 위험합니다. 몸은 멀쩡한데 한 곳만 망가져 있다는 건, 댐이 막히기 직전이라는 뜻입니다.
+
+소화는요?""",
+                },
+            },
+            "digestion_check": {
+                "slot": "digestion",
+                "next": "tongue_select",
+                "options": {
+                    "더부룩하고 가스가 차요": """비위의 기운이 약해져 음식물이 제대로 내려가지 못하고 정체된 상태로 보입니다. 이런 몸 상태는 혀에 그대로 드러납니다.
+
+마지막으로, 거울을 보시고 본인의 혀와 가장 비슷한 사진을 선택해주세요.""",
+                    "속이 자주 쓰려요": """위장에 열이 쌓였다는 신호일 수 있습니다. 이 열이 오래 머물면 입 냄새, 두통, 피부 트러블까지 이어집니다.
+
+마지막으로, 거울을 보시고 본인의 혀와 가장 비슷한 사진을 선택해주세요.""",
+                    "소화는 잘 돼요": """소화가 괜찮으시다면 원인은 다른 곳에 숨어 있을 가능성이 큽니다. 이럴 때 가장 정확한 단서가 바로 혀입니다.
+
+마지막으로, 거울을 보시고 본인의 혀와 가장 비슷한 사진을 선택해주세요.""",
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "🧬 AI 한의학 데이터 정밀 분석 중...",
+            "steps": [
+                "📡 환자 증상 데이터 수신 및 키워드 추출...",
+                "🔍 전국 유사 체질 사례 8,000건 대조 중...",
+                "📊 원장님 진료 철학 기반 맞춤 처방 산출 중...",
+            ],
+            "done": "✅ 분석 완료! 맞춤형 진단서가 생성되었습니다.",
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 🏥 [AI 한의학 정밀 진단서]"},
+                {"type": "metrics", "items": [
+                    ["체질 적합도", "87점", "양호"],
+                    ["예상 치료 기간", "8주", "±2주"],
+                    ["호전 확률", "91%", "매우 높음"],
+                ]},
+                {"type": "warning", "text": "⚠️ **주의:** 현재 **기혈 순환 저하** 징후가 감지되었습니다. 2주 내 초진 미진행 시 만성화 위험이 있습니다."},
+            ],
+        },
     },
 
     # ==========================================
@@ -239,6 +308,57 @@ DATA = {
                 ),
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "symptom",
+                "next": "symptom_explore",
+                "options": {
+                    "안경 없으면 잘 안 보여요": """일상이 많이 불편하시겠습니다. 다만 시력이 떨어진 원인이 단순 근시인지, 난시나 각막 문제가 함께 있는지에 따라 수술 방법이 완전히 달라집니다.
+
+혹시 야간에 빛이 번져 보이시나요?""",
+                    "렌즈 끼면 눈이 충혈돼요": """렌즈를 오래 끼시면 각막이 산소 부족으로 얇아지고 예민해질 수 있습니다. 각막 상태에 따라 가능한 수술이 제한되기도 합니다.
+
+혹시 야간에 빛이 번져 보이시나요?""",
+                    "라식 얼마예요?": """가격은 수술 방법에 따라 크게 달라집니다. 그런데 각막 두께와 동공 크기를 모른 채 가격부터 비교하시면 오히려 위험할 수 있습니다.
+
+혹시 야간에 빛이 번져 보이시나요?""",
+                },
+            },
+            "symptom_explore": {
+                "slot": "night_vision",
+                "next": "tongue_select",
+                "options": {
+                    "밤에 빛이 번져 보여요": """동공이 크거나 각막이 불규칙하면 빛 번짐이 생깁니다. 이 상태에서 일반 수술을 받으면 야간 운전이 더 위험해질 수 있습니다.
+
+정확한 확인을 위해 스마트폰을 멀리 두고, 아래 글씨가 어떻게 보이는지 선택해주세요.""",
+                    "글씨가 겹쳐 보여요": """단순 근시가 아니라 난시가 동반된 것으로 보입니다. 난시는 일반 라식으로 교정하기 어려운 경우가 많습니다.
+
+정확한 확인을 위해 스마트폰을 멀리 두고, 아래 글씨가 어떻게 보이는지 선택해주세요.""",
+                    "특별히 불편한 건 없어요": """불편함이 없어도 각막이 얇은 경우가 적지 않습니다. 수술 전에는 반드시 눈 상태부터 확인해야 합니다.
+
+정확한 확인을 위해 스마트폰을 멀리 두고, 아래 글씨가 어떻게 보이는지 선택해주세요.""",
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "👁️ AI 안과 데이터 정밀 분석 중...",
+            "steps": [
+                "📡 환자 시력 데이터 수신 및 패턴 분석...",
+                "🔍 강남구 유사 수술 사례 15,000건 대조 중...",
+                "📊 최적 수술법 및 예상 결과 산출 중...",
+            ],
+            "done": "✅ 분석 완료! 맞춤형 검안 리포트가 생성되었습니다.",
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 👁️ [AI 정밀 검안 리포트]"},
+                {"type": "metrics", "items": [
+                    ["수술 적합도", "94점", "매우 높음"],
+                    ["예상 교정 시력", "1.2", "+1.0"],
+                    ["부작용 위험도", "3%", "매우 낮음"],
+                ]},
+                {"type": "error", "text": "⚠️ **긴급:** 현재 **각막 두께**가 평균 이하입니다. 일반 라식 불가, 스마일라식 프로 권장됩니다."},
+            ],
+        },
     },
 
     # ==========================================
@@ -330,6 +450,57 @@ AI가 환자의 '워너비 스타일'을 파악하고 내원까지 시키는 과
                 ),
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "concern",
+                "next": "symptom_explore",
+                "options": {
+                    "눈이 고민이에요": """눈은 얼굴 인상의 절반을 결정하는 부위입니다. 같은 쌍꺼풀이라도 라인과 높이에 따라 분위기가 완전히 달라집니다.
+
+어떤 스타일을 원하세요? 자연스러움? 화려함?""",
+                    "코가 고민이에요": """코는 옆모습과 얼굴 전체의 균형을 좌우합니다. 높이보다 얼굴형과의 조화가 훨씬 중요한 부위입니다.
+
+어떤 스타일을 원하세요? 자연스러움? 화려함?""",
+                    "얼굴 윤곽이 고민이에요": """윤곽은 뼈와 연부조직을 함께 봐야 하는 부위입니다. 첫 수술 설계가 결과의 대부분을 결정합니다.
+
+어떤 스타일을 원하세요? 자연스러움? 화려함?""",
+                },
+            },
+            "symptom_explore": {
+                "slot": "style",
+                "next": "tongue_select",
+                "options": {
+                    "자연스러운 스타일이요": """자연스러운 라인을 원하시는군요. 티 나지 않게 분위기만 바꾸는 설계가 가장 어렵고, 그래서 첫 수술이 중요합니다.
+
+원장님께 보여드리고 싶은 '워너비 스타일'을 골라주세요.""",
+                    "화려한 스타일이요": """또렷하고 화려한 인상을 원하시는군요. 다만 얼굴형과 맞지 않으면 과해 보일 수 있어 비율 분석이 먼저입니다.
+
+원장님께 보여드리고 싶은 '워너비 스타일'을 골라주세요.""",
+                    "재수술이에요": """재수술은 첫 수술보다 훨씬 정교한 설계가 필요합니다. 기존 조직 상태를 정확히 파악하는 것이 우선입니다.
+
+원장님께 보여드리고 싶은 '워너비 스타일'을 골라주세요.""",
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "✨ AI 뷰티 데이터 정밀 분석 중...",
+            "steps": [
+                "📡 환자 얼굴형 데이터 수신 및 황금비율 분석...",
+                "🔍 강남구 유사 성형 사례 12,000건 대조 중...",
+                "📊 원장님 수술 철학 기반 견적 산출 중...",
+            ],
+            "done": "✅ 분석 완료! 맞춤형 제안서가 생성되었습니다.",
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### ✨ [AI 뷰티 컨설팅 리포트]"},
+                {"type": "metrics", "items": [
+                    ["스타일 매칭도", "96점", "완벽"],
+                    ["자연스러움 지수", "92점", "매우 높음"],
+                    ["회복 예상 기간", "2주", "빠름"],
+                ]},
+                {"type": "success", "text": "✅ **Good News:** 고객님의 얼굴형은 **자연유착**과 **비개방 코성형**에 최적화되어 있습니다."},
+            ],
+        },
     },
 
     # ==========================================
@@ -423,6 +594,57 @@ AI가 환자의 '워너비 스타일'을 파악하고 내원까지 시키는 과
                 ),
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "case",
+                "next": "symptom_explore",
+                "options": {
+                    "남편이 외도를 했어요": """많이 힘드셨겠습니다. 외도 사건은 증거를 어떻게 확보하느냐에 따라 위자료와 재산분할 결과가 크게 달라집니다.
+
+혹시 지금 확보하신 증거가 있으신가요?""",
+                    "이혼할 때 재산분할이 걱정돼요": """재산분할은 상대방이 재산을 처분하기 전에 움직이는 것이 핵심입니다. 시기를 놓치면 회수가 어려워질 수 있습니다.
+
+혹시 상대방 재산에 대해 확보하신 자료가 있으신가요?""",
+                    "배우자에게 폭행을 당했어요": """먼저, 현재 안전한 곳에 계십니까? 배우자의 폭행은 이혼 사유이자 형사 처벌 대상이므로 가사와 형사를 함께 봐야 합니다.
+
+혹시 진단서나 사진 같은 증거가 있으신가요?""",
+                },
+            },
+            "symptom_explore": {
+                "slot": "evidence",
+                "next": "tongue_select",
+                "options": {
+                    "증거는 있어요": """다행입니다. 다만 확보하신 증거가 법적으로 효력이 있는지, 추가로 무엇이 필요한지 정리하는 것이 다음 단계입니다.
+
+현재 상황과 가장 가까운 것을 선택해주세요.""",
+                    "증거가 없어요": """아직 늦지 않았습니다. 합법적으로 증거를 확보하는 순서가 있고, 그 순서를 지키는 것이 중요합니다.
+
+현재 상황과 가장 가까운 것을 선택해주세요.""",
+                    "어떻게 모아야 할지 모르겠어요": """불법적으로 수집한 증거는 오히려 불리하게 작용할 수 있습니다. 사건 유형에 맞는 합법적인 수집 방법부터 확인해야 합니다.
+
+현재 상황과 가장 가까운 것을 선택해주세요.""",
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "⚖️ AI 법률 데이터 정밀 분석 중...",
+            "steps": [
+                "📡 의뢰인 사건 데이터 수신 및 쟁점 추출...",
+                "🔍 유사 판례 50,000건 대조 중...",
+                "📊 승소 확률 및 예상 결과 산출 중...",
+            ],
+            "done": "✅ 분석 완료! 맞춤형 법률 진단서가 생성되었습니다.",
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### ⚖️ [AI 법률 정밀 진단서]"},
+                {"type": "metrics", "items": [
+                    ["승소 유력 지수", "92점", "매우 높음"],
+                    ["예상 위자료", "3,500만 원", "±500"],
+                    ["증거 확보율", "85%", "양호"],
+                ]},
+                {"type": "error", "text": "⚠️ **긴급 경고:** 상대방의 **재산 은닉** 징후가 포착되었습니다. 12시간 내 가압류 미진행 시 회수 불능 위험이 있습니다."},
+            ],
+        },
     },
 
     # ==========================================
@@ -518,6 +740,61 @@ AI가 환자의 '워너비 스타일'을 파악하고 내원까지 시키는 과
                 ),
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "grade",
+                "next": "symptom_explore",
+                "options": {
+                    "중2, 수학 4등급이에요": """확인했습니다. 혹시 '선생님 설명 들을 땐 알겠는데, 혼자 풀려면 막히는' 증상 없나요?""",
+                    "고1, 1~2등급 목표예요": """확인했습니다. 혹시 '쉬운 문제는 다 맞는데, 킬러 문항만 나오면 시간 날리는' 패턴 아닌가요?""",
+                    "고2, 5등급 이하예요": """확인했습니다. 혹시 학원은 다니는데, 숙제만 겨우 하고 복습은 안 하는 상황 아닌가요?""",
+                },
+            },
+            "symptom_explore": {
+                "slot": "symptom_match",
+                "next": "tongue_select",
+                "options": {
+                    "맞아요!": """역시 그렇군요. 스스로 생각하는 훈련이 안 된 상태에서 나타나는 전형적인 패턴입니다. 이대로 학년이 올라가면 격차는 더 벌어집니다.
+
+정확한 진단을 위해 자녀의 현재 수학 상황을 선택해주세요.""",
+                    "조금 달라요": {
+                        "reply": """그렇다면 자녀분이 문제를 풀 때 어디서 가장 막히는지 한 줄로 말씀해주세요.""",
+                        "next": "symptom_explore",
+                    },
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "📐 AI 입시 데이터 정밀 분석 중...",
+            "steps": [
+                "📡 학생 성적 패턴 수신 및 취약점 추출...",
+                "🔍 대치동/목동 유사 성적 향상 사례 8,000건 대조 중...",
+                "📊 '역산 학습법' 적용 시 예상 등급 시뮬레이션...",
+            ],
+            "done": "✅ 분석 완료! 맞춤형 진단 리포트가 생성되었습니다.",
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 📐 [AI 입시 정밀 진단서]"},
+                {"type": "metrics", "items": [
+                    ["현재 학습 효율", "38%", "위험"],
+                    ["수포자 확률", "93%", "매우 높음"],
+                    ["골든타임", "D-90", "이번 방학"],
+                ]},
+                {"type": "error", "text": "⚠️ **긴급 경고:** 현재 **'관람객 공부법'** 패턴이 감지되었습니다. 즉시 교정하지 않으면 고3에서 회복 불가능합니다."},
+                # 솔루션 블러 처리 (인질극)
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 📂 [유사 사례: 4등급 → 1등급 달성]"},
+                {"type": "info", "text": """
+**목동고 김OO 학생** (고2, 수학 4등급 → 1등급)
+
+✅ 3개월 만에 **전교 15등** 달성
+✅ 비결: **'??? 학습법'** 적용
+
+🔒 **상세 로드맵은 [맞춤형 리포트]에서만 공개됩니다.**
+        """},
+                {"type": "warning", "text": "💡 이 학생이 사용한 **'역산 학습법'**과 **주차별 커리큘럼**을 받아보시겠습니까?"},
+            ],
+        },
     },
 
     # ==========================================
@@ -587,6 +864,161 @@ AI가 환자의 '워너비 스타일'을 파악하고 내원까지 시키는 과
                 "buttons": ["없음", "1년 이내", "3년 이내"],
             },
         },
+        "FUNNEL_SCRIPT": {
+            "initial": {
+                "slot": "age_group",
+                "next": "concern_check",
+                "options": {
+                    "20대": """확인되었습니다. 20대는 '초기 예방의 골든타임'입니다. 지금 진피층 콜라겐을 관리하면, 30대 이후 남들보다 확실히 어려 보일 수 있습니다.
+
+거울을 보실 때 가장 신경 쓰이는 부위는 어디인가요?""",
+                    "30대": """확인되었습니다. 30대는 '노화 예방의 골든타임'입니다. 지금 진피층을 잡아두면, 40대 이후 남들보다 5년은 더 어려 보일 수 있습니다.
+
+거울을 보실 때 가장 신경 쓰이는 부위는 어디인가요?""",
+                    "40대": """확인되었습니다. 40대는 '비수술 리프팅의 마지막 적기'입니다. 이 시기를 놓치면 실 리프팅이나 수술적 방법을 고려해야 할 수 있습니다.
+
+거울을 보실 때 가장 신경 쓰이는 부위는 어디인가요?""",
+                    "50대 이상": """확인되었습니다. 50대 이상은 '복합 시술'이 효과적인 시기입니다. 단일 시술보다 맞춤 조합이 훨씬 자연스러운 결과를 만듭니다.
+
+거울을 보실 때 가장 신경 쓰이는 부위는 어디인가요?""",
+                },
+            },
+            "concern_check": {
+                "slot": "concern",
+                "next": "history_check",
+                "options": {
+                    "무너진 턱라인(이중턱)": """턱라인을 선택하셨군요. 이 부위는 단순한 지방이 아니라 '하안부 연조직 하수'가 원인입니다. 다이어트로는 절대 해결되지 않는 까다로운 부위입니다.
+
+마지막 질문입니다. 과거 리프팅 시술 경험이 있으신가요?""",
+                    "깊어지는 팔자주름": """팔자주름을 선택하셨군요. 이 부위는 단순한 주름이 아니라 '유지인대(Ligament)의 약화'가 원인입니다. 겉만 당겨서는 해결되지 않는 까다로운 부위입니다.
+
+마지막 질문입니다. 과거 리프팅 시술 경험이 있으신가요?""",
+                    "볼패임/땅콩형 얼굴": """볼패임을 선택하셨군요. 이 부위는 '심부볼 지방층의 위축'과 '피부 탄력 저하'가 복합된 증상입니다. 단순 필러로는 부자연스러워지는 부위입니다.
+
+마지막 질문입니다. 과거 리프팅 시술 경험이 있으신가요?""",
+                    "전반적인 탄력 저하": """전반적인 탄력 저하를 선택하셨군요. 이 경우 '진피층 콜라겐 밀도'가 전체적으로 떨어진 상태입니다. 부분 시술보다 풀페이스 접근이 효과적입니다.
+
+마지막 질문입니다. 과거 리프팅 시술 경험이 있으신가요?""",
+                },
+            },
+            "history_check": {
+                "slot": "treatment_history",
+                "next": "conversion",
+                "options": {
+                    "없음(처음)": """첫 시술이시군요. 처음이라 더 신중하게 선택하셔야 합니다. 잘못된 첫 시술은 오히려 역효과를 낼 수 있습니다.
+
+고객님의 피부 타입 분석이 완료되었습니다. 맞춤 정밀 리포트에서 추천 시술 조합과 예상 견적을 확인하실 수 있습니다.""",
+                    "1년 이내": """최근에 시술 받으셨군요. '유지 시술 타이밍'이 중요합니다. 효과가 완전히 사라지기 전에 리터치해야 비용이 절감됩니다.
+
+고객님의 피부 타입 분석이 완료되었습니다. 맞춤 정밀 리포트에서 추천 시술 조합과 예상 견적을 확인하실 수 있습니다.""",
+                    "3년 이내": """3년 이내 경험이 있으시군요. 기존 시술의 효과가 떨어지고, '재건(Retouch)이 가장 시급한 시점'입니다.
+
+고객님의 피부 타입 분석이 완료되었습니다. 맞춤 정밀 리포트에서 추천 시술 조합과 예상 견적을 확인하실 수 있습니다.""",
+                    "3년 이상": """3년 이상 되셨군요. 이전 시술 효과는 거의 소멸된 상태입니다. 처음 시술하시는 분과 동일하게 접근해야 합니다.
+
+고객님의 피부 타입 분석이 완료되었습니다. 맞춤 정밀 리포트에서 추천 시술 조합과 예상 견적을 확인하실 수 있습니다.""",
+                },
+            },
+        },
+        "ANALYSIS_CARD": {
+            "status": "🔄 강남 40,000건의 데이터와 대조 중입니다...",
+            "steps": [
+                "📡 고객님의 피부 데이터 수신 중...",
+                "🔍 연령대별 유사 사례 매칭 중...",
+                "📊 최적 시술 조합 산출 중...",
+            ],
+            "done": "✅ 분석 완료! 고객님만을 위한 리프팅 설계도가 나왔습니다.",
+            # {중괄호} 값은 RECOMMENDATION_RULES 조회 결과로 채움
+            "blocks": [
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 💎 [AI 리프팅 정밀 진단서]"},
+                {"type": "metrics", "items": [
+                    ["피부 탄력 나이", "{skin_age}", "실제 나이보다 높음 ⚠️"],
+                    ["탄력 위험도", "47점", "주의 단계"],
+                    ["비수술 골든타임", "D-180일", "6개월"],
+                ]},
+                # 추천 시술 표시
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 🎯 [AI 추천 시술]"},
+                {"type": "success", "text": "**{treatment}**"},
+                {"type": "info", "text": "**[분석 코멘트]** {description}"},
+                {"type": "warning", "text": "**[긴급도]** {urgency}"},
+                {"type": "caption", "text": "💡 {history_msg}"},
+                # 유사 성공 사례 (나이 매칭)
+                {"type": "divider"},
+                {"type": "markdown", "text": "### 📂 [유사 성공 사례 매칭]"},
+                {"type": "info", "text": """
+**강남 {case_name} 고객 ({case_age}, {concern_short} 고민)**
+
+✅ 고객님과 **98% 유사**한 피부 두께 및 처짐 패턴
+✅ 시술 3주 후 눈에 띄는 개선 확인
+✅ 적용 시술: **{treatment}**
+
+🔒 **상세 시술 구성과 예상 견적은 리포트에서 확인하세요.**
+        """},
+            ],
+        },
+        # AI 진단 로직: 차원별 규칙 (위에서부터 첫 번째로 키워드가 포함된 규칙 적용, match가 비면 기본값)
+        "RECOMMENDATION_RULES": {
+            "dimensions": ["concern", "age_group", "treatment_history"],
+            # 로직 1: 고민 부위에 따른 시술 추천 (가장 중요)
+            "concern": [
+                {
+                    "match": ["턱", "이중턱"],
+                    "treatment": "윤곽 조각 리프팅 (지방분해 + 탄력 고정)",
+                    "description": "지방층이 두꺼운 부위입니다. 불필요한 지방은 줄이고 근막(SMAS)층을 당겨주는 고주파 복합 시술이 필요합니다.",
+                    "concern_short": "턱라인",
+                },
+                {
+                    "match": ["팔자"],
+                    "treatment": "심부볼 리프팅 & 볼륨 채움",
+                    "description": "단순히 당기는 것만으로는 부족합니다. 꺼진 부위는 채우고, 처진 유지인대를 강화하는 시술이 병행되어야 합니다.",
+                    "concern_short": "팔자주름",
+                },
+                {
+                    "match": ["볼패임", "땅콩"],
+                    "treatment": "타이트닝 & 볼륨 리프팅",
+                    "description": "가장 주의가 필요한 타입입니다. 강한 시술은 오히려 더 늙어 보일 수 있습니다. 피부 밀도를 높이는 고주파 계열이 안전합니다.",
+                    "concern_short": "볼패임",
+                },
+                {
+                    "match": [],  # 전반적 탄력 저하
+                    "treatment": "올인원 풀페이스 타이트닝",
+                    "description": "피부 전층(표피-진피-근막)을 동시에 자극하여 콜라겐 생성을 극대화하는 레이저 리프팅이 적합합니다.",
+                    "concern_short": "탄력 저하",
+                },
+            ],
+            # 로직 2: 연령대에 따른 긴급도 멘트 + 피부 나이/사례 나이 (고객 연령대 + 3~6살)
+            "age_group": [
+                {
+                    "match": ["20대"],
+                    "urgency": "아직 노화가 본격화되기 전입니다. 지금 관리하면 10년 후가 달라집니다.",
+                    "skin_age": "26세", "case_age": "28세", "case_name": "이OO",
+                },
+                {
+                    "match": ["30대"],
+                    "urgency": "아직 깊은 주름이 자리 잡기 전입니다. 지금 관리하면 '가성비'가 가장 좋습니다.",
+                    "skin_age": "34세", "case_age": "36세", "case_name": "박OO",
+                },
+                {
+                    "match": ["40대"],
+                    "urgency": "피부 회복력이 떨어지기 시작하는 시기입니다. 1년 늦어질수록 비용이 증가합니다.",
+                    "skin_age": "45세", "case_age": "47세", "case_name": "김OO",
+                },
+                {
+                    "match": [],  # 50대 이상
+                    "urgency": "피부 회복력이 급격히 떨어지는 시기입니다. 지금이 비수술로 해결할 수 있는 마지막 기회일 수 있습니다.",
+                    "skin_age": "54세", "case_age": "56세", "case_name": "최OO",
+                },
+            ],
+            # 로직 3: 시술 경험에 따른 추가 멘트
+            "treatment_history": [
+                {"match": ["없음", "처음"], "history_msg": "첫 시술이시므로 부작용 위험이 낮은 조합부터 시작하는 것이 좋습니다."},
+                {"match": ["1년"], "history_msg": "유지 시술 타이밍입니다. 기존 효과가 남아있을 때 추가하면 시너지가 납니다."},
+                {"match": ["3년 이내"], "history_msg": "기존 시술 효과가 거의 소멸된 시점입니다. 리터치 시술이 시급합니다."},
+                {"match": [], "history_msg": "처음 시술하시는 분과 동일하게 기초부터 다시 시작해야 합니다."},  # 3년 이상
+            ],
+        },
     },
 }
 
@@ -610,3 +1042,15 @@ def get_client_id_from_query():
 def get_config(client_id):
     """주어진 client_id에 맞는 설정 반환"""
     return DATA.get(client_id, DATA["root"])
+
+
+def get_quick_replies(client_id, stage):
+    """
+    페르소나 + 대화 단계별 기본 추천 버튼 (모델 제안이 없을 때 폴백)
+    스크립트 단계(FUNNEL_SCRIPT)는 스크립트 선택지가 곧 버튼
+    """
+    cfg = get_config(client_id)
+    script_state = cfg.get("FUNNEL_SCRIPT", {}).get(stage)
+    if script_state:
+        return list(script_state["options"])
+    return list(cfg.get("QUICK_REPLIES", {}).get(stage, []))
@@ -0,0 +1,190 @@
+"""
+IMD Sales Bot - Context Window
+토큰 예산 기반 대화 히스토리 조립 + 롤링 요약
+- 최근 턴은 예산 안에서 원문 그대로 전달
+- 예산 밖으로 밀려난 오래된 턴은 백그라운드에서 요약으로 접어 넣음 (요약에 반영되기 전까지는 원문 유지)
+- 요약은 세션별로 캐시 (매 턴 재계산하지 않음)
+"""
+
+import contextvars
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, MutableMapping, Optional, Tuple
+
+
+# ============================================
+# 설정
+# ============================================
+# 프롬프트에 원문으로 싣는 최근 대화의 토큰 예산
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+# 요약에 접어 넣을 메시지가 이 개수 이상 쌓였을 때만 요약 갱신 (LLM 호출 절약)
+SUMMARY_MIN_BATCH = int(os.getenv("SUMMARY_MIN_BATCH", "4"))
+# 요약 자체의 최대 길이 (글자)
+SUMMARY_MAX_CHARS = 600
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="imd-summary")
+
+
+# ============================================
+# 토큰 추정
+# ============================================
+def estimate_tokens(text: str) -> int:
+    """
+    토크나이저 없이 쓰는 근사 토큰 수
+    - 한글/비ASCII: 글자당 약 1토큰
+    - ASCII: 4글자당 약 1토큰
+    """
+    if not text:
+        return 0
+    ascii_count = sum(1 for c in text if c < "\x80")
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4
+
+
+def _message_text(msg: Dict) -> str:
+    return msg.get("content") or msg.get("text") or ""
+
+
+def split_by_budget(
+    history: List[Dict],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    min_recent: int = 2,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    히스토리를 (오래된 턴, 최근 턴)으로 분리
+
+    Args:
+        history: 메시지 리스트 (오래된 순)
+        budget: 최근 턴에 쓸 토큰 예산
+        min_recent: 예산을 넘어도 최소한 유지할 최근 메시지 수
+
+    Returns:
+        (예산 밖 메시지, 예산 안 메시지)
+    """
+    used = 0
+    start = len(history)
+    for idx in range(len(history) - 1, -1, -1):
+        cost = estimate_tokens(_message_text(history[idx])) + 2  # 역할 라벨
+        kept = len(history) - idx - 1
+        if used + cost > budget and kept >= min_recent:
+            break
+        used += cost
+        start = idx
+    return history[:start], history[start:]
+
+
+def split_for_prompt(
+    history: List[Dict],
+    covered: Optional[int] = None,
+    budget: int = HISTORY_TOKEN_BUDGET,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    프롬프트에 실을 (요약으로 대체된 메시지, 원문 메시지)
+
+    예산 밖 메시지라도 아직 요약에 반영되지 않았으면(covered 이후) 원문으로 남김
+    → 요약 배치가 쌓이거나 백그라운드 작업이 끝나기 전에도 대화 내용이 빠지지 않음
+    (RollingSummary.refresh와 같은 split_by_budget 분할 기준)
+
+    Args:
+        covered: 요약에 반영된 메시지 수 (None이면 예산 밖 전체가 반영된 것으로 간주)
+    """
+    older, recent = split_by_budget(history, budget)
+    if covered is None or covered >= len(older):
+        return older, recent
+    return older[:covered], older[covered:] + recent
+
+
+# ============================================
+# 롤링 요약 (세션별 캐시)
+# ============================================
+class RollingSummary:
+    """
+    예산 밖으로 밀려난 턴을 누적 요약으로 관리
+
+    state는 세션 범위의 dict (st.session_state 등)이며 아래 키를 사용:
+        - 'text': 현재까지의 요약문
+        - 'covered': 요약에 반영된 메시지 수 (history 앞에서부터)
+        - 'pending': 진행 중인 백그라운드 작업 (Future)
+    """
+
+    def __init__(self, summarize_fn: Callable[[str, List[Dict]], str]):
+        """
+        Args:
+            summarize_fn: (기존 요약, 새로 접어 넣을 메시지들) -> 새 요약
+        """
+        self.summarize_fn = summarize_fn
+
+    @staticmethod
+    def new_state() -> Dict:
+        return {"text": "", "covered": 0, "pending": None}
+
+    def get(self, state: MutableMapping) -> str:
+        """현재 요약 반환 (완료된 백그라운드 작업이 있으면 반영)"""
+        self._harvest(state)
+        return state.get("text", "")
+
+    @staticmethod
+    def covered(state: MutableMapping) -> int:
+        """get()으로 돌려준 요약에 반영된 메시지 수"""
+        return state.get("covered", 0)
+
+    def refresh(self, state: MutableMapping, older: List[Dict]) -> None:
+        """
+        예산 밖 메시지가 충분히 쌓였으면 백그라운드 요약 시작 (블로킹 없음)
+
+        Args:
+            state: 세션 요약 상태
+            older: split_by_budget()이 돌려준 예산 밖 메시지
+        """
+        self._harvest(state)
+        if state.get("pending") is not None:
+            return
+
+        covered = state.get("covered", 0)
+        if covered > len(older):
+            # 대화가 초기화된 경우
+            state.update(self.new_state())
+            covered = 0
+
+        new_msgs = older[covered:]
+        if len(new_msgs) < SUMMARY_MIN_BATCH:
+            return
+
+        # 호출한 쪽의 컨텍스트(토큰 계량 라벨, trace)를 요약 스레드로 전달
+        ctx = contextvars.copy_context()
+        future: Future = _EXECUTOR.submit(ctx.run, self.summarize_fn, state.get("text", ""), list(new_msgs))
+        future.covered_upto = len(older)  # type: ignore[attr-defined]
+        state["pending"] = future
+
+    @staticmethod
+    def _harvest(state: MutableMapping) -> None:
+        future: Optional[Future] = state.get("pending")
+        if future is None or not future.done():
+            return
+        state["pending"] = None
+        try:
+            text = future.result()
+        except Exception:
+            # 요약 실패 시 기존 요약 유지, 다음 refresh에서 재시도
+            return
+        if text:
+            state["text"] = text.strip()[:SUMMARY_MAX_CHARS]
+        state["covered"] = getattr(future, "covered_upto", state.get("covered", 0))
+
+
+def local_summary(previous: str, messages: List[Dict]) -> str:
+    """
+    LLM 없이 만드는 요약 (폴백)
+    고객 발화의 앞부분만 누적해서 핵심 사실(업종, 증상 등)이 빠지지 않게 유지
+    """
+    lines = [previous] if previous else []
+    for msg in messages:
+        if msg.get("role") != "user":
+            continue
+        text = _message_text(msg).strip().replace("\n", " ")
+        if text:
+            lines.append(f"- 고객: {text[:60]}")
+    merged = "\n".join(lines)
+    # 너무 길면 오래된 줄부터 버림
+    while len(merged) > SUMMARY_MAX_CHARS and "\n" in merged:
+        merged = merged.split("\n", 1)[1]
+    return merged
@@ -0,0 +1,353 @@
+"""
+IMD Sales Bot - Conversation Engine
+UI 없이 돌아가는 상담 퍼널 로직 (Streamlit 앱과 HTTP API가 함께 사용)
+- 입력 처리: 스크립트 단계 → 의미 캐시(자유 입력) → LLM 순서, 단계/슬롯 갱신
+- 데모 페르소나 conversion 진입 시 Veritas 후기 삽입
+- 선택 UI(혀/스타일) 처리
+- 리드 제출 (폼 검증 → LeadHandler 저장 → 완료 메시지)
+"""
+
+import html
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import get_config
+from conversation_manager import ConversationManager
+from funnel_script import get_scripted_turn
+from prompt_engine import assign_variant, generate_ai_turn, generate_veritas_story
+from lead_store import idempotency_key
+from metering import record_conversion, usage_labels
+from semantic_cache import lookup_turn, store_turn
+from telemetry import span
+from text_norm import has_hangul
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+# 버튼/선택 UI를 띄우지 않는 단계
+NO_BUTTON_STAGES = ("tongue_select", "conversion", "complete")
+
+# conversion 진입 시 답변 뒤에 붙이는 후기/사례 블록 시작 (재실행 비교 때 떼어 내는 기준)
+VERITAS_DIVIDER = "\n\n---\n\n💬 **실제 후기**"
+MATH_CASE_NOTICE = "\n\n잠시만요, 어머님 자녀분과 비슷한 케이스를 데이터베이스에서 찾아보겠습니다..."
+
+
+def strip_veritas(reply: str) -> str:
+    """기록된 답변에서 후기/사례 블록을 떼고 모델 답변 본문만"""
+    for marker in (VERITAS_DIVIDER, MATH_CASE_NOTICE):
+        index = reply.find(marker)
+        if index >= 0:
+            return reply[:index]
+    return reply
+
+
+# 페르소나별 리드 폼 필드 (lift는 B2C라 성함/연락처만)
+LEAD_FORM_FIELDS = {
+    "lift": ("name", "contact"),
+    "default": ("clinic_name", "director_name", "contact"),
+}
+
+
+def lead_form_spec(client_id: str) -> List[Dict[str, str]]:
+    """리드 폼 필드 + 라벨 (HTTP API / 위젯용)"""
+    cfg = get_config(client_id)
+    labels = {
+        "name": (cfg["FORM_LABEL_1"], cfg["FORM_PLACEHOLDER_1"]),
+        "clinic_name": (cfg["FORM_LABEL_1"], cfg["FORM_PLACEHOLDER_1"]),
+        "director_name": (cfg["FORM_LABEL_2"], cfg["FORM_PLACEHOLDER_2"]),
+        "contact": (cfg["FORM_LABEL_2"], cfg["FORM_PLACEHOLDER_2"]) if client_id == "lift" else ("연락처 (직통)", "010-1234-5678"),
+    }
+    fields = LEAD_FORM_FIELDS.get(client_id, LEAD_FORM_FIELDS["default"])
+    return [{"name": f, "label": labels[f][0], "placeholder": labels[f][1]} for f in fields]
+
+
+def transcript_html(history: List[Dict]) -> str:
+    """채팅 히스토리 HTML (Streamlit 앱 렌더링, benchmark.py의 transcript_html 측정 대상)"""
+    parts = ['<div class="chat-area">']
+    for msg in history:
+        role = msg.get("role")
+        safe = html.escape(msg.get("text", "")).replace("\n", "<br>")
+        if role == "ai":
+            parts.append(f'<div class="ai-msg">{safe}</div>')
+        elif role == "user":
+            parts.append(f'<div class="msg-right"><span class="user-msg">{safe}</span></div>')
+    parts.append("</div>")
+    return "".join(parts)
+
+
+class ConversationEngine:
+    """페르소나 하나 + 세션 하나의 상담 진행"""
+
+    def __init__(self, client_id: str, manager: ConversationManager, lead_handler=None):
+        """
+        Args:
+            client_id: 페르소나 ID
+            manager: 세션 상태 (st.session_state 또는 저장소 기반 dict)
+            lead_handler: 리드 저장소 (None이면 submit_lead 시 생성)
+        """
+        self.client_id = client_id
+        self.cfg = get_config(client_id)
+        self.is_root = self.cfg.get("IS_ROOT", False)
+        self.manager = manager
+        self.lead_handler = lead_handler
+        # 프롬프트 A/B 변형 (세션 ID 해시로 고정 배정)
+        self.variant = assign_variant(client_id, manager.session_id)
+
+    # --------------------------------------------------
+    # 세션 시작
+    # --------------------------------------------------
+    def start(self, force: bool = False) -> bool:
+        """
+        첫 인사로 세션 시작 (같은 페르소나의 진행 중인 상담이 있으면 그대로 이어감)
+
+        Returns:
+            새로 시작했으면 True
+        """
+        context = self.manager.get_context()
+        if not force and self.manager.get_history() and context.get("client_id") == self.client_id:
+            return False
+        self.manager.reset_conversation()
+        self.manager.update_context("client_id", self.client_id)
+        self.manager.add_message("ai", self.cfg["INITIAL_MSG"])
+        self.manager.update_stage("initial")
+        self.manager.flush_state()
+        # 이 세션이 본 프롬프트 변형 (replay.py가 같은 변형으로 재실행)
+        self.manager.log_event("variant", text=self.variant)
+        return True
+
+    @property
+    def stage(self) -> str:
+        return self.manager.get_context().get("stage", "initial")
+
+    # --------------------------------------------------
+    # 입력 처리
+    # --------------------------------------------------
+    def handle_input(self, text: str, kind: str = "text", on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        사용자 입력(자유 입력 또는 추천 버튼) 한 턴 처리
+
+        Args:
+            text: 입력 문구
+            kind: 'text' (자유 입력) | 'button' (추천 버튼)
+            on_delta: 답변 본문 조각 콜백 (SSE 스트리밍용)
+
+        Returns:
+            {'reply', 'stage', 'route', 'buttons', 'slots', 'case_study'}
+        """
+        stage = self.stage
+        with usage_labels(
+            client_id=self.client_id, stage=stage, session_id=self.manager.session_id, purpose="turn",
+            variant=self.variant,
+        ), span("turn", persona=self.client_id, stage=stage):
+            try:
+                return self._handle_input(text, kind, on_delta)
+            finally:
+                # 턴 중 바뀐 컨텍스트(메시지, 슬롯, 단계)를 한 번에 저장
+                self.manager.flush_state()
+
+    def _handle_input(self, text: str, kind: str, on_delta: Optional[Callable[[str], None]]) -> Dict:
+        stage = self.stage
+        metadata = {"type": "button", "stage": stage} if kind == "button" else {"type": "text"}
+        first_question = kind == "text" and not any(m["role"] == "user" for m in self.manager.get_history())
+        self.manager.add_message("user", text, metadata=metadata)
+
+        # 스크립트 선택지면 LLM 없이 처리, 첫 자유 입력은 비슷한 질문의 최근 답변 재사용
+        turn = get_scripted_turn(self.client_id, stage, text)
+        if turn is None and first_question:
+            with span("semantic_cache", persona=self.client_id, stage=stage):
+                turn = lookup_turn(self.client_id, stage, self.variant, text, first_question)
+        if turn is None:
+            context = self.manager.get_context()
+            context["prompt_variant"] = self.variant
+            turn = generate_ai_turn(text, context, self.manager.get_history(), on_delta=on_delta)
+            store_turn(self.client_id, stage, self.variant, text, turn, first_question)
+        elif on_delta is not None:
+            on_delta(turn["reply"])
+        self.manager.update_slots(turn["slots"])
+
+        reply = turn["reply"]
+        case_study = None
+        # 데모 모드에서 자유 입력으로 conversion에 도달하면 후기 추가
+        if kind == "text" and not self.is_root and turn["stage"] == "conversion":
+            reply, case_study = self._with_veritas(reply)
+            if on_delta is not None:
+                on_delta(reply[len(turn["reply"]):])
+
+        self.manager.add_message("ai", reply, metadata={"buttons": turn["buttons"]})
+        self.manager.update_stage(turn["stage"])
+        return {
+            "reply": reply,
+            "stage": turn["stage"],
+            "route": turn["route"] if self.is_root else None,
+            "buttons": self.buttons(),
+            "slots": turn["slots"],
+            "case_study": case_study,
+        }
+
+    def _with_veritas(self, reply: str) -> Tuple[str, Optional[str]]:
+        """고객 발화에서 증상을 뽑아 페르소나별 후기를 붙임"""
+        user_messages = [msg.get("text", "") for msg in self.manager.get_history() if msg.get("role") == "user"]
+        symptom_messages = [m for m in user_messages if len(m) >= 5 and has_hangul(m)]
+        symptom = " ".join(symptom_messages[:2]) if symptom_messages else "만성 피로"
+        success_story = generate_veritas_story(symptom, client_id=self.client_id)
+
+        # 학원(math)은 '유사 사례 분석' 형태로 별도 표시
+        if self.client_id == "math":
+            return reply + MATH_CASE_NOTICE, success_story
+        # 기존 방식 (병원/법률 등)
+        return reply + f"{VERITAS_DIVIDER}\n\n\"{success_story}\"\n\n---\n", None
+
+    # --------------------------------------------------
+    # 선택 UI (tongue_select 단계)
+    # --------------------------------------------------
+    def options(self) -> Dict[str, Dict]:
+        """현재 띄워야 할 선택지 (혀/스타일 타입), 없으면 빈 dict"""
+        if self.is_root or self.stage != "tongue_select":
+            return {}
+        if self.manager.get_context().get("selected_tongue"):
+            return {}
+        return self.cfg.get("TONGUE_TYPES", {})
+
+    def select_option(self, key: str) -> Dict:
+        """
+        선택 UI에서 항목 선택 → 분석 메시지 + conversion 단계
+
+        Raises:
+            KeyError: 없는 선택지
+        """
+        tongue_data = self.cfg.get("TONGUE_TYPES", {})[key]
+        self.manager.update_context("selected_tongue", key)
+        self.manager.log_event("option", role="user", text=key)
+        diagnosis_msg = f"""{tongue_data['name']} 상태를 선택하셨습니다.
+
+{tongue_data['analysis']}
+
+주요 증상: {tongue_data['symptoms']}
+
+⚠️ 주의: {tongue_data['warning']}
+
+방금 보신 과정이 실제로 AI가 환자에게 자동으로 진행하는 흐름입니다.
+
+이제부터는 이 분석 결과를 바탕으로 자연스럽게 상담 단계로 넘어갑니다."""
+        self.manager.add_message("ai", diagnosis_msg)
+        self.manager.update_stage("conversion")
+        self.manager.flush_state()
+        return {"reply": diagnosis_msg, "stage": "conversion", "route": None, "buttons": [], "slots": {}, "case_study": None}
+
+    # --------------------------------------------------
+    # 버튼 / CTA
+    # --------------------------------------------------
+    def buttons(self) -> List[str]:
+        """현재 단계의 추천 답변 버튼"""
+        if self.stage in NO_BUTTON_STAGES:
+            return []
+        return self.manager.get_recommended_buttons()
+
+    def show_cta(self) -> bool:
+        """리드 폼 노출 여부"""
+        if self.stage == "complete":
+            return False
+        history = self.manager.get_history()
+        return self.stage == "conversion" or (
+            len(history) > 0 and "도입하시겠습니까" in history[-1].get("text", "")
+        )
+
+    def lead_fields(self) -> Tuple[str, ...]:
+        return LEAD_FORM_FIELDS.get(self.client_id, LEAD_FORM_FIELDS["default"])
+
+    # --------------------------------------------------
+    # 리드 제출
+    # --------------------------------------------------
+    def submit_lead(self, form: Dict[str, str]) -> Tuple[bool, str]:
+        """
+        리드 폼 제출
+
+        Args:
+            form: lift는 {'name', 'contact'}, 그 외는 {'clinic_name', 'director_name', 'contact'}
+
+        Returns:
+            (성공여부, 화면에 띄울 메시지)
+        """
+        if any(not (form.get(field) or "").strip() for field in self.lead_fields()):
+            return False, "필수 정보를 모두 입력해주세요."
+
+        if self.client_id == "lift":
+            # lift용 리드 데이터 (진단 단계 슬롯)
+            slots = self.manager.get_context().get("slots", {})
+            lead_data = {
+                "name": form["name"],
+                "contact": form["contact"],
+                "symptom": f"연령대: {slots.get('age_group', '미입력')} / 고민: {slots.get('concern', '미입력')} / 시술경험: {slots.get('treatment_history', '미입력')}",
+                "preferred_date": "즉시 상담 희망",
+                "chat_summary": self.manager.get_summary(),
+                "source": self.cfg["APP_TITLE"],
+                "type": "피부과 리프팅",
+                "client_id": self.client_id,
+            }
+            completion_msg = "신청이 완료되었습니다. 전문 분석가가 곧 연락드리겠습니다. 감사합니다."
+            done_msg = "✅ 신청되었습니다! 전문 분석가가 곧 연락드립니다."
+        else:
+            lead_data = {
+                "name": form["director_name"],
+                "contact": form["contact"],
+                "symptom": f"회사/병원명: {form['clinic_name']}",
+                "preferred_date": "즉시 상담 희망",
+                "chat_summary": self.manager.get_summary(),
+                "source": self.cfg["APP_TITLE"],
+                "type": self.cfg["APP_TITLE"],
+                "client_id": self.client_id,
+            }
+            completion_msg = f"""견적서 발송이 완료되었습니다.
+
+{form['director_name']}님, 감사합니다.
+
+{form['clinic_name']}에 최적화된 AI 시스템 견적서를 {form['contact']}로 24시간 내 전송해드리겠습니다.
+
+담당 컨설턴트가 직접 연락드려 상세히 안내해드리겠습니다."""
+            done_msg = "견적서 신청이 완료되었습니다!"
+
+        # 이미 제출한 세션 (더블클릭 재실행 등): 저장/완료 메시지/전환 기록을 다시 하지 않음
+        if self.stage == "complete":
+            return True, done_msg
+
+        # 세션 토큰(?sid=)은 싱크로 내보내지 않고 해시만
+        if self.manager.session_id:
+            lead_data["idempotency_key"] = idempotency_key(self.manager.session_id, form["contact"], self.client_id)
+
+        if self.lead_handler is None:
+            from lead_handler import LeadHandler
+            self.lead_handler = LeadHandler()
+        lead_span = span("lead_save", persona=self.client_id, stage=self.stage)
+        with lead_span:
+            success, message = self.lead_handler.save_lead(lead_data)
+        if not success:
+            logger.warning(
+                "리드 저장 실패: %s", message,
+                extra={"persona": self.client_id, "stage": self.stage, "session": self.manager.session_id,
+                       "fields": {"latency_ms": round(lead_span.seconds * 1000, 1)}},
+            )
+            return False, f"오류: {message}"
+
+        record_conversion(self.client_id, self.manager.session_id, self.variant)
+        self.manager.log_event("lead", role="user", text=lead_data["type"])
+        self.manager.add_message("ai", completion_msg)
+        self.manager.update_stage("complete")
+        self.manager.flush_state()
+        return True, done_msg
+
+    # --------------------------------------------------
+    # 조회 (HTTP API 응답용)
+    # --------------------------------------------------
+    def snapshot(self) -> Dict:
+        """현재 화면을 그리는 데 필요한 상태 전체"""
+        return {
+            "session_id": self.manager.session_id,
+            "client_id": self.client_id,
+            "stage": self.stage,
+            "messages": [{"role": m["role"], "text": m["text"]} for m in self.manager.get_history()],
+            "buttons": self.buttons(),
+            "options": [
+                {"key": key, "name": data["name"], "emoji": data.get("emoji", "")}
+                for key, data in self.options().items()
+            ],
+            "cta": {"show": self.show_cta(), "fields": lead_form_spec(self.client_id)},
+        }
@@ -2,38 +2,135 @@
 IMD Sales Bot - Conversation State Management
 대화 히스토리, 컨텍스트, 사용자 의도 관리
 비주얼 예진 센터 플로우 지원
+- 상태는 세션 범위 dict(st.session_state 등)에 두고, 변경분만 세션 저장소에 기록
 """
 
-import streamlit as st
-from typing import Dict, List, Optional
+from typing import Dict, List, MutableMapping, Optional
 from datetime import datetime
-import re
+import time
+
+try:
+    import streamlit as st
+except Exception:
+    st = None  # type: ignore
+
+from context_window import HISTORY_TOKEN_BUDGET, RollingSummary, split_by_budget, split_for_prompt
+from event_log import emit_event
+from funnel_metrics import record_start, record_transition
+from funnel_script import get_funnel_script
+from session_store import SessionStore, get_session_store, is_valid_session_id, new_session_id
+from text_norm import contains_any, keywords
+
+
+def _new_user_context() -> Dict:
+    return {
+        'user_type': 'visitor',       # 방문자 타입
+        'selected_symptom': None,     # 선택한 증상/항목
+        'selected_tongue': None,      # 선택한 혀/스타일
+        'health_score': 0,            # 종합 점수
+        'pain_point': None,           # 주요 고민
+        'urgency': None,              # 긴급도
+        'budget_sense': None,         # 가격 민감도
+        'trust_level': 0,             # 신뢰도 (0-100)
+        'stage': 'initial',           # 대화 단계
+        'keywords': [],               # 언급된 키워드들
+        'objections': [],             # 반박/우려 사항
+        'slots': {},                  # 모델이 추출한 사실 (구조화 응답 모드)
+    }
+
 
 class ConversationManager:
     """대화 상태 및 컨텍스트 관리 클래스"""
     
-    def __init__(self):
-        """세션 상태 초기화"""
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
-        
-        if 'user_context' not in st.session_state:
-            st.session_state.user_context = {
-                'user_type': 'visitor',       # 방문자 타입
-                'selected_symptom': None,     # 선택한 증상/항목
-                'selected_tongue': None,      # 선택한 혀/스타일
-                'health_score': 0,            # 종합 점수
-                'pain_point': None,           # 주요 고민
-                'urgency': None,              # 긴급도
-                'budget_sense': None,         # 가격 민감도
-                'trust_level': 0,             # 신뢰도 (0-100)
-                'stage': 'initial',           # 대화 단계
-                'keywords': [],               # 언급된 키워드들
-                'objections': [],             # 반박/우려 사항
-            }
-        
-        if 'interaction_count' not in st.session_state:
-            st.session_state.interaction_count = 0
+    def __init__(
+        self,
+        state: Optional[MutableMapping] = None,
+        store: Optional[SessionStore] = None,
+        session_id: Optional[str] = None,
+    ):
+        """
+        세션 상태 초기화
+        
+        Args:
+            state: 세션 범위 상태 (기본값: st.session_state)
+            store: 세션 저장소 (None이면 저장하지 않음)
+            session_id: 저장소의 세션 키 (URL ?sid= 토큰)
+        """
+        self.state = state if state is not None else st.session_state
+        self.store = store
+        self.session_id = session_id
+        self.resumed = False
+        
+        # 저장된 세션이 있으면 이어서 시작 (새로고침/재시작/기기 변경)
+        if store is not None and session_id and self.state.get('session_id') != session_id:
+            saved = store.load(session_id)
+            if saved and saved.get('messages'):
+                self._restore(saved)
+                self.resumed = True
+            self.state['session_id'] = session_id
+        
+        if 'chat_history' not in self.state:
+            self.state['chat_history'] = []
+        
+        if 'user_context' not in self.state:
+            self.state['user_context'] = _new_user_context()
+        
+        if 'interaction_count' not in self.state:
+            self.state['interaction_count'] = 0
+        
+        if 'history_summary' not in self.state:
+            self.state['history_summary'] = RollingSummary.new_state()
+        
+        self._summary = RollingSummary(self._summarize)
+    
+    # --------------------------------------------------
+    # 세션 저장소 연동
+    # --------------------------------------------------
+    def _restore(self, saved: Dict):
+        """저장소에서 읽은 세션을 상태에 반영"""
+        saved_state = saved.get('state', {})
+        user_context = _new_user_context()
+        user_context.update(saved_state.get('user_context', {}))
+        summary = RollingSummary.new_state()
+        summary.update(saved_state.get('history_summary', {}))
+        summary['pending'] = None
+        
+        self.state['chat_history'] = saved['messages']
+        self.state['user_context'] = user_context
+        self.state['interaction_count'] = saved_state.get('interaction_count', 0)
+        self.state['history_summary'] = summary
+    
+    def _snapshot(self) -> Dict:
+        """저장할 컨텍스트 (메시지 제외, 진행 중인 요약 작업 제외)"""
+        summary = self.state['history_summary']
+        return {
+            'user_context': self.state['user_context'],
+            'interaction_count': self.state['interaction_count'],
+            'history_summary': {'text': summary.get('text', ''), 'covered': summary.get('covered', 0)},
+        }
+    
+    def _persist_message(self, message: Dict):
+        if self.store is not None and self.session_id:
+            self.store.append_message(self.session_id, message)
+    
+    def _persist_state(self):
+        if self.store is not None and self.session_id:
+            self.store.save_state(self.session_id, self._snapshot())
+        self.state['state_dirty'] = False
+    
+    def _mark_dirty(self):
+        """컨텍스트 변경 표시만 (저장은 한 턴이 끝날 때 flush_state에서 한 번)"""
+        self.state['state_dirty'] = True
+    
+    def flush_state(self):
+        """변경된 컨텍스트가 있으면 저장소에 한 번 저장 (턴/선택/리드 제출 끝에 호출)"""
+        if self.state.get('state_dirty'):
+            self._persist_state()
+
+    def log_event(self, kind: str, role: str = "", text: str = "", detail: str = ""):
+        """분석용 이벤트 로그에 현재 세션/페르소나/단계로 기록"""
+        context = self.state['user_context']
+        emit_event(kind, self.session_id, context.get('client_id', ''), context.get('stage', ''), role, text, detail)
     
     def add_message(self, role: str, text: str, metadata: Optional[Dict] = None):
         """
@@ -50,13 +147,20 @@ class ConversationManager:
             'timestamp': datetime.now().isoformat(),
             'metadata': metadata or {}
         }
-        st.session_state.chat_history.append(message)
+        self.state['chat_history'].append(message)
+        self._persist_message(message)
+        is_click = role == 'user' and message['metadata'].get('type') == 'button'
+        self.log_event('click' if is_click else 'message', role, text)
         
         # 인터랙션 카운트 증가 (신뢰도 계산용)
         if role == 'user':
-            st.session_state.interaction_count += 1
+            self.state['interaction_count'] += 1
             self._update_trust_level()
             self._extract_context(text, metadata)
+            self._mark_dirty()
+        else:
+            # AI 응답이 붙은 뒤 예산 밖으로 밀려난 턴을 백그라운드에서 요약
+            self._refresh_summary()
     
     def get_history(self, limit: Optional[int] = None) -> List[Dict]:
         """
@@ -68,7 +172,7 @@ class ConversationManager:
         Returns:
             메시지 리스트
         """
-        history = st.session_state.chat_history
+        history = self.state['chat_history']
         if limit:
             return history[-limit:]
         return history
@@ -80,7 +184,11 @@ class ConversationManager:
         Returns:
             컨텍스트 딕셔너리
         """
-        return st.session_state.user_context.copy()
+        context = self.state['user_context'].copy()
+        context['history_summary'] = self._summary.get(self.state['history_summary'])
+        # 요약에 아직 반영되지 않은 예산 밖 메시지는 프롬프트에 원문으로 남기기 위해
+        context['history_covered'] = RollingSummary.covered(self.state['history_summary'])
+        return context
     
     def get_formatted_history(self, for_llm: bool = True) -> str:
         """
@@ -92,10 +200,15 @@ class ConversationManager:
         Returns:
             포맷팅된 대화 내역
         """
-        history = self.get_history(limit=10)  # 최근 10개만 (토큰 절약)
+        # 토큰 예산 안의 최근 대화 + 아직 요약되지 않은 대화는 원문, 그 이전은 요약으로 (토큰 절약)
+        summary = self._summary.get(self.state['history_summary'])
+        covered = RollingSummary.covered(self.state['history_summary'])
+        _, history = split_for_prompt(self.get_history(), covered, HISTORY_TOKEN_BUDGET)
         
         if for_llm:
             formatted = []
+            if summary:
+                formatted.append(f"[이전 대화 요약]\n{summary}")
             for msg in history:
                 role_label = "고객" if msg['role'] == 'user' else "AI"
                 formatted.append(f"{role_label}: {msg['text']}")
@@ -103,16 +216,27 @@ class ConversationManager:
         else:
             return history
     
+    def _refresh_summary(self):
+        """예산 밖 메시지가 쌓였으면 롤링 요약 갱신 요청 (논블로킹)"""
+        older, _ = split_by_budget(self.get_history(), HISTORY_TOKEN_BUDGET)
+        self._summary.refresh(self.state['history_summary'], older)
+    
+    @staticmethod
+    def _summarize(previous: str, messages: List[Dict]) -> str:
+        """백그라운드 요약 작업 (LLM 연동은 prompt_engine 담당)"""
+        from prompt_engine import summarize_history
+        return summarize_history(previous, messages)
+    
     def _extract_context(self, text: str, metadata: Optional[Dict] = None):
         """
         사용자 입력에서 컨텍스트 추출 (키워드 기반 + 메타데이터)
+        키워드 비교는 text_norm 분석 결과(띄어쓰기 무시)를 재사용
         
         Args:
             text: 사용자 메시지
             metadata: 클릭/선택 정보
         """
-        text_lower = text.lower()
-        context = st.session_state.user_context
+        context = self.state['user_context']
         
         # 메타데이터에서 직접 추출
         if metadata:
@@ -122,42 +246,41 @@ class ConversationManager:
                 context['selected_tongue'] = metadata.get('value')
         
         # 1. 업종 파악
-        if any(word in text_lower for word in ['병원', '의원', '성형', '피부과', '한의원', '치과']):
+        if contains_any(text, ['병원', '의원', '성형', '피부과', '한의원', '치과']):
             context['user_type'] = '병원'
-        elif any(word in text_lower for word in ['쇼핑몰', '커머스', '브랜드', '판매', '온라인몰']):
+        elif contains_any(text, ['쇼핑몰', '커머스', '브랜드', '판매', '온라인몰']):
             context['user_type'] = '쇼핑몰'
         
         # 2. 페인 포인트 파악
-        if any(word in text_lower for word in ['전환', '구매', '예약', '상담']):
+        if contains_any(text, ['전환', '구매', '예약', '상담']):
             context['pain_point'] = 'conversion'
-        elif any(word in text_lower for word in ['비용', '광고비', 'roas', '마케팅']):
+        elif contains_any(text, ['비용', '광고비', 'roas', '마케팅']):
             context['pain_point'] = 'cost'
-        elif any(word in text_lower for word in ['직원', '인력', '야근', '대응']):
+        elif contains_any(text, ['직원', '인력', '야근', '대응']):
             context['pain_point'] = 'manpower'
         
         # 3. 긴급도 파악
-        if any(word in text_lower for word in ['급', '빨리', '즉시', '바로', '당장']):
+        if contains_any(text, ['급', '빨리', '즉시', '바로', '당장']):
             context['urgency'] = 'high'
-        elif any(word in text_lower for word in ['천천히', '검토', '고민', '생각']):
+        elif contains_any(text, ['천천히', '검토', '고민', '생각']):
             context['urgency'] = 'low'
         
         # 4. 가격 민감도
-        if any(word in text_lower for word in ['가격', '비용', '얼마', '저렴', '비싸']):
+        if contains_any(text, ['가격', '비용', '얼마', '저렴', '비싸']):
             context['budget_sense'] = 'price_sensitive'
         
         # 5. 반박/우려 사항 기록
-        if any(word in text_lower for word in ['효과', '의심', '진짜', '정말', '믿']):
+        if contains_any(text, ['효과', '의심', '진짜', '정말', '믿']):
             if 'skeptical' not in context['objections']:
                 context['objections'].append('skeptical')
         
-        if any(word in text_lower for word in ['어렵', '복잡', '힘들']):
+        if contains_any(text, ['어렵', '복잡', '힘들']):
             if 'complexity' not in context['objections']:
                 context['objections'].append('complexity')
         
-        # 6. 키워드 수집 (명사 위주)
-        keywords = re.findall(r'[가-힣]{2,}', text)
-        context['keywords'].extend([k for k in keywords if len(k) >= 2])
-        context['keywords'] = list(set(context['keywords']))[-20:]  # 중복 제거, 최근 20개만
+        # 6. 키워드 수집 (조사·어미를 뗀 형태)
+        context['keywords'].extend(keywords(text))
+        context['keywords'] = list(dict.fromkeys(context['keywords']))[-20:]  # 중복 제거, 최근 20개만
     
     def _update_trust_level(self):
         """
@@ -165,10 +288,10 @@ class ConversationManager:
         신뢰도 = 인터랙션 수 * 10 (최대 100)
         """
         # 사용자 메시지만 카운트 (AI 제외)
-        user_messages = sum(1 for msg in st.session_state.chat_history if msg['role'] == 'user')
+        user_messages = sum(1 for msg in self.state['chat_history'] if msg['role'] == 'user')
         
         trust = min(user_messages * 15, 100)  # 버튼 클릭도 카운트되므로 15점씩
-        st.session_state.user_context['trust_level'] = trust
+        self.state['user_context']['trust_level'] = trust
     
     def calculate_health_score(self) -> int:
         """
@@ -178,13 +301,13 @@ class ConversationManager:
             종합 건강 점수 (0-100)
         """
         # 단순화된 버전 - scores가 없으면 기본값 반환
-        return st.session_state.user_context.get('health_score', 50)
+        return self.state['user_context'].get('health_score', 50)
     
     def is_ready_for_conversion(self) -> bool:
         """
         리드 전환 타이밍 판단
         """
-        context = st.session_state.user_context
+        context = self.state['user_context']
         stage = context.get('stage', 'initial')
         
         return stage in ['result_view', 'conversion', 'complete']
@@ -200,12 +323,30 @@ class ConversationManager:
             - sleep_check: 수면 확인
             - digestion_check: 소화 확인
             - tongue_select: 혀 선택
+            - concern_check: 고민 부위 확인 (lift)
+            - history_check: 시술 경험 확인 (lift)
             - diagnosis: 진단 설명
             - solution: 솔루션 제안
             - conversion: 클로징 멘트
             - complete: 견적서 제출 완료
         """
-        st.session_state.user_context['stage'] = new_stage
+        context = self.state['user_context']
+        previous = context.get('stage')
+        now = time.time()
+        entered_at = self.state.get('stage_entered_at')
+        if previous == new_stage:
+            # 새 상담의 첫 update_stage('initial') → 퍼널 진입으로 집계
+            if entered_at is None and new_stage == 'initial':
+                self.state['stage_entered_at'] = now
+                record_start(context.get('client_id', ''))
+            return
+        context['stage'] = new_stage
+        self._mark_dirty()
+        self.log_event('stage', text=new_stage, detail=previous or '')
+        # 이어받은 세션은 이전 단계 진입 시각을 모름 → 체류 시간 없이 전환만
+        stay = now - entered_at if entered_at is not None else None
+        record_transition(context.get('client_id', ''), previous, new_stage, stay)
+        self.state['stage_entered_at'] = now
     
     def update_context(self, key: str, value):
         """
@@ -215,25 +356,67 @@ class ConversationManager:
             key: 컨텍스트 키 (예: 'selected_tongue', 'selected_symptom')
             value: 업데이트할 값
         """
-        st.session_state.user_context[key] = value
+        if self.state['user_context'].get(key) == value:
+            return
+        self.state['user_context'][key] = value
+        self._mark_dirty()
+    
+    def get_recommended_buttons(self, limit: int = 4) -> List[str]:
+        """
+        현재 시점의 추천 답변 버튼 (추가 LLM 호출 없음)
+        
+        0순위: 스크립트 단계(FUNNEL_SCRIPT)면 스크립트 선택지 (자유 입력으로 도달해도 슬롯이 채워지도록)
+        1순위: 마지막 AI 메시지에 함께 온 모델 제안 버튼 (metadata['buttons'])
+        2순위: config의 페르소나 + 단계별 기본 버튼 (QUICK_REPLIES)
+        이미 보낸 답변은 제외
+        
+        Returns:
+            버튼 텍스트 리스트
+        """
+        history = self.state['chat_history']
+        context = self.state['user_context']
+        
+        client_id = context.get('client_id', 'root')
+        stage = context.get('stage', 'initial')
+        script = get_funnel_script(client_id)
+        buttons: List[str] = script.options(stage) if script.is_scripted(stage) else []
+        if not buttons and history and history[-1]['role'] == 'ai':
+            buttons = list(history[-1].get('metadata', {}).get('buttons') or [])
+        
+        if not buttons:
+            from config import get_quick_replies
+            buttons = get_quick_replies(client_id, stage)
+        
+        used = {msg['text'] for msg in history if msg['role'] == 'user'}
+        return [b for b in buttons if b not in used][:limit]
+    
+    def update_slots(self, slots: Dict):
+        """
+        모델이 추출한 슬롯(업종, 연령대, 고민 부위 등) 병합
+        
+        Args:
+            slots: {'key': 'value'} 형태
+        """
+        if not slots:
+            return
+        context = self.state['user_context']
+        context.setdefault('slots', {}).update(slots)
+        self._mark_dirty()
     
     def reset_conversation(self):
-        """대화 초기화 (처음부터 다시)"""
-        st.session_state.chat_history = []
-        st.session_state.user_context = {
-            'user_type': 'visitor',
-            'selected_symptom': None,
-            'selected_tongue': None,
-            'health_score': 0,
-            'pain_point': None,
-            'urgency': None,
-            'budget_sense': None,
-            'trust_level': 0,
-            'stage': 'initial',
-            'keywords': [],
-            'objections': [],
-        }
-        st.session_state.interaction_count = 0
+        """대화 초기화 (처음부터 다시, 페르소나는 유지)"""
+        client_id = self.state['user_context'].get('client_id')
+        self.state['chat_history'] = []
+        self.state['user_context'] = _new_user_context()
+        if client_id:
+            self.state['user_context']['client_id'] = client_id
+        self.state['interaction_count'] = 0
+        self.state['history_summary'] = RollingSummary.new_state()
+        self.state['stage_entered_at'] = None
+        self.resumed = False
+        if self.store is not None and self.session_id:
+            self.store.clear(self.session_id)
+        self._mark_dirty()
     
     def get_summary(self) -> str:
         """
@@ -242,13 +425,13 @@ class ConversationManager:
         Returns:
             요약 텍스트
         """
-        context = st.session_state.user_context
-        history_count = len(st.session_state.chat_history)
+        context = self.state['user_context']
+        history_count = len(self.state['chat_history'])
         
         summary = f"""
 ### 대화 요약
 - **총 메시지**: {history_count}개
-- **인터랙션**: {st.session_state.interaction_count}회
+- **인터랙션**: {self.state['interaction_count']}회
 - **신뢰도**: {context['trust_level']}/100
 - **선택 증상**: {context['selected_symptom'] or '미선택'}
 - **선택 혀**: {context['selected_tongue'] or '미선택'}
@@ -262,8 +445,20 @@ class ConversationManager:
 # ============================================
 # 편의 함수 (전역에서 바로 사용)
 # ============================================
+def get_session_id_from_query() -> str:
+    """URL ?sid= 세션 토큰 (없거나 형식이 틀리면 새로 발급해서 URL에 기록)"""
+    sid = st.query_params.get("sid")
+    if not is_valid_session_id(sid):
+        sid = new_session_id()
+        st.query_params["sid"] = sid
+    return sid
+
+
 def get_conversation_manager() -> ConversationManager:
-    """ConversationManager 싱글톤 인스턴스 반환"""
-    if 'conv_manager' not in st.session_state:
-        st.session_state.conv_manager = ConversationManager()
-    return st.session_state.conv_manager
+    """ConversationManager 싱글톤 인스턴스 반환 (URL 토큰의 저장된 세션이 있으면 이어서)"""
+    sid = get_session_id_from_query()
+    manager = st.session_state.get('conv_manager')
+    if manager is None or manager.session_id != sid:
+        manager = ConversationManager(st.session_state, get_session_store(), sid)
+        st.session_state.conv_manager = manager
+    return manager
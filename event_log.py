@@ -0,0 +1,380 @@
+"""
+IMD Sales Bot - Conversation Event Log
+메시지 / 단계 전환 / 버튼 클릭 / 선택지 / 리드 제출을 이벤트로 남겨 오프라인 퍼널 분석에 사용
+- 호출 스레드: 튜플을 큐에 넣기만 함 (직렬화는 기록 스레드, 가득 차면 버림)
+- 기록 스레드: 추가 전용 JSONL 세그먼트에 쓰고 크기/시간 기준으로 닫음 (raw/*.jsonl)
+- 시작 시: 죽은 프로세스가 닫지 못한 세그먼트(*.jsonl.open)를 닫힌 세그먼트로 돌려 압축 대상에 포함
+- 압축 스레드: 닫힌 세그먼트를 일자/페르소나별 Parquet(zstd)로 변환 후 세그먼트 삭제
+    parquet/day=2026-10-19/persona=lift/part-<세그먼트>.parquet  (hive 파티션)
+- pyarrow가 없으면 JSONL 세그먼트만 쌓임 (압축은 pyarrow 있는 곳에서 python event_log.py compact)
+- 세션 토큰(?sid=)은 그대로 남기지 않고 해시만
+
+분석 예:
+    import pyarrow.dataset as ds
+    events = ds.dataset("events/parquet", partitioning="hive").to_table()
+    python event_log.py stats --days 7
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+EVENTS_ENABLED = os.getenv("IMD_EVENT_LOG", "1") != "0"
+EVENT_DIR = os.getenv("IMD_EVENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "events"))
+EVENT_SEGMENT_BYTES = int(os.getenv("IMD_EVENT_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+EVENT_SEGMENT_SECONDS = float(os.getenv("IMD_EVENT_SEGMENT_SECONDS", "300"))
+EVENT_COMPACT_SECONDS = float(os.getenv("IMD_EVENT_COMPACT_SECONDS", "600"))
+EVENT_QUEUE_SIZE = int(os.getenv("IMD_EVENT_QUEUE_SIZE", "100000"))
+
+# 이벤트 종류
+KINDS = ("message", "click", "stage", "option", "lead")
+
+# 기록 중인 세그먼트 확장자 (닫히면 .jsonl로 이름 변경 → 압축 대상)
+_OPEN_SUFFIX = ".jsonl.open"
+_CLOSED_SUFFIX = ".jsonl"
+
+if pa is not None:
+    # 파일에 들어가는 컬럼 (day/persona는 디렉터리 파티션)
+    EVENT_SCHEMA = pa.schema([
+        ("ts", pa.timestamp("ms")),
+        ("session", pa.string()),
+        ("stage", pa.string()),
+        ("kind", pa.dictionary(pa.int8(), pa.string())),
+        ("role", pa.dictionary(pa.int8(), pa.string())),
+        ("text", pa.string()),
+        ("detail", pa.string()),
+    ])
+else:
+    EVENT_SCHEMA = None
+
+
+def session_hash(session_id: Optional[str]) -> str:
+    """세션 토큰 대신 남기는 키 (같은 세션이면 같은 값)"""
+    if not session_id:
+        return ""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16]
+
+
+# ============================================
+# 기록 (추가 전용 세그먼트)
+# ============================================
+class EventLog:
+    """이벤트 큐 + 세그먼트 기록 스레드 + 압축 스레드"""
+
+    def __init__(self, directory: str = EVENT_DIR, compact: bool = True):
+        self.raw_dir = os.path.join(directory, "raw")
+        self.parquet_dir = os.path.join(directory, "parquet")
+        os.makedirs(self.raw_dir, exist_ok=True)
+        recover_segments(self.raw_dir)
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._segment = None
+        self._segment_path = ""
+        self._segment_started = 0.0
+        self._stopped = threading.Event()
+        self._writer = threading.Thread(target=self._run_writer, name="imd-events", daemon=True)
+        self._writer.start()
+        self._compactor = None
+        if compact and pa is not None:
+            self._compactor = threading.Thread(target=self._run_compactor, name="imd-events-compact", daemon=True)
+            self._compactor.start()
+        atexit.register(self.close)
+
+    def emit(self, kind: str, session_id: Optional[str], persona: str, stage: str,
+             role: str = "", text: str = "", detail: str = "") -> None:
+        """이벤트 하나 (호출 스레드는 put_nowait만)"""
+        try:
+            self._queue.put_nowait((int(time.time() * 1000), session_id, persona, stage, kind, role, text, detail))
+        except queue.Full:
+            self.dropped += 1
+
+    @staticmethod
+    def _serialize(event: Tuple) -> str:
+        ts, session_id, persona, stage, kind, role, text, detail = event
+        return json.dumps({
+            "ts": ts,
+            "session": session_hash(session_id),
+            "persona": persona or "root",
+            "stage": stage or "",
+            "kind": kind,
+            "role": role,
+            "text": text or "",
+            "detail": detail or "",
+        }, ensure_ascii=False)
+
+    # ---------------- 세그먼트 ----------------
+    def _open_segment(self):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self._segment_path = os.path.join(self.raw_dir, f"{stamp}-{os.getpid()}{_OPEN_SUFFIX}")
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+        self._segment_started = time.monotonic()
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._segment = None
+        if os.path.getsize(self._segment_path):
+            os.replace(self._segment_path, self._segment_path[: -len(_OPEN_SUFFIX)] + _CLOSED_SUFFIX)
+        else:
+            os.remove(self._segment_path)
+
+    def _run_writer(self):
+        while True:
+            try:
+                event = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                event = ()
+            if event is None:
+                self._close_segment()
+                return
+            # 큐에 쌓인 만큼 한 번에
+            lines = [self._serialize(event)] if event else []
+            stop = False
+            while len(lines) < 1000:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                lines.append(self._serialize(more))
+            try:
+                if lines:
+                    if self._segment is None:
+                        self._open_segment()
+                    self._segment.write("\n".join(lines) + "\n")
+                    self._segment.flush()
+                if self._segment is not None and (
+                    self._segment.tell() >= EVENT_SEGMENT_BYTES
+                    or time.monotonic() - self._segment_started >= EVENT_SEGMENT_SECONDS
+                ):
+                    self._close_segment()
+            except OSError as e:
+                logger.warning("이벤트 로그 기록 실패 (%d건 버림): %s", len(lines), e)
+                self._segment = None
+            if stop:
+                self._close_segment()
+                return
+
+    def _run_compactor(self):
+        while not self._stopped.wait(EVENT_COMPACT_SECONDS):
+            try:
+                compact(self.raw_dir, self.parquet_dir)
+            except Exception as e:
+                logger.warning("이벤트 로그 압축 실패: %s", e)
+
+    def close(self):
+        """남은 이벤트를 기록하고 현재 세그먼트를 닫음 (압축은 다음 실행/CLI에서)"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+
+# ============================================
+# 압축 (JSONL 세그먼트 → Parquet)
+# ============================================
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # 다른 사용자의 살아 있는 프로세스 (또는 확인 불가 → 살아 있다고 봄)
+        return True
+    return True
+
+
+def recover_segments(raw_dir: str) -> int:
+    """
+    비정상 종료로 남은 기록 중 세그먼트(*.jsonl.open)를 닫힌 세그먼트로 이름 변경
+
+    대상: 이 프로세스의 이전 실행(같은 pid, 아직 세그먼트를 열기 전에만 호출),
+    이미 종료된 pid, 또는 기록 스레드라면 이미 닫았을 만큼 오래된(EVENT_SEGMENT_SECONDS 초과) 세그먼트.
+    살아 있는 다른 프로세스가 쓰는 중인 세그먼트는 건드리지 않음
+
+    Returns:
+        닫힌 세그먼트로 돌린 수 (빈 세그먼트는 삭제만)
+    """
+    if not os.path.isdir(raw_dir):
+        return 0
+    recovered = 0
+    now = time.time()
+    for name in os.listdir(raw_dir):
+        if not name.endswith(_OPEN_SUFFIX):
+            continue
+        path = os.path.join(raw_dir, name)
+        try:
+            pid = int(name[: -len(_OPEN_SUFFIX)].rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            pid = None
+        try:
+            stale = now - os.path.getmtime(path) > EVENT_SEGMENT_SECONDS
+            if not (pid is None or pid == os.getpid() or stale or not _pid_alive(pid)):
+                continue
+            if os.path.getsize(path):
+                os.replace(path, path[: -len(_OPEN_SUFFIX)] + _CLOSED_SUFFIX)
+                recovered += 1
+            else:
+                os.remove(path)
+        except OSError as e:
+            # 다른 프로세스가 동시에 처리한 경우 등
+            logger.warning("이벤트 세그먼트 복구 실패 (%s): %s", path, e)
+    if recovered:
+        logger.info("닫히지 않은 이벤트 세그먼트 %d개 복구", recovered)
+    return recovered
+
+
+def _closed_segments(raw_dir: str) -> List[str]:
+    if not os.path.isdir(raw_dir):
+        return []
+    return sorted(os.path.join(raw_dir, n) for n in os.listdir(raw_dir) if n.endswith(_CLOSED_SUFFIX))
+
+
+def compact_segment(path: str, parquet_dir: str) -> int:
+    """
+    세그먼트 하나를 일자/페르소나별 Parquet 파일로 변환 후 삭제
+
+    파일 이름이 세그먼트에서 정해지므로 중간에 죽어도 다시 돌리면 같은 파일을 덮어씀
+
+    Returns:
+        변환한 이벤트 수
+    """
+    groups: Dict[Tuple[str, str], Dict[str, list]] = defaultdict(lambda: {name: [] for name in EVENT_SCHEMA.names})
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # 프로세스가 죽으면서 잘린 마지막 줄
+                continue
+            day = datetime.fromtimestamp(event["ts"] / 1000).strftime("%Y-%m-%d")
+            columns = groups[(day, event.get("persona") or "root")]
+            for name in EVENT_SCHEMA.names:
+                columns[name].append(event.get(name, ""))
+
+    stem = os.path.basename(path)[: -len(_CLOSED_SUFFIX)]
+    total = 0
+    for (day, persona), columns in groups.items():
+        table = pa.Table.from_pydict(columns, schema=EVENT_SCHEMA)
+        target_dir = os.path.join(parquet_dir, f"day={day}", f"persona={persona}")
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, f"part-{stem}.parquet")
+        pq.write_table(table, target + ".tmp", compression="zstd")
+        os.replace(target + ".tmp", target)
+        total += table.num_rows
+    os.remove(path)
+    return total
+
+
+def compact(raw_dir: str = os.path.join(EVENT_DIR, "raw"), parquet_dir: str = os.path.join(EVENT_DIR, "parquet")) -> int:
+    """닫힌 세그먼트 전부 압축 (pyarrow 없으면 0)"""
+    if pa is None:
+        return 0
+    total = 0
+    for path in _closed_segments(raw_dir):
+        total += compact_segment(path, parquet_dir)
+    return total
+
+
+# ============================================
+# 공유 인스턴스
+# ============================================
+_LOG: Optional[EventLog] = None
+_LOG_LOCK = threading.Lock()
+
+
+def get_event_log() -> Optional[EventLog]:
+    """프로세스 전체에서 공유하는 이벤트 로그 (IMD_EVENT_LOG=0이면 None)"""
+    global _LOG
+    if not EVENTS_ENABLED:
+        return None
+    if _LOG is None:
+        with _LOG_LOCK:
+            if _LOG is None:
+                _LOG = EventLog()
+    return _LOG
+
+
+def emit_event(kind: str, session_id: Optional[str], persona: str, stage: str,
+               role: str = "", text: str = "", detail: str = "") -> None:
+    """
+    이벤트 기록
+
+    Args:
+        kind: message(메시지) / click(버튼) / stage(단계 전환, detail=이전 단계) / option(선택지) / lead(리드 제출) / variant(프롬프트 변형)
+        session_id: 세션 토큰 (해시해서 저장)
+    """
+    event_log = get_event_log()
+    if event_log is not None:
+        event_log.emit(kind, session_id, persona, stage, role, text, detail)
+
+
+# ============================================
+# CLI
+# ============================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="대화 이벤트 로그 압축 / 요약")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compact", help="닫힌 JSONL 세그먼트를 Parquet로 변환")
+    stats = sub.add_parser("stats", help="최근 N일 페르소나/종류별 이벤트 수")
+    stats.add_argument("--days", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if pa is None:
+        print("pyarrow가 설치되어 있지 않습니다 (pip install pyarrow).")
+        return 1
+
+    raw_dir, parquet_dir = os.path.join(EVENT_DIR, "raw"), os.path.join(EVENT_DIR, "parquet")
+    if args.command == "compact":
+        recover_segments(raw_dir)
+        print(f"{compact(raw_dir, parquet_dir)}건 변환")
+        return 0
+
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    if not os.path.isdir(parquet_dir):
+        print("압축된 이벤트가 없습니다.")
+        return 0
+    since = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    dataset = ds.dataset(parquet_dir, format="parquet", partitioning="hive")
+    # 파일마다 딕셔너리가 달라서 합친 뒤 group_by
+    table = dataset.to_table(columns=["persona", "kind", "session"], filter=pc.field("day") >= since).unify_dictionaries()
+    counts = table.group_by(["persona", "kind"]).aggregate([("session", "count"), ("session", "count_distinct")])
+    print(f"{'페르소나':<10}{'종류':<10}{'이벤트':>10}{'세션':>8}")
+    for row in sorted(counts.to_pylist(), key=lambda r: (r["persona"], r["kind"])):
+        print(f"{row['persona']:<10}{row['kind']:<10}{row['session_count']:>10}{row['session_count_distinct']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+IMD Sales Bot - Funnel Metrics
+페르소나별 단계 전환 행렬 / 단계 체류 시간 히스토그램 / 전환율을 프로세스 안에서 실시간 집계
+- ConversationManager.update_stage()가 전환마다 record_transition() 호출 → deque에 튜플 하나 추가 (락 없음)
+- 백그라운드에서 IMD_FUNNEL_FOLD_SECONDS(기본 1초)마다 쌓인 전환을 np.add.at으로 한 번에 배열에 반영
+- 모든 카운터는 고정 크기 NumPy 배열 → 대시보드 조회는 로그 스캔 없이 O(1) (배열 크기는 페르소나 × 단계로 고정)
+- IMD_FUNNEL_FLUSH_SECONDS(기본 60초)마다 IMD_FUNNEL_PATH(.npz)에 스냅샷, 재시작하면 이어서 집계
+- 조회: api_server의 GET /funnel, 또는 python funnel_metrics.py report
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import DATA
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+FUNNEL_ENABLED = os.getenv("IMD_FUNNEL", "1") != "0"
+FUNNEL_PATH = os.getenv("IMD_FUNNEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "funnel_metrics.npz"))
+FUNNEL_FLUSH_SECONDS = float(os.getenv("IMD_FUNNEL_FLUSH_SECONDS", "60"))
+FUNNEL_FOLD_SECONDS = float(os.getenv("IMD_FUNNEL_FOLD_SECONDS", "1"))
+
+# 퍼널 순서대로 (목록에 없는 단계는 "other")
+STAGES = (
+    "initial", "symptom_explore", "sleep_check", "digestion_check",
+    "concern_check", "history_check", "tongue_select", "conversion", "complete", "other",
+)
+PERSONAS = tuple(DATA) + ("other",)
+
+# 체류 시간 버킷 상한 (초), 마지막 칸은 그 이상
+STAY_BUCKETS = np.array([2, 5, 10, 20, 30, 60, 120, 300, 600, 1800], dtype=np.float64)
+
+_STAGE_INDEX = {stage: i for i, stage in enumerate(STAGES)}
+_PERSONA_INDEX = {persona: i for i, persona in enumerate(PERSONAS)}
+_OTHER_STAGE = _STAGE_INDEX["other"]
+_OTHER_PERSONA = _PERSONA_INDEX["other"]
+_INITIAL = _STAGE_INDEX["initial"]
+_COMPLETE = _STAGE_INDEX["complete"]
+
+
+def _stage_index(stage: Optional[str]) -> int:
+    return _STAGE_INDEX.get(stage or "", _OTHER_STAGE)
+
+
+def _persona_index(persona: Optional[str]) -> int:
+    return _PERSONA_INDEX.get(persona or "root", _OTHER_PERSONA)
+
+
+# ============================================
+# 집계기
+# ============================================
+class FunnelMetrics:
+    """
+    고정 크기 카운터 (P = 페르소나 수, S = 단계 수, B = 체류 시간 버킷 수)
+    - starts[P]: 퍼널 진입 (initial)
+    - entered[P, S]: 단계 진입 횟수
+    - transitions[P, S, S]: 이전 단계 → 다음 단계
+    - stay_hist[P, S, B]: 단계를 떠날 때까지 머문 시간 분포
+    - stay_sum[P, S]: 체류 시간 합 (평균용)
+    """
+
+    def __init__(self, path: str = FUNNEL_PATH):
+        self.path = path
+        p, s, b = len(PERSONAS), len(STAGES), len(STAY_BUCKETS) + 1
+        self.starts = np.zeros(p, dtype=np.int64)
+        self.entered = np.zeros((p, s), dtype=np.int64)
+        self.transitions = np.zeros((p, s, s), dtype=np.int64)
+        self.stay_hist = np.zeros((p, s, b), dtype=np.int64)
+        self.stay_sum = np.zeros((p, s), dtype=np.float64)
+        self._lock = threading.Lock()
+        self._dirty = False
+        # 아직 배열에 반영 안 된 (페르소나, 이전 단계 또는 -1(시작), 다음 단계, 체류 초 또는 NaN)
+        # deque.append는 스레드 안전 → 방문자 스레드끼리 락을 다투지 않음
+        self._pending: deque = deque()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._load()
+
+    # ---------------- 기록 ----------------
+    def record_start(self, persona: str) -> None:
+        """새 상담 시작 (initial 진입)"""
+        self._pending.append((_persona_index(persona), -1, _INITIAL, np.nan))
+
+    def record_transition(self, persona: str, previous: Optional[str], new: str,
+                          stay_seconds: Optional[float] = None) -> None:
+        """
+        단계 전환 하나
+
+        Args:
+            stay_seconds: 이전 단계에 머문 시간 (세션을 이어받아 시작 시각을 모르면 None)
+        """
+        self._pending.append((
+            _persona_index(persona), _stage_index(previous), _stage_index(new),
+            np.nan if stay_seconds is None else stay_seconds,
+        ))
+
+    def fold(self) -> int:
+        """쌓인 전환을 배열에 반영 (벡터 연산 한 번), 반영한 개수 반환"""
+        with self._lock:
+            n = len(self._pending)
+            if not n:
+                return 0
+            batch = [self._pending.popleft() for _ in range(n)]
+            persona, previous, new, stay = (np.array(column) for column in zip(*batch))
+            persona, previous, new = persona.astype(np.intp), previous.astype(np.intp), new.astype(np.intp)
+
+            start = previous < 0
+            np.add.at(self.starts, persona[start], 1)
+            np.add.at(self.entered, (persona, new), 1)
+            moved = ~start
+            np.add.at(self.transitions, (persona[moved], previous[moved], new[moved]), 1)
+            timed = moved & ~np.isnan(stay)
+            buckets = np.searchsorted(STAY_BUCKETS, stay[timed])
+            np.add.at(self.stay_hist, (persona[timed], previous[timed], buckets), 1)
+            np.add.at(self.stay_sum, (persona[timed], previous[timed]), stay[timed])
+            self._dirty = True
+        return n
+
+    # ---------------- 조회 (O(1), 반영 대기분은 최대 1초치) ----------------
+    def conversion_rate(self, persona: str) -> float:
+        """퍼널 진입 대비 complete 도달 비율"""
+        self.fold()
+        pi = _persona_index(persona)
+        starts = self.starts[pi]
+        return float(self.entered[pi, _COMPLETE] / starts) if starts else 0.0
+
+    def transition_count(self, persona: str, previous: str, new: str) -> int:
+        self.fold()
+        return int(self.transitions[_persona_index(persona), _stage_index(previous), _stage_index(new)])
+
+    def persona_report(self, persona: str) -> Dict:
+        """
+        페르소나 하나의 단계별 요약 (크기는 단계 수로 고정)
+
+        Returns:
+            {'starts', 'completed', 'conversion_rate', 'stages': [{'stage', 'entered', 'left',
+             'stalled', 'avg_stay_s', 'stay_hist'}], 'transitions': {'a→b': n}}
+        """
+        self.fold()
+        pi = _persona_index(persona)
+        with self._lock:
+            starts = int(self.starts[pi])
+            entered = self.entered[pi].copy()
+            transitions = self.transitions[pi].copy()
+            stay_hist = self.stay_hist[pi].copy()
+            stay_sum = self.stay_sum[pi].copy()
+        left = transitions.sum(axis=1)
+        timed = stay_hist.sum(axis=1)
+        avg_stay = np.divide(stay_sum, timed, out=np.zeros_like(stay_sum), where=timed > 0)
+        stages = [
+            {
+                "stage": stage,
+                "entered": int(entered[i]),
+                "left": int(left[i]),
+                # 들어왔지만 아직 다음 단계로 안 간 수 = 진행 중 + 이탈
+                "stalled": int(max(0, entered[i] - left[i])) if stage != "complete" else 0,
+                "avg_stay_s": round(float(avg_stay[i]), 1),
+                "stay_hist": stay_hist[i].tolist(),
+            }
+            for i, stage in enumerate(STAGES)
+            if entered[i] or left[i]
+        ]
+        a_idx, z_idx = np.nonzero(transitions)
+        return {
+            "persona": persona,
+            "starts": starts,
+            "completed": int(entered[_COMPLETE]),
+            "conversion_rate": round(float(entered[_COMPLETE] / starts), 4) if starts else 0.0,
+            "stages": stages,
+            "transitions": {f"{STAGES[a]}→{STAGES[z]}": int(transitions[a, z]) for a, z in zip(a_idx, z_idx)},
+        }
+
+    def report(self) -> Dict:
+        """전체 페르소나 요약 (GET /funnel)"""
+        self.fold()
+        return {
+            "stay_buckets_s": STAY_BUCKETS.tolist() + ["+Inf"],
+            "personas": [self.persona_report(p) for p in PERSONAS if self.starts[_PERSONA_INDEX[p]]
+                         or self.entered[_PERSONA_INDEX[p]].any()],
+        }
+
+    # ---------------- 스냅샷 ----------------
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "starts": self.starts, "entered": self.entered, "transitions": self.transitions,
+            "stay_hist": self.stay_hist, "stay_sum": self.stay_sum,
+        }
+
+    def _load(self) -> None:
+        """이전 스냅샷 이어받기 (페르소나/단계/버킷 구성이 바뀌었으면 새로 시작)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                if tuple(saved["personas"]) != PERSONAS or tuple(saved["stages"]) != STAGES \
+                        or not np.array_equal(saved["stay_buckets"], STAY_BUCKETS):
+                    logger.info("퍼널 스냅샷 구성이 달라 새로 집계합니다: %s", self.path)
+                    return
+                for name, array in self._arrays().items():
+                    array[...] = saved[name]
+        except Exception as e:
+            logger.warning("퍼널 스냅샷 읽기 실패: %s", e)
+
+    def flush(self) -> None:
+        """변경이 있으면 스냅샷 저장 (임시 파일 → 교체)"""
+        self.fold()
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            arrays = {name: array.copy() for name, array in self._arrays().items()}
+            self._dirty = False
+        tmp = self.path + ".tmp.npz"
+        try:
+            np.savez(tmp, personas=np.array(PERSONAS), stages=np.array(STAGES),
+                     stay_buckets=STAY_BUCKETS, **arrays)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("퍼널 스냅샷 저장 실패: %s", e)
+            with self._lock:
+                self._dirty = True
+
+    def start_flusher(self, interval: float = FUNNEL_FLUSH_SECONDS, fold_interval: float = FUNNEL_FOLD_SECONDS) -> None:
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(
+            target=self._run_flusher, args=(interval, fold_interval), name="imd-funnel", daemon=True
+        )
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self, interval: float, fold_interval: float):
+        # 1초마다 반영, interval마다 스냅샷
+        next_flush = interval
+        elapsed = 0.0
+        while not self._stop.wait(fold_interval):
+            elapsed += fold_interval
+            if elapsed >= next_flush:
+                self.flush()
+                next_flush += interval
+            else:
+                self.fold()
+
+
+_FUNNEL: Optional[FunnelMetrics] = None
+_FUNNEL_LOCK = threading.Lock()
+
+
+def get_funnel_metrics() -> FunnelMetrics:
+    """프로세스 전체에서 공유하는 집계기 (처음 부를 때 스냅샷 스레드 시작)"""
+    global _FUNNEL
+    if _FUNNEL is None:
+        with _FUNNEL_LOCK:
+            if _FUNNEL is None:
+                funnel = FunnelMetrics()
+                funnel.start_flusher()
+                _FUNNEL = funnel
+    return _FUNNEL
+
+
+def record_start(persona: str) -> None:
+    if FUNNEL_ENABLED:
+        get_funnel_metrics().record_start(persona)
+
+
+def record_transition(persona: str, previous: Optional[str], new: str, stay_seconds: Optional[float] = None) -> None:
+    if FUNNEL_ENABLED:
+        get_funnel_metrics().record_transition(persona, previous, new, stay_seconds)
+
+
+def funnel_report() -> Dict:
+    return get_funnel_metrics().report()
+
+
+# ============================================
+# CLI
+# ============================================
+def print_report(report: Dict) -> None:
+    for persona in report["personas"]:
+        print(f"\n[{persona['persona']}] 시작 {persona['starts']} / 완료 {persona['completed']} "
+              f"(전환율 {persona['conversion_rate']:.1%})")
+        print(f"  {'단계':<18}{'진입':>7}{'다음 단계로':>11}{'정체':>7}{'평균 체류(s)':>13}")
+        for stage in persona["stages"]:
+            print(f"  {stage['stage']:<18}{stage['entered']:>7}{stage['left']:>11}{stage['stalled']:>7}"
+                  f"{stage['avg_stay_s']:>13}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="퍼널 집계 스냅샷 조회")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="페르소나별 단계 진입/정체/체류 시간/전환율")
+    report.add_argument("--path", default=FUNNEL_PATH)
+    report.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"스냅샷이 없습니다: {args.path}")
+        return 1
+    data = FunnelMetrics(args.path).report()
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+    else:
+        print_report(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+IMD Sales Bot - Funnel Script
+버튼으로 진행되는 정해진 상담 단계를 LLM 호출 없이 템플릿으로 응답하는 상태 머신
+- 상태/전이/응답 문구는 config.py 페르소나별 FUNNEL_SCRIPT에 데이터로 정의
+- 스크립트에 없는 입력(자유 입력)만 LLM으로 보냄
+"""
+
+from typing import Dict, List, Optional
+
+from config import get_config
+
+
+class FunnelScript:
+    """
+    페르소나 하나의 스크립트 상태 머신
+
+    데이터 형식 (config.py):
+        "FUNNEL_SCRIPT": {
+            "<현재 단계>": {
+                "slot": "age_group",          # 선택값을 저장할 슬롯 이름
+                "next": "concern_check",      # 기본 다음 단계
+                "options": {
+                    "<버튼 문구>": "<응답 템플릿>",
+                    "<버튼 문구>": {"reply": "...", "next": "<다른 단계>"},
+                },
+            },
+        }
+    """
+
+    def __init__(self, client_id: str, script: Dict):
+        self.client_id = client_id
+        # 문자열/딕셔너리 두 형식을 (reply, next)로 미리 정규화
+        self._states: Dict[str, Dict] = {}
+        for stage, state in script.items():
+            options = {}
+            for label, option in state.get("options", {}).items():
+                if isinstance(option, str):
+                    option = {"reply": option}
+                options[label.strip()] = {
+                    "reply": option["reply"],
+                    "next": option.get("next", state.get("next", stage)),
+                }
+            self._states[stage] = {"slot": state.get("slot"), "options": options}
+
+    def is_scripted(self, stage: str) -> bool:
+        return stage in self._states
+
+    def options(self, stage: str) -> List[str]:
+        """해당 단계의 버튼 문구 (스크립트가 없으면 빈 리스트)"""
+        state = self._states.get(stage)
+        return list(state["options"]) if state else []
+
+    def match(self, stage: str, text: str) -> Optional[Dict]:
+        """
+        입력이 현재 단계의 스크립트 선택지와 일치하면 LLM 없이 응답 생성
+
+        Returns:
+            generate_ai_turn()과 같은 형식의 dict, 스크립트 밖 입력이면 None
+        """
+        state = self._states.get(stage)
+        if not state:
+            return None
+        option = state["options"].get(text.strip())
+        if option is None:
+            return None
+
+        next_stage = option["next"]
+        slots = {state["slot"]: text.strip()} if state["slot"] else {}
+        return {
+            "reply": option["reply"],
+            "stage": next_stage,
+            "route": None,
+            "buttons": self.options(next_stage),
+            "slots": slots,
+            "scripted": True,
+        }
+
+
+# ============================================
+# 페르소나별 스크립트 캐시
+# ============================================
+_SCRIPTS: Dict[str, FunnelScript] = {}
+
+
+def get_funnel_script(client_id: str) -> FunnelScript:
+    """client_id별 컴파일된 스크립트 (프로세스당 1회 생성)"""
+    script = _SCRIPTS.get(client_id)
+    if script is None:
+        script = FunnelScript(client_id, get_config(client_id).get("FUNNEL_SCRIPT", {}))
+        _SCRIPTS[client_id] = script
+    return script
+
+
+def get_scripted_turn(client_id: str, stage: str, text: str) -> Optional[Dict]:
+    """스크립트 단계의 정해진 입력이면 템플릿 응답, 아니면 None (→ LLM)"""
+    return get_funnel_script(client_id).match(stage, text)
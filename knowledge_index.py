@@ -0,0 +1,226 @@
+"""
+IMD Sales Bot - Knowledge Retrieval
+시스템 프롬프트의 지식 섹션(예: root의 [IMD Knowledge Base])을 항목 단위로 잘라 BM25 색인,
+매 턴 전체 대신 질문과 관련된 상위 k개 항목만 프롬프트에 넣어 입력 토큰/지연 절감
+- 색인: 프롬프트 문자열마다 한 번 (SYSTEM_PROMPTS는 prompt_engine 불러올 때 미리 생성)
+- 검색: (페르소나 프롬프트, 정규화된 질문) 단위로 결과 캐시 → 같은 질문은 dict 조회 한 번
+- 관련 항목이 하나도 없으면 섹션 앞쪽 항목으로 대체 (근거 없는 답변 방지)
+- 확인: python knowledge_index.py search root "가격이 얼마예요", python knowledge_index.py stats
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from text_norm import query_terms
+
+# ============================================
+# 설정
+# ============================================
+KB_RETRIEVAL_ENABLED = os.getenv("IMD_KB_RETRIEVAL", "1") != "0"
+KB_TOP_K = int(os.getenv("IMD_KB_TOP_K", "3"))
+
+# 페르소나 → 검색 대상 섹션 헤더 (접두어 일치). 대화 흐름/규칙 섹션은 항상 전체 포함
+KNOWLEDGE_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "root": ("[IMD Knowledge Base",),
+}
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_HEADER_RE = re.compile(r"^\[[^\]]+\]")
+_ITEM_RE = re.compile(r"^\d+\.\s*(.+)$")
+_BULLET_RE = re.compile(r"^\s*[-*]\s+(.+)$")
+
+
+# ============================================
+# 섹션 분리 / 항목 단위 청크
+# ============================================
+class KnowledgeSection:
+    """검색 대상 섹션 하나 (헤더 + 항목)"""
+
+    def __init__(self, header: str, chunks: List[str]):
+        self.header = header
+        self.chunks = chunks
+
+
+def _chunk_section(lines: List[str]) -> List[str]:
+    """
+    번호 항목마다, 하위 불릿이 있으면 불릿마다 하나 ("항목 제목: 불릿 내용")
+    예: "2. 핵심 기술:" + "- **Revenue Mirror**: ..." → "핵심 기술: **Revenue Mirror**: ..."
+    """
+    chunks: List[str] = []
+    title, body = "", ""
+    for line in lines:
+        item = _ITEM_RE.match(line.strip())
+        bullet = _BULLET_RE.match(line)
+        if item:
+            if body:
+                chunks.append(body)
+            text = item.group(1).strip()
+            title, _, rest = text.partition(":")
+            body = text if rest.strip() else ""
+        elif bullet:
+            if body and body != title:
+                chunks.append(body)
+            body = ""
+            chunks.append(f"{title}: {bullet.group(1).strip()}" if title else bullet.group(1).strip())
+        elif line.strip() and body:
+            body += " " + line.strip()
+    if body:
+        chunks.append(body)
+    return chunks
+
+
+def split_prompt(prompt: str, headers: Tuple[str, ...]) -> Tuple[str, List[KnowledgeSection]]:
+    """
+    프롬프트 → (검색 대상 섹션을 뺀 나머지, 검색 대상 섹션들)
+
+    섹션은 줄 처음의 [헤더]부터 다음 [헤더] 전까지
+    """
+    core: List[str] = []
+    sections: List[KnowledgeSection] = []
+    current: Optional[Tuple[str, List[str]]] = None
+    for line in prompt.splitlines():
+        if _HEADER_RE.match(line):
+            if current is not None:
+                sections.append(KnowledgeSection(current[0], _chunk_section(current[1])))
+                current = None
+            if line.startswith(headers):
+                current = (line.strip(), [])
+                continue
+        if current is not None:
+            current[1].append(line)
+        else:
+            core.append(line)
+    if current is not None:
+        sections.append(KnowledgeSection(current[0], _chunk_section(current[1])))
+    return "\n".join(core), [s for s in sections if s.chunks]
+
+
+# ============================================
+# BM25
+# ============================================
+def _terms(text: str) -> List[str]:
+    """정규화 토큰 + 토큰 안 글자 2-gram (복합어 "성형외과" ↔ "성형" 부분 일치)"""
+    terms: List[str] = []
+    for token in query_terms(text):
+        terms.append(token)
+        terms.extend(token[i:i + 2] for i in range(len(token) - 1) if len(token) > 2)
+    return terms
+
+
+class BM25Index:
+    def __init__(self, chunks: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        docs = [Counter(_terms(chunk)) for chunk in chunks]
+        self._lengths = [sum(doc.values()) for doc in docs]
+        self._avg_length = (sum(self._lengths) / len(docs)) if docs else 0.0
+        # 단어 → [(문서 번호, 빈도)]
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        for i, doc in enumerate(docs):
+            for term, tf in doc.items():
+                self._postings.setdefault(term, []).append((i, tf))
+        n = len(docs)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """상위 k개 (문서 번호, 점수), 점수 0인 문서 제외"""
+        scores: Dict[int, float] = {}
+        for term in set(_terms(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1.0))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+# ============================================
+# 프롬프트 단위 색인 / 검색 캐시
+# ============================================
+class PromptKnowledge:
+    """프롬프트 하나의 분리 결과 + 섹션별 색인"""
+
+    def __init__(self, client_id: str, prompt: str):
+        self.core, self.sections = split_prompt(prompt, KNOWLEDGE_SECTIONS.get(client_id, ()))
+        self.indexes = [BM25Index(section.chunks) for section in self.sections]
+
+    def retrieve(self, query: str, k: int = KB_TOP_K) -> str:
+        """질문 관련 항목만 섹션 형식으로 (원래 순서 유지)"""
+        blocks = []
+        for section, index in zip(self.sections, self.indexes):
+            hits = sorted(i for i, _ in index.search(query, k)) or list(range(min(k, len(section.chunks))))
+            lines = "\n".join(f"- {section.chunks[i]}" for i in hits)
+            blocks.append(f"{section.header}\n{lines}")
+        return "\n\n".join(blocks)
+
+
+@lru_cache(maxsize=64)
+def get_prompt_knowledge(client_id: str, prompt: str) -> PromptKnowledge:
+    return PromptKnowledge(client_id, prompt)
+
+
+@lru_cache(maxsize=4096)
+def _retrieve_cached(client_id: str, prompt: str, query_key: Tuple[str, ...], k: int) -> str:
+    return get_prompt_knowledge(client_id, prompt).retrieve(" ".join(query_key), k)
+
+
+def retrieve_knowledge(client_id: str, prompt: str, query: str, k: int = KB_TOP_K) -> str:
+    """표현만 다른 같은 질문은 정규화 토큰이 같으므로 캐시 한 번"""
+    return _retrieve_cached(client_id, prompt, query_terms(query), k)
+
+
+def has_knowledge(client_id: str) -> bool:
+    return KB_RETRIEVAL_ENABLED and client_id in KNOWLEDGE_SECTIONS
+
+
+# ============================================
+# CLI
+# ============================================
+def main(argv: Optional[List[str]] = None) -> int:
+    from context_window import estimate_tokens
+    from prompt_engine import SYSTEM_PROMPTS
+
+    parser = argparse.ArgumentParser(description="페르소나 지식 섹션 검색 확인")
+    sub = parser.add_subparsers(dest="command", required=True)
+    search = sub.add_parser("search", help="질문에 들어갈 지식 항목")
+    search.add_argument("client_id")
+    search.add_argument("query")
+    search.add_argument("--k", type=int, default=KB_TOP_K)
+    sub.add_parser("stats", help="페르소나별 항목 수 / 프롬프트 토큰 (전체 vs 검색)")
+    args = parser.parse_args(argv)
+
+    if args.command == "search":
+        knowledge = get_prompt_knowledge(args.client_id, SYSTEM_PROMPTS[args.client_id])
+        for section, index in zip(knowledge.sections, knowledge.indexes):
+            for i, score in index.search(args.query, args.k):
+                print(f"{score:6.2f}  {section.chunks[i]}")
+        print()
+        print(knowledge.retrieve(args.query, args.k))
+        return 0
+
+    print(f"{'persona':<10}{'chunks':>8}{'full tok':>10}{'core tok':>10}{'top-k tok':>11}")
+    for client_id in KNOWLEDGE_SECTIONS:
+        prompt = SYSTEM_PROMPTS[client_id]
+        knowledge = get_prompt_knowledge(client_id, prompt)
+        chunks = sum(len(section.chunks) for section in knowledge.sections)
+        retrieved = knowledge.retrieve("가격", KB_TOP_K)
+        print(f"{client_id:<10}{chunks:>8}{estimate_tokens(prompt):>10}{estimate_tokens(knowledge.core):>10}"
+              f"{estimate_tokens(knowledge.core) + estimate_tokens(retrieved):>11}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,17 @@
 IMD Sales / Medical Bot - Lead Handler
 구글 시트에 리드(문의/견적 요청) 저장하는 모듈
 - 증상, 혀 타입, 건강 점수 저장 지원
+- 로컬 리드 저장소(lead_store)에 먼저 기록하고, 시트 등 싱크(lead_sinks)로는 백그라운드 배치로 내보냄
 """
 
-from datetime import datetime
+import json
+import os
 from typing import Dict, Tuple, List, Optional
 
-import streamlit as st
+try:
+    import streamlit as st
+except Exception:
+    st = None  # type: ignore
 
 try:
     import gspread
@@ -16,6 +21,31 @@ except Exception:
     gspread = None
     Credentials = None  # type: ignore
 
+from lead_sinks import compile_columns, get_lead_fanout
+from lead_store import get_idempotency_index, get_lead_store
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+def _secret(*names: str):
+    """st.secrets → 환경변수 순서로 첫 번째 값 (HTTP API 등 Streamlit 밖에서도 동작)"""
+    for name in names:
+        value = None
+        if st is not None:
+            try:
+                value = st.secrets.get(name)
+            except Exception:
+                value = None
+        if not value:
+            value = os.getenv(name)
+            # 서비스 계정은 환경변수에 JSON 문자열로 넣음
+            if value and value.lstrip().startswith("{"):
+                value = json.loads(value)
+        if value:
+            return value
+    return None
+
 
 # 기본 컬럼 정의
 DEFAULT_SHEET_COLUMNS: List[str] = [
@@ -53,16 +83,8 @@ class LeadHandler:
 
         # 시크릿에서 서비스 계정/시트 ID 가져오기
         try:
-            service_info = (
-                st.secrets.get("GOOGLE_SERVICE_ACCOUNT")
-                or st.secrets.get("gcp_service_account")
-                or st.secrets.get("gspread_service_account")
-            )
-            sheet_id = (
-                st.secrets.get("GOOGLE_SHEET_ID")
-                or st.secrets.get("LEAD_SHEET_ID")
-                or st.secrets.get("SPREADSHEET_ID")
-            )
+            service_info = _secret("GOOGLE_SERVICE_ACCOUNT", "gcp_service_account", "gspread_service_account")
+            sheet_id = _secret("GOOGLE_SHEET_ID", "LEAD_SHEET_ID", "SPREADSHEET_ID")
 
             if not service_info or not sheet_id:
                 # 시트 미연결 상태 (하지만 앱은 죽지 않게)
@@ -88,10 +110,8 @@ class LeadHandler:
                 self.columns = existing
 
         except Exception as e:
-            try:
-                st.error(f"⚠️ 구글 시트 초기화 실패: {e}")
-            except Exception:
-                pass
+            # 방문자 화면에는 띄우지 않고 운영 로그로만
+            logger.warning("구글 시트 초기화 실패: %s", e)
             self.client = None
             self.sheet = None
 
@@ -102,28 +122,15 @@ class LeadHandler:
         """
         입력 딕셔너리를 현재 시트 컬럼 순서에 맞춰 한 줄 리스트로 변환
         """
-        row: List[str] = []
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        for col in self.columns:
-            key = col.strip()
-            if key == "timestamp":
-                row.append(now_str)
-            else:
-                value = data.get(key, "")
-                # dict/list면 문자열로 캐스팅
-                if isinstance(value, (dict, list)):
-                    value = str(value)
-                row.append(str(value) if value is not None else "")
-
-        return row
+        # 컬럼 튜플별로 컴파일된 매퍼 재사용 (헤더가 바뀌면 새로 컴파일)
+        return compile_columns(tuple(self.columns))(data)
 
     # --------------------------------------------------
     # 3) 외부에서 호출: 리드 저장
     # --------------------------------------------------
     def save_lead(self, data: Dict) -> Tuple[bool, str]:
         """
-        리드를 구글 시트에 저장
+        리드를 로컬 저장소에 기록 (구글 시트 등 싱크는 싱크별 스레드가 배치로 추가)
         Args:
             data: {
                 'name': ...,
@@ -134,17 +141,59 @@ class LeadHandler:
                 'preferred_date': ...,
                 'chat_summary': ...,
                 'source': ...,
-                'type': ...
+                'type': ...,
+                'client_id': ...,  # 페르소나
+                'idempotency_key': ...,  # lead_store.idempotency_key() (없으면 중복 검사 안 함)
             }
 
         Returns:
-            (성공여부, 메시지)
+            (성공여부, 메시지) - 중복 제출이면 첫 제출의 결과
         """
+        # 더블클릭 / 느린 저장 뒤 재시도 → 같은 키면 첫 제출 결과를 그대로 반환
+        key = data.get("idempotency_key") or ""
+        if not key:
+            return self._save(data, "")
+
+        index = get_idempotency_index()
+        cached = index.begin(key)
+        if cached is not None:
+            return cached
+        result: Tuple[bool, str] = (False, "리드 저장 실패")
+        try:
+            result = self._save(data, key)
+        finally:
+            index.finish(key, result)
+        return result
+
+    def _save(self, data: Dict, key: str) -> Tuple[bool, str]:
+        """로컬 저장소 기록 + 싱크 깨우기 (로컬 저장 실패 시 시트에 직접)"""
+        # 싱크를 먼저 준비 (새 싱크의 커서는 등록 시점의 마지막 id → 이번 리드가 빠지지 않도록 저장 전에)
+        try:
+            fanout = get_lead_fanout(self)
+        except Exception as e:
+            logger.warning("리드 싱크 시작 실패 (로컬 저장소에는 기록): %s", e)
+            fanout = None
+
+        try:
+            _, created = get_lead_store().insert_once(data, key)
+            stored = True
+        except Exception as e:
+            logger.warning("로컬 리드 저장 실패, 시트에 직접 기록: %s", e)
+            stored = created = False
+
+        if created and fanout is not None:
+            # 싱크 스레드만 깨우고 바로 반환 (느린 싱크가 방문자를 붙잡지 않음)
+            fanout.wake()
+
         # 시트 미연결 상태
         if self.sheet is None:
             # 개발 / 데모 환경에서는 그냥 성공으로 처리
             return True, "구글 시트 미연결 상태 (데모 모드로 처리했습니다)."
 
+        if stored:
+            # 이미 저장된 키(created=False)도 첫 제출과 같은 결과
+            return True, "리드가 성공적으로 저장되었습니다."
+
         try:
             row = self._build_row(data)
             self.sheet.append_row(row)
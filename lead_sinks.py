@@ -0,0 +1,435 @@
+"""
+IMD Sales Bot - Lead Sinks
+로컬 리드 저장소(lead_store)의 리드를 여러 목적지(싱크)로 나눠 내보내기
+- 싱크: 구글 시트 / SQLite(내보내기용 평면 테이블) / CSV / JSONL / 웹훅
+- 싱크마다 스레드 하나 + 커서 하나 → 느리거나 죽은 싱크가 다른 싱크나 방문자 응답을 막지 않음
+- 싱크마다 배치 크기 / 전송 주기 / 재시도 횟수·간격을 따로 설정
+- 컬럼 매핑은 스키마(컬럼 튜플)당 한 번만 컴파일해서 재사용
+- 새로 설정한 싱크는 그 시점의 마지막 리드 이후부터 전송 (기존 리드까지 보내려면 ;backfill=1)
+- 전송은 최소 한 번(at-least-once): 싱크가 쓰기에 성공한 뒤 응답이 실패/타임아웃이면 커서가 그대로라
+  다음 재시도에서 같은 배치를 다시 보냄 → sqlite 싱크(lead_id upsert) 외에는 중복 행이 생길 수 있으므로
+  받는 쪽에서 lead_id로 중복 제거 (시트는 append_rows라 중복 행이 그대로 남음)
+
+설정 (IMD_LEAD_SINKS, 쉼표로 구분, 옵션은 ;key=value):
+    IMD_LEAD_SINKS="csv:exports/leads.csv, jsonl:exports/leads.jsonl;batch=1000"
+    IMD_LEAD_SINKS="sqlite:exports/leads_export.db, webhook:http://127.0.0.1:8765/leads;retries=5;timeout=3"
+    옵션: batch, interval(초), retries, backoff(초, 재시도마다 2배), timeout(웹훅), backfill(1이면 기존 리드부터)
+구글 시트는 LeadHandler에 시트가 연결돼 있으면 자동으로 추가 (IMD_LEAD_EXPORT_BATCH / IMD_LEAD_EXPORT_SECONDS)
+
+웹훅 로컬 테스트:
+    python lead_sinks.py webhook-stub --port 8765     # 받은 배치를 stdout에 출력
+"""
+
+import argparse
+import atexit
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from lead_store import LeadStore, get_lead_store
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+LEAD_SINKS = os.getenv("IMD_LEAD_SINKS", "")
+LEAD_EXPORT_SECONDS = float(os.getenv("IMD_LEAD_EXPORT_SECONDS", "30"))
+LEAD_EXPORT_BATCH = int(os.getenv("IMD_LEAD_EXPORT_BATCH", "100"))
+
+# 싱크 종류별 기본 정책: (batch, interval, retries, backoff)
+SINK_DEFAULTS: Dict[str, Tuple[int, float, int, float]] = {
+    "sheets": (LEAD_EXPORT_BATCH, LEAD_EXPORT_SECONDS, 3, 2.0),
+    "sqlite": (500, 5.0, 2, 0.5),
+    "csv": (500, 5.0, 2, 0.5),
+    "jsonl": (500, 5.0, 2, 0.5),
+    "webhook": (50, 10.0, 4, 1.0),
+}
+
+# 컬럼 매핑에서 "접수 시각"으로 취급하는 키
+TIMESTAMP_KEY = "timestamp"
+
+
+# ============================================
+# 컬럼 매핑 (스키마당 한 번 컴파일)
+# ============================================
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    # dict/list면 문자열로 캐스팅
+    return str(value)
+
+
+class RowMapper:
+    """컬럼 순서 → 리드 딕셔너리를 한 줄 리스트로 바꾸는 함수 묶음"""
+
+    __slots__ = ("columns", "_getters")
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+        getters: List[Callable[[Dict], str]] = []
+        for col in self.columns:
+            key = col.strip()
+            if key == TIMESTAMP_KEY:
+                getters.append(lambda data: data.get(TIMESTAMP_KEY) or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            else:
+                getters.append(lambda data, key=key: _cell(data.get(key, "")))
+        self._getters = tuple(getters)
+
+    def __call__(self, data: Dict) -> List[str]:
+        return [getter(data) for getter in self._getters]
+
+
+@lru_cache(maxsize=32)
+def compile_columns(columns: Tuple[str, ...]) -> RowMapper:
+    """같은 컬럼 튜플이면 같은 RowMapper 재사용"""
+    return RowMapper(columns)
+
+
+# ============================================
+# 싱크
+# ============================================
+class LeadSink:
+    """
+    리드 목적지 하나
+    - write(batch)는 싱크 전용 스레드에서만 호출됨 (실패 시 예외 → 재시도 후 커서 유지)
+    - batch: [(리드 id, 리드 딕셔너리), ...] id 오름차순
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, batch: Optional[int] = None, interval: Optional[float] = None,
+                 retries: Optional[int] = None, backoff: Optional[float] = None, backfill: bool = False):
+        default_batch, default_interval, default_retries, default_backoff = SINK_DEFAULTS[self.kind]
+        self.name = name
+        # 커서가 없는 (처음 설정한) 싱크일 때만 의미 있음
+        self.backfill = backfill
+        self.batch = batch or default_batch
+        self.interval = interval if interval is not None else default_interval
+        self.retries = retries if retries is not None else default_retries
+        self.backoff = backoff if backoff is not None else default_backoff
+
+    def write(self, batch: List[Tuple[int, Dict]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SheetsSink(LeadSink):
+    """
+    구글 워크시트 (append_rows 1회 = API 호출 1회)
+    멱등이 아님: append_rows가 시트에 반영된 뒤 타임아웃이 나면 재시도에서 같은 행이 한 번 더 추가됨
+    """
+
+    kind = "sheets"
+
+    def __init__(self, worksheet, columns: Sequence[str], name: str = "sheets", **policy):
+        super().__init__(name, **policy)
+        self.worksheet = worksheet
+        self.mapper = compile_columns(tuple(columns))
+
+    def write(self, batch):
+        self.worksheet.append_rows([self.mapper(data) for _, data in batch])
+
+
+class SQLiteSink(LeadSink):
+    """내보내기용 SQLite 평면 테이블 (lead_id 기준 upsert라 재시도해도 중복 없음)"""
+
+    kind = "sqlite"
+
+    def __init__(self, path: str, columns: Sequence[str], name: str = "sqlite", table: str = "leads_export", **policy):
+        super().__init__(name, **policy)
+        self.path = path
+        self.mapper = compile_columns(tuple(columns))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        quoted = ", ".join(f'"{c.strip()}" TEXT' for c in self.mapper.columns)
+        placeholders = ", ".join("?" for _ in range(len(self.mapper.columns) + 1))
+        self._insert = f'INSERT OR REPLACE INTO "{table}" VALUES ({placeholders})'
+        # 싱크 스레드 전용 연결
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (lead_id INTEGER PRIMARY KEY, {quoted})')
+
+    def write(self, batch):
+        with self._conn:
+            self._conn.executemany(self._insert, [(lead_id, *self.mapper(data)) for lead_id, data in batch])
+
+    def close(self):
+        self._conn.close()
+
+
+class CsvSink(LeadSink):
+    """CSV 파일 추가 (새 파일이면 헤더부터)"""
+
+    kind = "csv"
+
+    def __init__(self, path: str, columns: Sequence[str], name: str = "csv", **policy):
+        super().__init__(name, **policy)
+        self.path = path
+        self.mapper = compile_columns(tuple(columns))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, batch):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(("lead_id",) + self.mapper.columns)
+            writer.writerows([lead_id, *self.mapper(data)] for lead_id, data in batch)
+
+
+class JsonlSink(LeadSink):
+    """JSON lines 파일 추가 (컬럼 매핑 없이 리드 원본 그대로)"""
+
+    kind = "jsonl"
+
+    def __init__(self, path: str, name: str = "jsonl", **policy):
+        super().__init__(name, **policy)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, batch):
+        lines = [json.dumps({"lead_id": lead_id, **data}, ensure_ascii=False, default=str) for lead_id, data in batch]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class WebhookSink(LeadSink):
+    """HTTP POST {"leads": [...]} (2xx가 아니면 실패 → 재시도)"""
+
+    kind = "webhook"
+
+    def __init__(self, url: str, name: str = "webhook", timeout: float = 5.0, **policy):
+        super().__init__(name, **policy)
+        self.url = url
+        self.timeout = timeout
+
+    def write(self, batch):
+        body = json.dumps(
+            {"leads": [{"lead_id": lead_id, **data} for lead_id, data in batch]}, ensure_ascii=False, default=str
+        ).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"웹훅 응답 {response.status}")
+
+
+def parse_sink_specs(specs: str, columns: Sequence[str]) -> List[LeadSink]:
+    """IMD_LEAD_SINKS 문자열 → 싱크 목록 (형식은 모듈 설명 참고)"""
+    sinks: List[LeadSink] = []
+    for spec in filter(None, (s.strip() for s in specs.split(","))):
+        target, *options = spec.split(";")
+        kind, _, location = target.partition(":")
+        kind = kind.strip().lower()
+        policy: Dict = {}
+        for option in options:
+            key, _, value = option.partition("=")
+            key = key.strip()
+            if key in ("batch", "retries"):
+                policy[key] = int(value)
+            elif key in ("interval", "backoff", "timeout"):
+                policy[key] = float(value)
+            elif key == "name":
+                policy[key] = value.strip()
+            elif key == "backfill":
+                policy[key] = value.strip().lower() in ("1", "true", "yes")
+        if kind not in SINK_DEFAULTS or kind == "sheets" or not location:
+            logger.warning("알 수 없는 리드 싱크 설정 무시: %s", spec)
+            continue
+        if kind != "webhook":
+            policy.pop("timeout", None)
+        location = location.strip()
+        if kind == "sqlite":
+            sinks.append(SQLiteSink(location, columns, **policy))
+        elif kind == "csv":
+            sinks.append(CsvSink(location, columns, **policy))
+        elif kind == "jsonl":
+            sinks.append(JsonlSink(location, **policy))
+        else:
+            sinks.append(WebhookSink(location, **policy))
+    return sinks
+
+
+# ============================================
+# 싱크별 전송 스레드
+# ============================================
+class SinkWorker:
+    """
+    싱크 하나의 커서 이후 리드를 배치로 전송 (실패 시 backoff 재시도, 그래도 안 되면 다음 주기)
+    커서는 쓰기가 성공한 뒤에만 전진 → 최소 한 번 전송 (모듈 설명 참고)
+    """
+
+    def __init__(self, store: LeadStore, sink: LeadSink):
+        self.store = store
+        self.sink = sink
+        # 처음 보는 싱크면 지금의 마지막 id부터 (backfill이면 0부터)
+        store.init_cursor(sink.name, sink.backfill)
+        self.sent = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"imd-lead-{sink.name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        """새 리드 도착 (다음 주기를 기다리지 않고 전송)"""
+        self._wake.set()
+
+    def export_once(self, retry: bool = True) -> int:
+        """
+        배치 하나 전송, 보낸 행 수 반환 (실패 시 커서 유지 → 다음에 다시)
+        write가 실제로는 반영됐는데 예외가 난 경우에도 다시 보내므로 중복 가능 (at-least-once)
+        """
+        with self._lock:
+            cursor = self.store.get_cursor(self.sink.name)
+            pending = self.store.after(cursor, self.sink.batch)
+            if not pending:
+                return 0
+            attempts = 1 + (self.sink.retries if retry else 0)
+            for attempt in range(attempts):
+                try:
+                    self.sink.write(pending)
+                    break
+                except Exception as e:
+                    self.failures += 1
+                    if attempt + 1 == attempts:
+                        logger.warning(
+                            "리드 싱크 %s 전송 실패 (%d건, 다음 주기에 재시도): %s", self.sink.name, len(pending), e
+                        )
+                        return 0
+                    time.sleep(self.sink.backoff * (2 ** attempt))
+            self.store.set_cursor(self.sink.name, pending[-1][0])
+            self.sent += len(pending)
+            return len(pending)
+
+    def flush(self, retry: bool = True) -> int:
+        """밀린 행을 모두 전송"""
+        total = 0
+        while True:
+            sent = self.export_once(retry)
+            total += sent
+            if sent < self.sink.batch:
+                return total
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.sink.interval)
+            self._wake.clear()
+            self.flush()
+
+
+class LeadFanout:
+    """싱크 워커 모음 (방문자 경로에서는 wake()만 호출)"""
+
+    def __init__(self, store: LeadStore):
+        self.store = store
+        self.workers: Dict[str, SinkWorker] = {}
+        self._lock = threading.Lock()
+
+    def add(self, sink: LeadSink) -> SinkWorker:
+        with self._lock:
+            if sink.name in self.workers:
+                raise ValueError(f"리드 싱크 이름 중복: {sink.name}")
+            worker = self.workers[sink.name] = SinkWorker(self.store, sink)
+        worker.start()
+        return worker
+
+    def wake(self):
+        for worker in list(self.workers.values()):
+            worker.wake()
+
+    def flush(self, retry: bool = True) -> Dict[str, int]:
+        return {name: worker.flush(retry) for name, worker in list(self.workers.items())}
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            name: {"kind": w.sink.kind, "sent": w.sent, "failures": w.failures,
+                   "batch": w.sink.batch, "interval": w.sink.interval, "retries": w.sink.retries}
+            for name, w in list(self.workers.items())
+        }
+
+
+_FANOUT: Optional[LeadFanout] = None
+_FANOUT_LOCK = threading.Lock()
+
+
+def get_lead_fanout(handler=None) -> LeadFanout:
+    """
+    프로세스 전체에서 공유하는 팬아웃 (처음 부를 때 IMD_LEAD_SINKS 싱크 시작)
+
+    Args:
+        handler: LeadHandler - 시트가 연결돼 있으면 시트 싱크를 (한 번만) 추가
+    """
+    global _FANOUT
+    with _FANOUT_LOCK:
+        if _FANOUT is None:
+            from lead_handler import DEFAULT_SHEET_COLUMNS
+            fanout = LeadFanout(get_lead_store())
+            columns = handler.columns if handler is not None else DEFAULT_SHEET_COLUMNS
+            for sink in parse_sink_specs(LEAD_SINKS, columns):
+                fanout.add(sink)
+            # 종료 시 남은 행 전송 (재시도 없이 한 번만 → 죽은 싱크가 종료를 붙잡지 않게)
+            atexit.register(fanout.flush, False)
+            _FANOUT = fanout
+        if handler is not None and handler.sheet is not None and "sheets" not in _FANOUT.workers:
+            _FANOUT.add(SheetsSink(handler.sheet, handler.columns))
+    return _FANOUT
+
+
+# ============================================
+# 웹훅 수신 stub (로컬 테스트용)
+# ============================================
+class _WebhookStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        for lead in payload.get("leads", []):
+            print(json.dumps(lead, ensure_ascii=False), flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="리드 싱크 도구")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stub = sub.add_parser("webhook-stub", help="받은 리드 배치를 stdout에 출력하는 로컬 웹훅")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), _WebhookStubHandler)
+    print(f"웹훅 stub: http://{args.host}:{args.port}/ (Ctrl+C 종료)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+IMD Sales Bot - Lead Store
+리드를 먼저 로컬 SQLite에 저장 (시트/CSV/웹훅 등은 lead_sinks가 여기서 커서 기준으로 내보냄)
+- 인덱스: 접수 시각 / 연락처 / 출처(source) / 페르소나(client_id) → 운영 조회는 시트 대신 여기서
+- 내보내기 커서: 싱크 이름별 마지막으로 보낸 id (export_cursor 테이블)
+- 방문자 요청 경로에는 SQLite INSERT 한 번만 (외부 API 대기 없음)
+- 중복 제출 방지: 세션+연락처+페르소나로 만든 멱등 키 → 메모리 LRU 인덱스 + idem_key 유니크 인덱스
+
+사용 예:
+    python lead_store.py find --contact 010-1234-5678
+    python lead_store.py find --source "피부과 리프팅" --since 2026-10-01
+    python lead_store.py stats
+    python lead_store.py export        # 밀린 행을 모든 싱크로 즉시 전송
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+LEAD_DB_PATH = os.getenv("IMD_LEAD_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "leads.db"))
+# 메모리에 들고 있는 최근 제출 결과 수 (넘치면 오래된 것부터 버리고 로컬 저장소로 확인)
+LEAD_IDEM_CACHE = int(os.getenv("IMD_LEAD_IDEM_CACHE", "10000"))
+
+
+# ============================================
+# 로컬 저장소
+# ============================================
+class LeadStore:
+    """리드 원본 저장소 (시트는 여기서 내보낸 사본)"""
+
+    def __init__(self, path: str = LEAD_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        # Streamlit 스크립트 스레드 + 내보내기 스레드가 연결 하나를 락으로 공유
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leads ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL, "
+                "contact TEXT NOT NULL DEFAULT '', source TEXT NOT NULL DEFAULT '', "
+                "client_id TEXT NOT NULL DEFAULT '', name TEXT NOT NULL DEFAULT '', data TEXT NOT NULL, "
+                "idem_key TEXT NOT NULL DEFAULT '')"
+            )
+            # idem_key 이전에 만든 DB
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(leads)")}
+            if "idem_key" not in columns:
+                self._conn.execute("ALTER TABLE leads ADD COLUMN idem_key TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_idem ON leads (idem_key) WHERE idem_key != ''"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_created ON leads (created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_contact ON leads (contact, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_source ON leads (source, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_client ON leads (client_id, created_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS export_cursor (sink TEXT PRIMARY KEY, last_id INTEGER NOT NULL)"
+            )
+
+    @staticmethod
+    def normalize_contact(contact: str) -> str:
+        """조회용 연락처 (숫자만)"""
+        return "".join(c for c in str(contact or "") if c.isdigit())
+
+    def insert(self, data: Dict) -> int:
+        """
+        리드 한 건 저장
+
+        Returns:
+            리드 id (내보내기 커서 기준)
+        """
+        return self.insert_once(data)[0]
+
+    def insert_once(self, data: Dict, idem_key: str = "") -> Tuple[int, bool]:
+        """
+        멱등 키가 처음이면 저장, 이미 있으면 기존 리드 id
+
+        Returns:
+            (리드 id, 새로 저장했는지)
+        """
+        record = dict(data)
+        record.setdefault("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        body = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO leads (created_at, contact, source, client_id, name, data, idem_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+                (
+                    record["timestamp"],
+                    self.normalize_contact(record.get("contact", "")),
+                    str(record.get("source", "")),
+                    str(record.get("client_id", "")),
+                    str(record.get("name", "")),
+                    body,
+                    idem_key,
+                ),
+            )
+            if cur.rowcount:
+                return cur.lastrowid, True
+            row = self._conn.execute("SELECT id FROM leads WHERE idem_key = ?", (idem_key,)).fetchone()
+        return row[0], False
+
+    def find_key(self, idem_key: str) -> Optional[int]:
+        """멱등 키로 저장된 리드 id (없으면 None)"""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM leads WHERE idem_key = ?", (idem_key,)).fetchone()
+        return row[0] if row else None
+
+    def find(
+        self,
+        contact: Optional[str] = None,
+        source: Optional[str] = None,
+        client_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """인덱스 조회 (since/until: 'YYYY-MM-DD' 또는 'YYYY-MM-DD HH:MM:SS')"""
+        clauses, params = [], []
+        if contact:
+            clauses.append("contact = ?")
+            params.append(self.normalize_contact(contact))
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        if client_id:
+            clauses.append("client_id = ?")
+            params.append(client_id)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, data FROM leads {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [{"id": lead_id, **json.loads(body)} for lead_id, body in rows]
+
+    def after(self, last_id: int, limit: int) -> List[Tuple[int, Dict]]:
+        """커서 이후 리드 (id 오름차순)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM leads WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+            ).fetchall()
+        return [(lead_id, json.loads(body)) for lead_id, body in rows]
+
+    def get_cursor(self, sink: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT last_id FROM export_cursor WHERE sink = ?", (sink,)).fetchone()
+        return row[0] if row else 0
+
+    def init_cursor(self, sink: str, backfill: bool = False) -> int:
+        """
+        처음 보는 싱크의 커서 생성 (이미 있으면 그대로), 현재 커서 반환
+
+        Args:
+            backfill: True면 0부터 (기존 리드 전체 전송), 아니면 현재 마지막 id부터 (새 리드만)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO export_cursor (sink, last_id) "
+                "SELECT ?, CASE WHEN ? THEN 0 ELSE COALESCE(MAX(id), 0) END FROM leads",
+                (sink, int(backfill)),
+            )
+            return self._conn.execute("SELECT last_id FROM export_cursor WHERE sink = ?", (sink,)).fetchone()[0]
+
+    def set_cursor(self, sink: str, last_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO export_cursor (sink, last_id) VALUES (?, ?) "
+                "ON CONFLICT(sink) DO UPDATE SET last_id = excluded.last_id",
+                (sink, last_id),
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total, last_id = self._conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM leads").fetchone()
+            by_source = self._conn.execute(
+                "SELECT source, COUNT(*) FROM leads GROUP BY source ORDER BY COUNT(*) DESC"
+            ).fetchall()
+            cursors = self._conn.execute("SELECT sink, last_id FROM export_cursor").fetchall()
+        return {
+            "total": total,
+            "last_id": last_id,
+            "by_source": dict(by_source),
+            "pending": {sink: last_id - cursor for sink, cursor in cursors},
+        }
+
+
+# ============================================
+# 중복 제출 방지
+# ============================================
+def idempotency_key(session_id: str, contact: str, client_id: str) -> str:
+    """제출 한 건의 멱등 키 (같은 세션에서 같은 연락처로 같은 페르소나에 다시 제출하면 같은 키)"""
+    raw = f"{session_id}|{LeadStore.normalize_contact(contact)}|{client_id}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class IdempotencyIndex:
+    """
+    최근 제출 결과 LRU (멱등 키 → (성공여부, 메시지))
+    - 처리 중인 키로 들어온 두 번째 요청은 첫 요청이 끝날 때까지 기다렸다가 같은 결과를 받음
+    - 실패한 제출은 기억하지 않음 (재시도 허용)
+    """
+
+    def __init__(self, max_keys: int = LEAD_IDEM_CACHE):
+        self.max_keys = max_keys
+        self._results: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, timeout: float = 30.0) -> Optional[Tuple[bool, str]]:
+        """
+        Returns:
+            이미 처리된 키면 그 결과, 아니면 None (호출한 쪽이 처리하고 finish 호출)
+        """
+        while True:
+            with self._lock:
+                result = self._results.get(key)
+                if result is not None:
+                    self._results.move_to_end(key)
+                    return result
+                waiter = self._pending.get(key)
+                if waiter is None:
+                    self._pending[key] = threading.Event()
+                    return None
+            # 먼저 들어온 제출이 끝나면 결과를 다시 확인 (실패했으면 이번 요청이 처리)
+            if not waiter.wait(timeout):
+                return False, "이전 신청을 처리하는 중입니다. 잠시 후 다시 시도해주세요."
+
+    def finish(self, key: str, result: Tuple[bool, str]) -> None:
+        with self._lock:
+            if result[0]:
+                self._results[key] = result
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_keys:
+                    self._results.popitem(last=False)
+            waiter = self._pending.pop(key, None)
+        if waiter is not None:
+            waiter.set()
+
+
+_STORE: Optional[LeadStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_lead_store() -> LeadStore:
+    """프로세스 전체에서 공유하는 리드 저장소"""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = LeadStore()
+    return _STORE
+
+
+_IDEM_INDEX = IdempotencyIndex()
+
+
+def get_idempotency_index() -> IdempotencyIndex:
+    return _IDEM_INDEX
+
+
+# ============================================
+# 운영 조회 (CLI)
+# ============================================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="로컬 리드 저장소 조회 / 시트 내보내기")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find = sub.add_parser("find", help="연락처/출처/페르소나/기간으로 조회")
+    find.add_argument("--contact")
+    find.add_argument("--source")
+    find.add_argument("--client")
+    find.add_argument("--since")
+    find.add_argument("--until")
+    find.add_argument("--limit", type=int, default=50)
+    sub.add_parser("stats", help="건수, 출처별 건수, 내보내기 대기 건수")
+    sub.add_parser("export", help="밀린 행을 지금 모든 싱크로 전송")
+    args = parser.parse_args(argv)
+
+    store = get_lead_store()
+    if args.command == "find":
+        for lead in store.find(args.contact, args.source, args.client, args.since, args.until, args.limit):
+            print(json.dumps(lead, ensure_ascii=False))
+        return 0
+    if args.command == "stats":
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        return 0
+
+    from lead_handler import LeadHandler
+    from lead_sinks import get_lead_fanout
+    fanout = get_lead_fanout(LeadHandler())
+    if not fanout.workers:
+        print("설정된 싱크가 없습니다 (구글 시트 미연결, IMD_LEAD_SINKS 비어 있음).")
+        return 1
+    for name, sent in fanout.flush().items():
+        print(f"{name}: {sent}건 전송")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
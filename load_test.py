@@ -0,0 +1,228 @@
+"""
+IMD Sales Bot - Load Test
+동시 방문자 N명을 페르소나별로 실제 퍼널 끝까지 돌려서 파드 하나의 수용량 측정
+- 헤드리스 엔진(conversation_engine) 사용, Streamlit 없음
+- LLM: 지연만 흉내 내는 stub (IMD_LLM_BACKEND=stub), 시트: 지연만 흉내 내는 stub
+- 결과: 처리량, 턴 지연 p50/p95/p99, 세션당 메모리
+
+사용 예:
+    python load_test.py --visitors 20 --latency-ms 800
+    python load_test.py --personas lift,gs --visitors 50 --concurrency 100 --json result.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# 방문자 자유 입력 샘플 (버튼 대신 직접 입력하는 경우)
+FREE_TEXT = [
+    "가격이 얼마나 하나요?",
+    "효과가 진짜 있나요?",
+    "상담 받아보고 싶어요",
+    "요즘 너무 고민이라서요",
+    "주말에도 가능한가요?",
+    "다른 곳이랑 뭐가 달라요?",
+]
+
+LEAD_FORM = {"name": "부하테스트", "clinic_name": "부하테스트 의원", "director_name": "부하테스트", "contact": "010-0000-0000"}
+
+
+class StubSheet:
+    """구글 시트 대신 쓰는 가짜 워크시트 (append_row / append_rows 지연만 흉내)"""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def append_row(self, row):
+        time.sleep(self.latency)
+        with self._lock:
+            self.rows += 1
+
+    def append_rows(self, rows):
+        time.sleep(self.latency)
+        with self._lock:
+            self.rows += len(rows)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """nearest-rank 백분위수"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def run_visitor(client_id: str, seed: int, args, store, lead_handler, latencies: Dict[str, List[float]]):
+    """방문자 한 명: 첫 인사 → 버튼/자유 입력 → 선택 UI → 리드 제출"""
+    from conversation_engine import ConversationEngine
+    from conversation_manager import ConversationManager
+    from session_store import new_session_id
+
+    rng = random.Random(seed)
+    manager = ConversationManager(state={}, store=store, session_id=new_session_id())
+    engine = ConversationEngine(client_id, manager, lead_handler)
+
+    def timed(op, fn, *a, **kw):
+        started = time.perf_counter()
+        result = fn(*a, **kw)
+        latencies[op].append((time.perf_counter() - started) * 1000)
+        return result
+
+    timed("start", engine.start, force=True)
+    for _ in range(args.max_turns):
+        if engine.stage == "complete":
+            break
+        if engine.show_cta():
+            timed("lead", engine.submit_lead, LEAD_FORM)
+            continue
+        options = engine.options()
+        if options:
+            timed("option", engine.select_option, rng.choice(sorted(options)))
+            continue
+        buttons = engine.buttons()
+        if buttons and rng.random() < args.chip_ratio:
+            timed("chip", engine.handle_input, rng.choice(buttons), kind="button")
+        else:
+            timed("text", engine.handle_input, rng.choice(FREE_TEXT), kind="text")
+    return engine
+
+
+def run(args) -> Dict:
+    # 엔진 모듈을 불러오기 전에 stub 설정
+    os.environ["IMD_LLM_BACKEND"] = args.llm
+    os.environ["IMD_STUB_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["IMD_STUB_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["IMD_LEAD_DB"] = ":memory:"
+    # 이벤트 로그 기록 비용은 포함하되 파일은 임시 디렉터리로
+    os.environ["IMD_EVENT_DIR"] = tempfile.mkdtemp(prefix="imd-events-")
+    os.environ["IMD_FUNNEL_PATH"] = ""  # 퍼널 집계는 메모리에서만
+    # 사용량 계측도 운영 usage.db 대신 임시 파일로 (stub 세션/전환이 리포트에 섞이지 않도록)
+    os.environ["IMD_METER_PATH"] = os.path.join(tempfile.mkdtemp(prefix="imd-meter-"), "usage.db")
+
+    from config import DATA
+    import conversation_engine  # noqa: F401  (모듈 로딩이 세션 메모리에 섞이지 않도록 미리)
+    from event_log import get_event_log
+    from funnel_metrics import get_funnel_metrics
+    # 기록 스레드/집계기도 미리 (첫 방문자 지연에 섞이지 않게)
+    get_event_log()
+    get_funnel_metrics()
+    from lead_handler import LeadHandler
+    from session_store import create_session_store
+
+    personas = [p for p in args.personas.split(",") if p] if args.personas else list(DATA)
+    unknown = [p for p in personas if p not in DATA]
+    if unknown:
+        raise SystemExit(f"알 수 없는 페르소나: {', '.join(unknown)}")
+
+    store = create_session_store(args.store, args.store_path)
+    sheet = StubSheet(args.sheet_latency_ms)
+    lead_handler = LeadHandler()
+    lead_handler.sheet = sheet
+
+    jobs = [(client_id, i) for client_id in personas for i in range(args.visitors)]
+    latencies: Dict[str, List[float]] = {op: [] for op in ("start", "chip", "text", "option", "lead")}
+    concurrency = args.concurrency or len(jobs)
+
+    if args.memory:
+        tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0] if args.memory else 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_visitor, client_id, args.seed + idx, args, store, lead_handler, latencies)
+            for idx, (client_id, _) in enumerate(jobs)
+        ]
+        # 세션 메모리를 재기 위해 엔진을 끝까지 붙잡아 둠
+        engines = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+
+    memory_per_session = None
+    if args.memory:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        memory_per_session = (current - baseline) / max(1, len(engines))
+
+    # 시트 반영은 싱크 스레드 몫 → 남은 배치를 마저 보낸 뒤 집계
+    from lead_sinks import get_lead_fanout
+    get_lead_fanout().flush()
+
+    turns = sum(len(v) for op, v in latencies.items() if op != "start")
+    completed = sum(1 for e in engines if e.stage == "complete")
+    return {
+        "personas": personas,
+        "visitors": len(jobs),
+        "concurrency": concurrency,
+        "llm": args.llm,
+        "latency_ms": args.latency_ms,
+        "wall_s": round(wall, 3),
+        "completed": completed,
+        "leads_written": sheet.rows,
+        "turns": turns,
+        "turns_per_s": round(turns / wall, 2) if wall else 0.0,
+        "visitors_per_s": round(len(jobs) / wall, 2) if wall else 0.0,
+        "latency": {
+            op: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 1),
+                "p95": round(percentile(values, 95), 1),
+                "p99": round(percentile(values, 99), 1),
+            }
+            for op, values in latencies.items()
+            if values
+        },
+        "memory_per_session_kb": round(memory_per_session / 1024, 1) if memory_per_session is not None else None,
+    }
+
+
+def print_report(result: Dict):
+    print(f"방문자 {result['visitors']}명 ({len(result['personas'])}개 페르소나), 동시 {result['concurrency']}, "
+          f"LLM {result['llm']} {result['latency_ms']:.0f}ms")
+    print(f"퍼널 완료 {result['completed']}/{result['visitors']}, 리드 {result['leads_written']}건, 소요 {result['wall_s']:.1f}s")
+    print(f"처리량: {result['turns_per_s']} 턴/s, {result['visitors_per_s']} 방문자/s")
+    print(f"{'구분':<8}{'횟수':>8}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for op, row in result["latency"].items():
+        print(f"{op:<8}{row['count']:>8}{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}")
+    if result["memory_per_session_kb"] is not None:
+        print(f"세션당 메모리: {result['memory_per_session_kb']} KB (tracemalloc)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="동시 방문자 부하 테스트 (헤드리스 엔진 + stub LLM/시트)")
+    parser.add_argument("--personas", default="", help="쉼표 구분 (기본: 전체)")
+    parser.add_argument("--visitors", type=int, default=10, help="페르소나당 방문자 수")
+    parser.add_argument("--concurrency", type=int, default=0, help="동시 실행 수 (기본: 전원 동시)")
+    parser.add_argument("--llm", default="stub", choices=["stub", "gemini"], help="gemini는 실제 과금 발생")
+    parser.add_argument("--latency-ms", type=float, default=800, help="stub LLM 평균 지연")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="stub LLM 지연 표준편차")
+    parser.add_argument("--sheet-latency-ms", type=float, default=300, help="stub 시트 append_row 지연")
+    parser.add_argument("--chip-ratio", type=float, default=0.7, help="버튼이 있을 때 버튼을 누를 확률")
+    parser.add_argument("--max-turns", type=int, default=12, help="방문자당 최대 행동 수")
+    parser.add_argument("--store", default="memory", choices=["memory", "sqlite", "file"])
+    parser.add_argument("--store-path", default="")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="tracemalloc 끄기 (오버헤드 제거)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", default="", help="결과를 JSON으로 저장할 경로")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if result["completed"] == result["visitors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
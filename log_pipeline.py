@@ -0,0 +1,168 @@
+"""
+IMD Sales Bot - Logging Pipeline
+구조화(JSON lines) 로그 + 큐 기반 비동기 출력
+- 호출 스레드는 큐에 넣기만 함 (파일/stderr 쓰기는 리스너 스레드가 담당, 큐가 가득 차면 버림)
+- 세션/페르소나/단계 필드는 현재 턴 컨텍스트(metering.usage_labels)에서 자동으로 채움
+- DEBUG는 IMD_LOG_DEBUG_SAMPLE 비율만 남김 (span 타이밍 등 대량 이벤트)
+- 파일은 크기 기준 로테이션 (IMD_LOG_MAX_BYTES, IMD_LOG_BACKUPS)
+
+사용 예:
+    logger = get_logger(__name__)
+    logger.error("Gemini 호출 실패: %s", e, extra={"fields": {"latency_ms": 812}})
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+
+# ============================================
+# 설정
+# ============================================
+LOG_LEVEL = os.getenv("IMD_LOG_LEVEL", "INFO").upper()
+LOG_PATH = os.getenv("IMD_LOG_PATH", "")
+LOG_STDERR = os.getenv("IMD_LOG_STDERR", "1") != "0"
+LOG_MAX_BYTES = int(os.getenv("IMD_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("IMD_LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("IMD_LOG_QUEUE_SIZE", "10000"))
+# DEBUG 레코드 중 남길 비율 (0 ~ 1)
+LOG_DEBUG_SAMPLE = float(os.getenv("IMD_LOG_DEBUG_SAMPLE", "0.1"))
+
+ROOT_LOGGER = "imd"
+
+# 현재 턴 라벨 → 로그 필드 이름
+_LABEL_FIELDS = (("session_id", "session"), ("client_id", "persona"), ("stage", "stage"))
+
+
+# ============================================
+# 호출 스레드 쪽 (가볍게)
+# ============================================
+class _ContextFilter(logging.Filter):
+    """DEBUG 샘플링 + 현재 턴 라벨을 레코드에 복사 (컨텍스트는 호출 스레드에만 있음)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and LOG_DEBUG_SAMPLE < 1.0 and random.random() >= LOG_DEBUG_SAMPLE:
+            return False
+        from metering import current_labels
+        labels = current_labels()
+        for label, field in _LABEL_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, labels.get(label))
+        return True
+
+
+_TRACEBACK = logging.Formatter()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """큐가 가득 차면 기다리지 않고 버림 (장애 중에도 응답 지연 없음)"""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 메시지 인자만 합치고 포맷(JSON)은 리스너 스레드에서
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ============================================
+# 리스너 스레드 쪽 (I/O)
+# ============================================
+class JsonFormatter(logging.Formatter):
+    """한 줄 JSON: ts, level, logger, msg, session, persona, stage, latency_ms + extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "session": getattr(record, "session", None),
+            "persona": getattr(record, "persona", None),
+            "stage": getattr(record, "stage", None),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_DroppingQueueHandler] = None
+
+
+def setup_logging() -> logging.Logger:
+    """'imd' 로거에 큐 핸들러 연결 (여러 번 불러도 한 번만)"""
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:
+        return root
+    with _setup_lock:
+        if _listener is not None:
+            return root
+
+        formatter = JsonFormatter()
+        outputs = []
+        if LOG_STDERR:
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(formatter)
+            outputs.append(stream)
+        if LOG_PATH:
+            os.makedirs(os.path.dirname(os.path.abspath(LOG_PATH)), exist_ok=True)
+            rotating = logging.handlers.RotatingFileHandler(
+                LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+            )
+            rotating.setFormatter(formatter)
+            outputs.append(rotating)
+
+        log_queue: "queue.Queue" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(_ContextFilter())
+        root.addHandler(_queue_handler)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        # Streamlit 등 상위 로거 설정과 섞이지 않게
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, *outputs, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """'imd.<모듈>' 로거 (처음 부를 때 파이프라인 설정)"""
+    setup_logging()
+    short = name.rsplit(".", 1)[-1]
+    return logging.getLogger(f"{ROOT_LOGGER}.{short}")
+
+
+def dropped_count() -> int:
+    """큐가 가득 차서 버려진 레코드 수"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,442 @@
+"""
+IMD Sales Bot - Token Metering
+LLM 호출마다 입력/출력 토큰 수를 기록해서 페르소나/단계/모델별 사용량과 전환당 비용 계산
+- 호출 시점: 메모리 카운터만 증가 (락 하나, I/O 없음)
+- 주기적으로(IMD_METER_FLUSH_SECONDS) 로컬 SQLite(IMD_METER_PATH)에 합산 저장
+- 라벨(client_id, stage, session_id, purpose)은 컨텍스트로 전달 (ConversationEngine이 턴마다 설정)
+- 프롬프트 변형(A/B)별 세션 지표: 턴당 지연/토큰, 전환까지 턴 수, 전환율 (세션 단위로 집계)
+- 리포트: python metering.py report [--days 7], python metering.py variants [--days 7]
+"""
+
+import argparse
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+METER_ENABLED = os.getenv("IMD_METER", "1") != "0"
+METER_PATH = os.getenv("IMD_METER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage.db"))
+METER_FLUSH_SECONDS = float(os.getenv("IMD_METER_FLUSH_SECONDS", "60"))
+
+# 모델별 100만 토큰당 가격 (USD, 입력/출력) - 목록에 없으면 IMD_PRICE_INPUT_PER_M / IMD_PRICE_OUTPUT_PER_M
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "stub": (0.0, 0.0),
+}
+DEFAULT_PRICE = (
+    float(os.getenv("IMD_PRICE_INPUT_PER_M", "0.10")),
+    float(os.getenv("IMD_PRICE_OUTPUT_PER_M", "0.40")),
+)
+
+
+def price_of(model: str) -> Tuple[float, float]:
+    return MODEL_PRICES.get(model, DEFAULT_PRICE)
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = price_of(model)
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+# ============================================
+# 라벨 (호출 경로를 따라 전달)
+# ============================================
+_labels: ContextVar[Dict[str, str]] = ContextVar("imd_meter_labels", default={})
+
+
+@contextmanager
+def usage_labels(**labels: Optional[str]) -> Iterator[None]:
+    """
+    블록 안의 LLM 호출에 붙일 라벨 (바깥 라벨에 덧씌움)
+
+    Args:
+        client_id, stage, session_id, purpose ('turn' | 'veritas' | 'summary' | 'replay'),
+        variant (프롬프트 A/B 변형)
+    """
+    merged = dict(_labels.get())
+    merged.update({k: v for k, v in labels.items() if v is not None})
+    token = _labels.set(merged)
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> Dict[str, str]:
+    """현재 컨텍스트의 라벨 (로그 필드 등에서 사용)"""
+    return _labels.get()
+
+
+# ============================================
+# 메모리 카운터
+# ============================================
+# (day, client_id, stage, model, purpose) → [calls, prompt_tokens, completion_tokens]
+UsageKey = Tuple[str, str, str, str, str]
+
+# session_usage에 나중에 추가된 컬럼 (기존 DB 마이그레이션)
+SESSION_COLUMNS = (
+    ("variant", "TEXT NOT NULL DEFAULT ''"),
+    ("turns", "INTEGER NOT NULL DEFAULT 0"),
+    ("latency_ms", "REAL NOT NULL DEFAULT 0"),
+    ("conversion_turns", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+def _new_session(client_id: str, variant: str) -> List:
+    return [client_id, 0, 0, 0, variant, 0, 0.0, 0]
+
+
+class Meter:
+    """호출 경로에서는 dict 갱신만, 저장은 flush에서 한 번에"""
+
+    def __init__(self, path: str = METER_PATH, flush_seconds: float = METER_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._usage: Dict[UsageKey, List[int]] = {}
+        # session_id → [client_id, prompt_tokens, completion_tokens, converted, variant, turns, latency_ms, conversion_turns]
+        self._sessions: Dict[str, List] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, latency_ms: float = 0.0):
+        """LLM 호출 1회 (라벨은 현재 컨텍스트에서)"""
+        labels = _labels.get()
+        client_id = labels.get("client_id", "")
+        purpose = labels.get("purpose", "turn")
+        key = (
+            datetime.now().strftime("%Y-%m-%d"),
+            client_id,
+            labels.get("stage", ""),
+            model,
+            purpose,
+        )
+        sid = labels.get("session_id")
+        with self._lock:
+            row = self._usage.get(key)
+            if row is None:
+                row = self._usage[key] = [0, 0, 0]
+            row[0] += 1
+            row[1] += prompt_tokens
+            row[2] += completion_tokens
+            if sid:
+                session = self._sessions.get(sid)
+                if session is None:
+                    session = self._sessions[sid] = _new_session(client_id, labels.get("variant", ""))
+                session[1] += prompt_tokens
+                session[2] += completion_tokens
+                if purpose == "turn":
+                    session[5] += 1
+                    session[6] += latency_ms
+        self._ensure_flusher()
+
+    def record_conversion(self, client_id: str, session_id: Optional[str], variant: str = ""):
+        """리드 제출 성공 (전환당 비용, 변형별 전환율/전환까지 턴 수 계산용)"""
+        if not session_id:
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _new_session(client_id, variant)
+            if not session[3]:
+                session[3] = 1
+                # 이번 flush 이후 턴 수 (DB에 이미 저장된 턴 수는 flush 때 더함)
+                session[7] = session[5]
+        self._ensure_flusher()
+
+    def snapshot(self) -> Dict[UsageKey, List[int]]:
+        """아직 저장 안 된 메모리 카운터 복사본"""
+        with self._lock:
+            return {k: list(v) for k, v in self._usage.items()}
+
+    # --------------------------------------------------
+    # 저장
+    # --------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS usage (
+                day TEXT, client_id TEXT, stage TEXT, model TEXT, purpose TEXT,
+                calls INTEGER, prompt_tokens INTEGER, completion_tokens INTEGER,
+                PRIMARY KEY (day, client_id, stage, model, purpose)
+            );
+            CREATE TABLE IF NOT EXISTS session_usage (
+                sid TEXT PRIMARY KEY, client_id TEXT, first_day TEXT,
+                prompt_tokens INTEGER, completion_tokens INTEGER, converted INTEGER,
+                variant TEXT NOT NULL DEFAULT '', turns INTEGER NOT NULL DEFAULT 0,
+                latency_ms REAL NOT NULL DEFAULT 0, conversion_turns INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        # 변형 지표 이전에 만든 DB
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(session_usage)")}
+        for column, ddl in SESSION_COLUMNS:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE session_usage ADD COLUMN {column} {ddl}")
+        return conn
+
+    def flush(self):
+        """메모리 카운터를 SQLite에 합산하고 비움"""
+        with self._lock:
+            usage, self._usage = self._usage, {}
+            sessions, self._sessions = self._sessions, {}
+        if not usage and not sessions:
+            return
+        today = datetime.now().strftime("%Y-%m-%d")
+        conn = None
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, client_id, stage, model, purpose) DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens = completion_tokens + excluded.completion_tokens
+                    """,
+                    [key + tuple(row) for key, row in usage.items()],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO session_usage
+                        (sid, client_id, first_day, prompt_tokens, completion_tokens, converted,
+                         variant, turns, latency_ms, conversion_turns)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (sid) DO UPDATE SET
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens = completion_tokens + excluded.completion_tokens,
+                        converted = MAX(converted, excluded.converted),
+                        variant = CASE WHEN variant = '' THEN excluded.variant ELSE variant END,
+                        turns = turns + excluded.turns,
+                        latency_ms = latency_ms + excluded.latency_ms,
+                        conversion_turns = CASE WHEN converted = 0 AND excluded.converted = 1
+                            THEN turns + excluded.conversion_turns ELSE conversion_turns END
+                    """,
+                    [(sid, s[0], today, *s[1:]) for sid, s in sessions.items()],
+                )
+        except sqlite3.Error as e:
+            # 저장 실패 시 다음 flush에 다시 합산
+            logger.warning("토큰 사용량 저장 실패: %s", e)
+            with self._lock:
+                for key, row in usage.items():
+                    merged = self._usage.setdefault(key, [0, 0, 0])
+                    for i, value in enumerate(row):
+                        merged[i] += value
+                for sid, s in sessions.items():
+                    merged = self._sessions.get(sid)
+                    if merged is None:
+                        self._sessions[sid] = s
+                        continue
+                    if s[3]:
+                        merged[7] = s[7]
+                    elif merged[3]:
+                        merged[7] += s[5]
+                    merged[1] += s[1]
+                    merged[2] += s[2]
+                    merged[3] = max(merged[3], s[3])
+                    merged[4] = merged[4] or s[4]
+                    merged[5] += s[5]
+                    merged[6] += s[6]
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name="imd-meter", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+
+_METER: Optional[Meter] = None
+_METER_LOCK = threading.Lock()
+
+
+def get_meter() -> Meter:
+    global _METER
+    if _METER is None:
+        with _METER_LOCK:
+            if _METER is None:
+                _METER = Meter()
+    return _METER
+
+
+def record_usage(model: str, prompt_tokens: int, completion_tokens: int, latency_ms: float = 0.0):
+    if METER_ENABLED:
+        get_meter().record(model, prompt_tokens, completion_tokens, latency_ms)
+
+
+def record_conversion(client_id: str, session_id: Optional[str], variant: str = ""):
+    if METER_ENABLED:
+        get_meter().record_conversion(client_id, session_id, variant)
+
+
+# ============================================
+# 리포트
+# ============================================
+def build_report(path: str = METER_PATH, days: int = 7) -> Dict:
+    """
+    최근 N일 사용량 리포트
+
+    Returns:
+        {'personas': [{client_id, calls, prompt_tokens, completion_tokens, cost, sessions, conversions, cost_per_conversion}],
+         'hotspots': [{client_id, stage, purpose, prompt_tokens, completion_tokens, cost}]}
+    """
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    conn = Meter(path)._connect()
+    try:
+        usage_rows = conn.execute(
+            "SELECT client_id, stage, model, purpose, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens) "
+            "FROM usage WHERE day >= ? GROUP BY client_id, stage, model, purpose",
+            (since,),
+        ).fetchall()
+        session_rows = conn.execute(
+            "SELECT client_id, COUNT(*), SUM(converted) FROM session_usage WHERE first_day >= ? GROUP BY client_id",
+            (since,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    personas: Dict[str, Dict] = {}
+    hotspots: Dict[Tuple[str, str, str], Dict] = {}
+    for client_id, stage, model, purpose, calls, prompt_tokens, completion_tokens in usage_rows:
+        cost = cost_usd(model, prompt_tokens, completion_tokens)
+        p = personas.setdefault(client_id, {"client_id": client_id, "calls": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cost": 0.0, "sessions": 0, "conversions": 0})
+        p["calls"] += calls
+        p["prompt_tokens"] += prompt_tokens
+        p["completion_tokens"] += completion_tokens
+        p["cost"] += cost
+        h = hotspots.setdefault((client_id, stage, purpose), {"client_id": client_id, "stage": stage, "purpose": purpose,
+                                                               "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        h["prompt_tokens"] += prompt_tokens
+        h["completion_tokens"] += completion_tokens
+        h["cost"] += cost
+    for client_id, sessions, conversions in session_rows:
+        p = personas.setdefault(client_id, {"client_id": client_id, "calls": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cost": 0.0, "sessions": 0, "conversions": 0})
+        p["sessions"] = sessions
+        p["conversions"] = conversions or 0
+    for p in personas.values():
+        p["cost_per_conversion"] = p["cost"] / p["conversions"] if p["conversions"] else None
+
+    return {
+        "since": since,
+        "personas": sorted(personas.values(), key=lambda p: -p["cost"]),
+        "hotspots": sorted(hotspots.values(), key=lambda h: -(h["prompt_tokens"] + h["completion_tokens"])),
+    }
+
+
+def print_report(report: Dict, top: int = 10):
+    print(f"기간: {report['since']} ~ 오늘")
+    print(f"{'persona':<10}{'calls':>8}{'in tok':>11}{'out tok':>10}{'cost $':>10}{'sessions':>10}{'conv':>6}{'$/conv':>10}")
+    for p in report["personas"]:
+        per_conv = f"{p['cost_per_conversion']:.4f}" if p["cost_per_conversion"] is not None else "-"
+        print(f"{p['client_id'] or '-':<10}{p['calls']:>8}{p['prompt_tokens']:>11}{p['completion_tokens']:>10}"
+              f"{p['cost']:>10.4f}{p['sessions']:>10}{p['conversions']:>6}{per_conv:>10}")
+    print(f"\n토큰 사용 상위 {top} (줄일 프롬프트 우선순위)")
+    print(f"{'persona':<10}{'stage':<18}{'purpose':<9}{'in tok':>11}{'out tok':>10}{'cost $':>10}")
+    for h in report["hotspots"][:top]:
+        print(f"{h['client_id'] or '-':<10}{h['stage'] or '-':<18}{h['purpose']:<9}{h['prompt_tokens']:>11}"
+              f"{h['completion_tokens']:>10}{h['cost']:>10.4f}")
+
+
+def build_variant_report(path: str = METER_PATH, days: int = 7) -> List[Dict]:
+    """
+    최근 N일 프롬프트 변형별 세션 지표 (LLM 턴이 있었거나 전환한 세션만)
+
+    Returns:
+        [{client_id, variant, sessions, conversions, conversion_rate, turns_per_session,
+          tokens_per_turn, latency_ms_per_turn, turns_to_conversion}]
+    """
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    conn = Meter(path)._connect()
+    try:
+        rows = conn.execute(
+            "SELECT client_id, variant, COUNT(*), SUM(converted), SUM(turns), SUM(latency_ms), "
+            "SUM(prompt_tokens + completion_tokens), SUM(CASE WHEN converted = 1 THEN conversion_turns ELSE 0 END) "
+            "FROM session_usage WHERE first_day >= ? GROUP BY client_id, variant ORDER BY client_id, variant",
+            (since,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    report = []
+    for client_id, variant, sessions, conversions, turns, latency_ms, tokens, conversion_turns in rows:
+        conversions = conversions or 0
+        report.append({
+            "client_id": client_id,
+            "variant": variant,
+            "sessions": sessions,
+            "conversions": conversions,
+            "conversion_rate": conversions / sessions if sessions else 0.0,
+            "turns_per_session": turns / sessions if sessions else 0.0,
+            "tokens_per_turn": tokens / turns if turns else None,
+            "latency_ms_per_turn": latency_ms / turns if turns else None,
+            "turns_to_conversion": conversion_turns / conversions if conversions else None,
+        })
+    return report
+
+
+def print_variant_report(rows: List[Dict]):
+    print(f"{'persona':<10}{'variant':<12}{'sessions':>9}{'conv':>6}{'conv %':>8}{'turns':>7}{'tok/turn':>10}{'ms/turn':>9}{'turns→conv':>12}")
+
+    def fmt(value: Optional[float], spec: str) -> str:
+        return format(value, spec) if value is not None else "-"
+
+    for r in rows:
+        print(f"{r['client_id'] or '-':<10}{r['variant'] or '-':<12}{r['sessions']:>9}{r['conversions']:>6}"
+              f"{r['conversion_rate']:>8.1%}{r['turns_per_session']:>7.1f}{fmt(r['tokens_per_turn'], '.0f'):>10}"
+              f"{fmt(r['latency_ms_per_turn'], '.0f'):>9}{fmt(r['turns_to_conversion'], '.1f'):>12}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="LLM 토큰 사용량 / 전환당 비용 리포트")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="페르소나별 비용, 전환당 비용, 토큰 상위 단계")
+    report.add_argument("--days", type=int, default=7)
+    report.add_argument("--top", type=int, default=10)
+    report.add_argument("--path", default=METER_PATH)
+    variants = sub.add_parser("variants", help="프롬프트 변형별 전환율, 턴당 토큰/지연, 전환까지 턴 수")
+    variants.add_argument("--days", type=int, default=7)
+    variants.add_argument("--path", default=METER_PATH)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"{args.path}: 기록 없음")
+        return 1
+    if args.command == "variants":
+        print_variant_report(build_variant_report(args.path, args.days))
+    else:
+        print_report(build_report(args.path, args.days), args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+IMD Sales Bot - Rerun Profiling
+app.py 재실행 1회를 프로파일러로 감싸서 파일로 저장 (운영에서 잠깐 켜서 원인 모를 느린 재실행 추적)
+- sample: 별도 스레드가 스크립트 스레드의 스택을 주기적으로 수집 → folded stacks (.folded)
+          (flamegraph.pl / speedscope / inferno에 그대로 넣으면 플레임그래프)
+- cprofile: 결정적 프로파일러 → pstats (.pstats)
+- 켜는 방법: IMD_PROFILE=sample|cprofile (모든 재실행 대상)
+            또는 ?profile=sample&profile_token=<IMD_PROFILE_TOKEN> (관리자 1회)
+- 파일 이름에 페르소나/단계/세션 포함, IMD_PROFILE_MIN_INTERVAL초에 한 번만 수집 (동시에 하나만)
+- 요약: python profiling.py top profiles/<파일>.folded
+"""
+
+import argparse
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Mapping, Optional
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+PROFILE_MODE = os.getenv("IMD_PROFILE", "")
+PROFILE_TOKEN = os.getenv("IMD_PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("IMD_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_MIN_INTERVAL = float(os.getenv("IMD_PROFILE_MIN_INTERVAL", "30"))
+SAMPLE_INTERVAL_MS = float(os.getenv("IMD_PROFILE_SAMPLE_MS", "5"))
+MODES = ("sample", "cprofile")
+
+# 예외/st.stop()으로 stop()까지 못 간 프로파일은 이 시간이 지나면 강제로 마감
+PROFILE_STALE_SECONDS = 120
+
+_rate_lock = threading.Lock()
+_last_capture = 0.0
+_active: Optional["RerunProfile"] = None
+
+
+# ============================================
+# 샘플링 프로파일러
+# ============================================
+class SamplingProfiler:
+    """대상 스레드의 스택을 sys._current_frames()로 주기적으로 수집"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="imd-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            # folded 형식은 바깥 → 안쪽 순서
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+
+# ============================================
+# 재실행 1회 프로파일
+# ============================================
+class RerunProfile:
+    """start_rerun_profile()이 돌려주는 진행 중인 프로파일 (stop에서 파일 저장)"""
+
+    def __init__(self, mode: str, persona: str):
+        self.mode = mode
+        self.persona = persona
+        self.started = time.perf_counter()
+        self.path: Optional[str] = None
+        self._stopped = False
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = SamplingProfiler(threading.get_ident())
+            self._profiler.start()
+
+    def stop(self, stage: str = "", session_id: Optional[str] = None) -> Optional[str]:
+        """프로파일 종료 + 저장 (두 번째 호출부터는 무시), 저장 경로 반환"""
+        global _active
+        if self._stopped:
+            return self.path
+        self._stopped = True
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+            name = f"{stamp}_{self.persona or 'root'}_{stage or 'unknown'}_{(session_id or 'nosid')[:8]}"
+            if self.mode == "cprofile":
+                self._profiler.disable()
+                self.path = os.path.join(PROFILE_DIR, name + ".pstats")
+                self._profiler.dump_stats(self.path)
+            else:
+                stacks = self._profiler.stop()
+                self.path = os.path.join(PROFILE_DIR, name + ".folded")
+                with open(self.path, "w", encoding="utf-8") as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            logger.info(
+                "재실행 프로파일 저장: %s", self.path,
+                extra={"persona": self.persona, "stage": stage, "session": session_id,
+                       "fields": {"latency_ms": round(elapsed_ms, 1), "profile_mode": self.mode}},
+            )
+        except OSError as e:
+            logger.warning("재실행 프로파일 저장 실패: %s", e)
+        finally:
+            with _rate_lock:
+                if _active is self:
+                    _active = None
+        return self.path
+
+
+def _requested_mode(query_params: Optional[Mapping[str, str]]) -> Optional[str]:
+    """환경변수 또는 관리자 쿼리(?profile=...&profile_token=...)로 요청된 모드"""
+    if PROFILE_MODE in MODES:
+        return PROFILE_MODE
+    if not PROFILE_TOKEN or not query_params:
+        return None
+    mode = query_params.get("profile")
+    token = query_params.get("profile_token") or ""
+    if mode in MODES and hmac.compare_digest(token, PROFILE_TOKEN):
+        return mode
+    return None
+
+
+def start_rerun_profile(persona: str, query_params: Optional[Mapping[str, str]] = None) -> Optional[RerunProfile]:
+    """
+    요청됐고 수집 간격이 지났으면 현재 스레드(스크립트 스레드) 프로파일 시작
+
+    Returns:
+        RerunProfile (재실행 끝에서 stop 호출) 또는 None
+    """
+    global _last_capture, _active
+    mode = _requested_mode(query_params)
+    if mode is None:
+        return None
+    now = time.monotonic()
+    with _rate_lock:
+        stale = _active if _active is not None and now - _last_capture > PROFILE_STALE_SECONDS else None
+        if (_active is not None and stale is None) or now - _last_capture < PROFILE_MIN_INTERVAL:
+            return None
+        _last_capture = now
+    if stale is not None:
+        stale.stop(stage="aborted")
+    profile = RerunProfile(mode, persona)
+    with _rate_lock:
+        _active = profile
+    return profile
+
+
+# ============================================
+# 요약 (CLI)
+# ============================================
+def summarize_folded(path: str) -> Dict[str, Counter]:
+    """folded 파일 → {'self': 함수별 자체 샘플, 'total': 함수별 포함 샘플}"""
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if not stack:
+                continue
+            frames = stack.split(";")
+            n = int(count)
+            self_counts[frames[-1]] += n
+            for frame in set(frames):
+                total_counts[frame] += n
+    return {"self": self_counts, "total": total_counts}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="재실행 프로파일 요약")
+    sub = parser.add_subparsers(dest="command", required=True)
+    top = sub.add_parser("top", help="샘플이 많은 함수 (.folded) 또는 누적 시간 상위 (.pstats)")
+    top.add_argument("path")
+    top.add_argument("-n", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.path.endswith(".pstats"):
+        import pstats
+        pstats.Stats(args.path).sort_stats("cumulative").print_stats(args.n)
+        return 0
+
+    summary = summarize_folded(args.path)
+    samples = sum(summary["self"].values()) or 1
+    for title, key in (("자체(self)", "self"), ("포함(total)", "total")):
+        print(f"\n[{title}] 전체 {samples} 샘플")
+        for frame, count in summary[key].most_common(args.n):
+            print(f"{count / samples:>7.1%}  {count:>6}  {frame}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
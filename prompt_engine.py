@@ -1,5 +1,11 @@
 from __future__ import annotations
+import hashlib
+import json
 import os
+import re
+import time
+from bisect import bisect_right
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 try:
@@ -12,6 +18,14 @@ try:
 except Exception:
     genai = None
 
+from context_window import HISTORY_TOKEN_BUDGET, estimate_tokens, local_summary, split_for_prompt
+from knowledge_index import get_prompt_knowledge, has_knowledge, retrieve_knowledge
+from log_pipeline import get_logger
+from metering import record_usage, usage_labels
+from telemetry import span
+
+logger = get_logger(__name__)
+
 # ============================================
 # Gemini 설정
 # ============================================
@@ -29,7 +43,17 @@ def _load_api_key() -> Optional[str]:
 
 GEMINI_API_KEY = _load_api_key()
 MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash-exp")
-LLM_ENABLED = GEMINI_API_KEY is not None and genai is not None
+# gemini | stub (부하 테스트용 가짜 모델, 네트워크/과금 없음)
+LLM_BACKEND = os.getenv("IMD_LLM_BACKEND", "gemini")
+# stub 응답 지연 (밀리초, 평균 ± 지터)
+STUB_LATENCY_MS = float(os.getenv("IMD_STUB_LATENCY_MS", "800"))
+STUB_JITTER_MS = float(os.getenv("IMD_STUB_JITTER_MS", "200"))
+LLM_ENABLED = LLM_BACKEND == "stub" or (GEMINI_API_KEY is not None and genai is not None)
+# 1이면 [[STAGE:x]] 인라인 태그 대신 JSON 구조화 응답 사용
+STRUCTURED_OUTPUT = os.getenv("IMD_STRUCTURED_OUTPUT", "0") == "1"
+# 응답 최대 토큰 (JSON 모드는 키/따옴표/버튼·슬롯 필드만큼 더 필요 - 잘리면 JSON이 깨짐)
+MAX_OUTPUT_TOKENS = int(os.getenv("IMD_MAX_OUTPUT_TOKENS", "512"))
+JSON_MAX_OUTPUT_TOKENS = int(os.getenv("IMD_JSON_MAX_OUTPUT_TOKENS", "1024"))
 _MODEL = None
 
 
@@ -111,8 +135,8 @@ SYSTEM_PROMPTS = {
 
 [대화 흐름]
 초기: "그럼 원장님, 어디가 불편한 환자 역할을 해주세요."
-1턴 (증상 호소): 공감 + "혹시 수면은 어떠세요?"
-2턴 (수면 답변): 역발상 또는 공감 + "소화는요?"
+1턴 (증상 호소): 공감 + "혹시 수면은 어떠세요?" + [[STAGE:sleep_check]]
+2턴 (수면 답변): 역발상 또는 공감 + "소화는요?" + [[STAGE:digestion_check]]
 3턴 (소화 답변): 종합 진단 + CTA
 
 [CTA 멘트]
@@ -144,7 +168,7 @@ SYSTEM_PROMPTS = {
 
 [대화 흐름]
 초기: "담당자님, 시력이 떨어진 환자가 되어 버튼을 눌러보세요."
-1턴 (시력 문제 호소): 공감 + "혹시 야간에 빛이 번져 보이시나요?"
+1턴 (시력 문제 호소): 공감 + "혹시 야간에 빛이 번져 보이시나요?" + [[STAGE:symptom_explore]]
 2턴 (야간 시력 답변): 위험성 설명 + "글씨가 겹쳐 보이거나 하시나요?"
 3턴: 종합 진단 + CTA
 
@@ -182,7 +206,7 @@ SYSTEM_PROMPTS = {
 
 [대화 흐름]
 초기: "실장님, 성형을 고민하는 환자가 되어보세요."
-1턴 (관심 부위 선택): 공감 + "어떤 스타일을 원하세요? 자연스러움? 화려함?"
+1턴 (관심 부위 선택): 공감 + "어떤 스타일을 원하세요? 자연스러움? 화려함?" + [[STAGE:symptom_explore]]
 2턴 (스타일 선택): 맞춤 수술법 설명 + "혹시 재수술이신가요?"
 3턴: 종합 제안 + CTA
 
@@ -235,7 +259,7 @@ SYSTEM_PROMPTS = {
 
 [대화 흐름]
 초기: "변호사님, 법률 상담이 필요한 의뢰인이 되어보세요."
-1턴: 공감 + 사건 유형 파악 질문
+1턴: 공감 + 사건 유형 파악 질문 + [[STAGE:symptom_explore]]
 2턴: (형사면) 가해자 확인 / (가사면) 증거 확인
 3턴: 종합 분석 + CTA
 
@@ -263,7 +287,7 @@ SYSTEM_PROMPTS = {
 **1턴: 정보 수집**
 - "자녀분 학년과 현재 등급만 말씀해주세요."
 
-**2턴: 유도 심문 (Cold Reading)**
+**2턴: 유도 심문 (Cold Reading)** + [[STAGE:symptom_explore]] 태그 추가
 등급에 따라 구체적인 '증상'을 맞혀라. 학부모가 "맞아요!"라고 외치게 만들어야 한다.
 
 [5등급 이하]
@@ -326,7 +350,7 @@ SYSTEM_PROMPTS = {
 [3단계 진단 흐름]
 
 **Step 1: 연령대 답변 후**
-연령대별 맞춤 응답:
+연령대별 맞춤 응답 (답변 끝에 [[STAGE:concern_check]] 추가):
 
 [20대]
 "확인되었습니다. 20대는 '초기 예방의 골든타임'입니다. 지금 진피층 콜라겐을 관리하면, 30대 이후 남들보다 확실히 어려 보일 수 있습니다.
@@ -349,7 +373,7 @@ SYSTEM_PROMPTS = {
 거울을 보실 때 가장 신경 쓰이는 부위는 어디인가요?"
 
 **Step 2: 고민 부위 답변 후**
-부위별 맞춤 응답 (전문 용어 삽입):
+부위별 맞춤 응답 (전문 용어 삽입, 답변 끝에 [[STAGE:history_check]] 추가):
 
 [턱라인/이중턱]
 "턱라인을 선택하셨군요. 이 부위는 단순한 지방이 아니라 '하안부 연조직 하수'가 원인입니다. 다이어트로는 절대 해결되지 않는 까다로운 부위입니다.
@@ -559,32 +583,184 @@ def _get_veritas_prompt(client_id):
     return VERITAS_PROMPTS.get(client_id, VERITAS_PROMPTS["root"])
 
 
+# ============================================
+# 프롬프트 A/B 변형 (세션별 고정 배정)
+# ============================================
+CONTROL_VARIANT = "control"
+# 페르소나 → {변형 이름: {'prompt': 시스템 프롬프트, 'weight': 배정 비율}}
+# control은 SYSTEM_PROMPTS 원문 (prompt 생략, weight만 지정 가능, 기본 1)
+# 예: {"hanbang": {"short": {"prompt": "...", "weight": 1}}} → control 50% / short 50%
+PROMPT_VARIANTS: Dict[str, Dict[str, Dict[str, Any]]] = {}
+PROMPT_VARIANTS_PATH = os.getenv("IMD_PROMPT_VARIANTS", "")  # 같은 형식의 JSON 파일 (코드 정의에 덧씌움)
+
+
+def _variant_error(name: str, spec: Any) -> Optional[str]:
+    """변형 정의 검증 - 문제가 있으면 사유, 없으면 None"""
+    if not isinstance(spec, dict):
+        return "정의가 객체가 아님"
+    if name != CONTROL_VARIANT and not isinstance(spec.get("prompt"), str):
+        return "prompt가 문자열이 아님"
+    weight = spec.get("weight", 1.0)
+    if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not weight >= 0:
+        return f"weight가 0 이상의 숫자가 아님 ({weight!r})"
+    return None
+
+
+def _load_prompt_variants() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """코드 정의 + 파일 정의 병합 (잘못된 항목은 경고 후 건너뜀 - import 시 실행되므로 예외 금지)"""
+    sources = [("PROMPT_VARIANTS", PROMPT_VARIANTS)]
+    if PROMPT_VARIANTS_PATH:
+        try:
+            with open(PROMPT_VARIANTS_PATH, encoding="utf-8") as f:
+                sources.append((PROMPT_VARIANTS_PATH, json.load(f)))
+        except (OSError, ValueError) as e:
+            logger.warning("프롬프트 변형 파일 무시 (%s): %s", PROMPT_VARIANTS_PATH, e)
+    variants: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for source, defined in sources:
+        if not isinstance(defined, dict):
+            logger.warning("프롬프트 변형 무시 (%s): 최상위가 객체가 아님", source)
+            continue
+        for client_id, named in defined.items():
+            if not isinstance(named, dict):
+                logger.warning("프롬프트 변형 무시 (%s, %s): 변형 목록이 객체가 아님", source, client_id)
+                continue
+            for name, spec in named.items():
+                error = _variant_error(name, spec)
+                if error:
+                    logger.warning("프롬프트 변형 무시 (%s, %s/%s): %s", source, client_id, name, error)
+                    continue
+                variants.setdefault(client_id, {})[name] = spec
+    return variants
+
+
+def _variant_table(variants: Dict[str, Dict[str, Dict[str, Any]]]) -> Dict[str, tuple]:
+    """페르소나 → (누적 비율 경계, 변형 이름) - 배정 시 bisect 한 번"""
+    table = {}
+    for client_id, named in variants.items():
+        weights = {CONTROL_VARIANT: 1.0}
+        for name, spec in named.items():
+            if name != CONTROL_VARIANT and not spec["prompt"]:
+                continue
+            weights[name] = float(spec.get("weight", 1.0))
+        names = [name for name, weight in sorted(weights.items()) if weight > 0]
+        total = sum(weights[name] for name in names)
+        if len(names) < 2 or total <= 0:
+            continue
+        bounds, acc = [], 0.0
+        for name in names:
+            acc += weights[name] / total
+            bounds.append(acc)
+        bounds[-1] = 1.0
+        table[client_id] = (tuple(bounds), tuple(names))
+    return table
+
+
+_VARIANTS = _load_prompt_variants()
+_VARIANT_TABLE = _variant_table(_VARIANTS)
+
+
+def assign_variant(client_id: str, session_id: Optional[str]) -> str:
+    """
+    세션의 프롬프트 변형 (세션 ID 해시 → 같은 세션은 항상 같은 변형)
+
+    세션 ID가 없거나 변형이 정의되지 않은 페르소나는 control
+    """
+    entry = _VARIANT_TABLE.get(client_id)
+    if entry is None or not session_id:
+        return CONTROL_VARIANT
+    bounds, names = entry
+    digest = hashlib.sha256(f"{client_id}:{session_id}".encode("utf-8")).digest()
+    point = int.from_bytes(digest[:8], "big") / 2 ** 64
+    return names[min(bisect_right(bounds, point), len(names) - 1)]
+
+
+def list_variants() -> List[Dict[str, Any]]:
+    """정의된 변형 목록 (배정 비율, 접두부 토큰 추정치)"""
+    rows = []
+    for client_id, (bounds, names) in sorted(_VARIANT_TABLE.items()):
+        previous = 0.0
+        for bound, name in zip(bounds, names):
+            rows.append({
+                "client_id": client_id,
+                "variant": name,
+                "share": round(bound - previous, 4),
+                "prefix_tokens": estimate_tokens(_prompt_prefix(client_id, name, "")),
+            })
+            previous = bound
+    return rows
+
+
+def _variant_prompt(client_id: str, variant: str) -> str:
+    prompt = None
+    if variant != CONTROL_VARIANT:
+        prompt = _VARIANTS.get(client_id, {}).get(variant, {}).get("prompt")
+    return prompt or _get_system_prompt(client_id)
+
+
+@lru_cache(maxsize=256)
+def _prompt_prefix(client_id: str, variant: str, output_instruction: str) -> str:
+    """
+    시스템 프롬프트 + 출력 지시문 (페르소나/변형/지시문 조합마다 한 번만 만듦)
+    지식 섹션은 빼고 만듦 → 턴마다 관련 항목만 따로 붙임 (knowledge_index)
+    """
+    prompt = _variant_prompt(client_id, variant)
+    if has_knowledge(client_id):
+        prompt = get_prompt_knowledge(client_id, prompt).core
+    buf = [prompt.strip()]
+    if output_instruction:
+        buf.append(f"\n{output_instruction.rstrip()}\n")
+    return "".join(buf)
+
+
+# 지식 섹션 색인은 불러올 때 미리 만듦 (첫 방문자 턴이 색인 비용을 내지 않도록)
+for _client_id in SYSTEM_PROMPTS:
+    if has_knowledge(_client_id):
+        for _variant in (CONTROL_VARIANT, *_VARIANTS.get(_client_id, {})):
+            get_prompt_knowledge(_client_id, _variant_prompt(_client_id, _variant))
+
+
 # ============================================
 # 외부 상태 확인
 # ============================================
 def get_prompt_engine():
     return {
         "llm_enabled": LLM_ENABLED,
-        "model_name": MODEL_NAME,
+        "model_name": "stub" if LLM_BACKEND == "stub" else MODEL_NAME,
     }
 
 
 # ============================================
 # 프롬프트 빌더
 # ============================================
-def _build_prompt(context, history, user_input):
+def _build_prompt(context, history, user_input, output_instruction=""):
     stage = context.get("stage", "initial")
     # 컨텍스트에서 client_id 가져오기 (없으면 root)
     client_id = context.get("client_id", "root")
     
-    # 페르소나에 맞는 시스템 프롬프트 가져오기
-    system_prompt = _get_system_prompt(client_id)
-    
-    buf = [system_prompt.strip()]
+    # 페르소나/변형에 맞는 시스템 프롬프트 (+ 출력 지시문) - 미리 만들어 둔 접두부
+    variant = context.get("prompt_variant") or CONTROL_VARIANT
+    buf = [_prompt_prefix(client_id, variant, output_instruction)]
+    # 지식 섹션은 이번 질문과 관련된 항목만
+    if has_knowledge(client_id):
+        buf.append(f"\n{retrieve_knowledge(client_id, _variant_prompt(client_id, variant), user_input)}\n")
     buf.append(f"\n\n현재 단계: {stage}\n")
-    buf.append("\n[대화 기록]\n")
     
-    for msg in history[-6:]:
+    # 예산 밖으로 밀려난 오래된 대화는 요약으로 대체
+    summary = context.get("history_summary")
+    if summary:
+        buf.append(f"\n[이전 대화 요약]\n{summary}\n")
+    
+    # 방금 추가된 사용자 메시지는 아래 USER 줄로 따로 붙이므로 중복 제거
+    if history and history[-1].get("role") == "user" and (
+        (history[-1].get("content") or history[-1].get("text")) == user_input
+    ):
+        history = history[:-1]
+    
+    # 요약에 아직 반영되지 않은 예산 밖 메시지는 원문 유지 (history_covered 없으면 예산 안만)
+    _, recent = split_for_prompt(history, context.get("history_covered"), HISTORY_TOKEN_BUDGET)
+    
+    buf.append("\n[대화 기록]\n")
+    for msg in recent:
         role = msg.get("role", "user")
         text = msg.get("content") or msg.get("text") or ""
         role_label = "USER" if role == "user" else "AI"
@@ -599,35 +775,74 @@ def _build_prompt(context, history, user_input):
 # ============================================
 # Gemini 호출
 # ============================================
-def _call_llm(prompt, temperature=0.7):
+def _call_llm(prompt, temperature=0.7, response_schema=None, on_delta=None):
+    """
+    Args:
+        on_delta: 주면 스트리밍으로 받아 조각마다 호출 (JSON 모드에서는 무시)
+    """
     if not LLM_ENABLED:
         return "AI 연결 실패 (GEMINI_API_KEY 미설정)"
     
+    started = time.perf_counter()
+    if LLM_BACKEND == "stub":
+        result = _stub_llm(prompt, response_schema, on_delta)
+        _record_usage(None, prompt, result, model="stub", started=started)
+        return result
+    
     model = _init_model()
     if model is None:
         return "AI 모델 초기화 실패"
     
+    generation_config = {
+        "temperature": temperature,
+        "top_p": 0.95,
+        "top_k": 40,
+        "max_output_tokens": MAX_OUTPUT_TOKENS if response_schema is None else JSON_MAX_OUTPUT_TOKENS,
+    }
+    if response_schema is not None:
+        # JSON 모드: 스키마에 맞는 JSON만 반환하도록 강제
+        generation_config["response_mime_type"] = "application/json"
+        generation_config["response_schema"] = response_schema
+    
     try:
+        if on_delta is not None and response_schema is None:
+            parts = []
+            usage = None
+            for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+                # 토큰 수는 마지막 조각에 누적값으로 옴
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                try:
+                    text = chunk.text
+                except Exception:
+                    # 안전 필터 등으로 내용이 없는 조각
+                    text = ""
+                if text:
+                    parts.append(text)
+                    on_delta(text)
+            result = "".join(parts).strip()
+            _record_usage(usage, prompt, result, started=started)
+            return result
+        
         resp = model.generate_content(
             prompt,
-            generation_config={
-                "temperature": temperature,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 512,
-            }
+            generation_config=generation_config,
         )
         
         if hasattr(resp, 'text'):
-            return resp.text.strip()
+            result = resp.text.strip()
         elif hasattr(resp, 'parts'):
-            return ''.join(part.text for part in resp.parts).strip()
+            result = ''.join(part.text for part in resp.parts).strip()
         else:
             return "응답 형식 오류"
+        _record_usage(getattr(resp, "usage_metadata", None), prompt, result, started=started)
+        return result
         
     except Exception as e:
         error_msg = str(e)
-        print(f"[ERROR] Gemini: {error_msg}")
+        logger.error(
+            "Gemini 호출 실패: %s", error_msg,
+            extra={"fields": {"model": MODEL_NAME, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}},
+        )
         
         if "quota" in error_msg.lower():
             return "API 할당량 초과"
@@ -637,6 +852,62 @@ def _call_llm(prompt, temperature=0.7):
             return f"AI 오류: {error_msg}"
 
 
+def _record_usage(usage, prompt: str, result: str, model: str = MODEL_NAME, started: Optional[float] = None):
+    """usage_metadata의 토큰 수 기록 (없으면 글자 수 기반 추정치) + 호출 지연"""
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    completion_tokens = getattr(usage, "candidates_token_count", None) if usage is not None else None
+    record_usage(
+        model,
+        prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+        completion_tokens if completion_tokens is not None else estimate_tokens(result),
+        latency_ms=(time.perf_counter() - started) * 1000 if started is not None else 0.0,
+    )
+
+
+# ============================================
+# 부하 테스트용 가짜 모델 (IMD_LLM_BACKEND=stub)
+# ============================================
+# 자유 입력만으로도 퍼널이 끝까지 진행되도록 단계를 한 칸씩 넘김
+_STUB_NEXT_STAGE = {
+    "initial": "symptom_explore",
+    "symptom_explore": "tongue_select",
+    "sleep_check": "digestion_check",
+    "digestion_check": "tongue_select",
+    "concern_check": "history_check",
+    "history_check": "conversion",
+    "tongue_select": "conversion",
+}
+
+
+def _stub_llm(prompt, response_schema=None, on_delta=None):
+    """지연만 흉내 내는 응답 (Gemini와 같은 태그/JSON 형식)"""
+    import random
+    
+    delay = max(0.0, random.gauss(STUB_LATENCY_MS, STUB_JITTER_MS)) / 1000
+    match = re.search(r"현재 단계: (\w+)", prompt)
+    if match is None:
+        # 상담 턴이 아닌 호출 (후기 생성, 요약)
+        time.sleep(delay)
+        return "상담 받고 나서 고민이 많이 해결됐어요."
+    stage = _STUB_NEXT_STAGE.get(match.group(1), "conversion")
+    reply = "말씀 감사합니다. 조금 더 자세히 여쭤봐도 될까요?"
+    
+    if response_schema is not None:
+        time.sleep(delay)
+        return json.dumps({"reply": reply, "stage": stage, "buttons": ["네, 좋아요", "가격이 궁금해요"], "slots": []}, ensure_ascii=False)
+    
+    text = f"{reply}\n[[STAGE:{stage}]]\n[[BUTTONS:네, 좋아요|가격이 궁금해요]]"
+    if on_delta is None:
+        time.sleep(delay)
+        return text
+    # 스트리밍: 지연을 조각에 나눠서
+    pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+    for piece in pieces:
+        time.sleep(delay / len(pieces))
+        on_delta(piece)
+    return text
+
+
 # ============================================
 # 메인 상담 응답 생성
 # ============================================
@@ -646,6 +917,305 @@ def generate_ai_response(user_input, context, history_for_llm):
     return _call_llm(prompt)
 
 
+def generate_ai_turn(user_input, context, history_for_llm, structured=None, on_delta=None):
+    """
+    답변 + 메타데이터를 한 번에 생성
+
+    Args:
+        structured: JSON 모드 사용 여부 (None이면 IMD_STRUCTURED_OUTPUT 설정)
+        on_delta: 답변 본문 조각 콜백 (SSE 스트리밍용, 태그는 걸러서 전달)
+
+    Returns:
+        {'reply', 'stage', 'route', 'buttons', 'slots'}
+    """
+    current_stage = context.get("stage", "initial")
+    persona = context.get("client_id", "root")
+    use_json = STRUCTURED_OUTPUT if structured is None else structured
+    stream = _TagStreamFilter(on_delta) if on_delta is not None else None
+    
+    with span("prompt_build", persona=persona, stage=current_stage):
+        instruction = STRUCTURED_INSTRUCTION if use_json else BUTTON_INSTRUCTION
+        prompt = _build_prompt(context, history_for_llm, user_input, output_instruction=instruction)
+    
+    with span("llm", persona=persona, stage=current_stage):
+        if not use_json:
+            raw = _call_llm(prompt, on_delta=stream.feed if stream else None)
+            if stream is not None:
+                stream.close()
+        else:
+            raw = _call_llm(prompt, response_schema=RESPONSE_SCHEMA)
+    
+    with span("tag_parse", persona=persona, stage=current_stage):
+        turn = _parse_structured(raw, current_stage) if use_json else None
+        if turn is None and use_json and _looks_like_json(raw):
+            # 잘리거나 깨진 JSON: reply 문자열만이라도 꺼내고, 그것도 없으면 태그 모드로 한 번 더
+            turn = _salvage_structured(raw, current_stage)
+            if turn is None:
+                logger.warning("JSON 응답 파싱 실패, 태그 모드로 재시도", extra={"fields": {"persona": persona, "stage": current_stage}})
+                with span("llm_retry", persona=persona, stage=current_stage):
+                    prompt = _build_prompt(context, history_for_llm, user_input, output_instruction=BUTTON_INSTRUCTION)
+                    raw = _call_llm(prompt)
+        if turn is None:
+            # 오류 문구 등 JSON이 아닌 응답도 대화는 이어지도록 태그 파싱
+            turn = _tag_turn(raw, current_stage)
+    
+    # 스트리밍되지 않은 경우 (JSON 모드, 오류 문구) 본문을 한 번에 전달
+    if stream is not None and not stream.emitted:
+        on_delta(turn["reply"])
+    return turn
+
+
+class _TagStreamFilter:
+    """스트리밍 조각에서 [[...]] 태그를 걸러 본문만 내보내는 필터"""
+    
+    def __init__(self, emit):
+        self.emit = emit
+        self.emitted = False
+        self._pending = ""
+    
+    def feed(self, chunk: str):
+        buf = self._pending + chunk
+        out = []
+        while buf:
+            start = buf.find("[[")
+            if start < 0:
+                # 다음 조각이 '['로 시작할 수 있으므로 끝의 '['는 보류
+                keep = 1 if buf.endswith("[") else 0
+                out.append(buf[:len(buf) - keep])
+                buf = buf[len(buf) - keep:]
+                break
+            out.append(buf[:start])
+            end = buf.find("]]", start)
+            if end < 0:
+                # 태그가 닫힐 때까지 보류
+                buf = buf[start:]
+                break
+            buf = buf[end + 2:]
+        self._pending = buf
+        self._emit("".join(out))
+    
+    def close(self):
+        """스트림 끝: 보류 중이던 조각(닫히지 않은 '[[' 등)은 태그가 아니므로 그대로 내보냄"""
+        pending, self._pending = self._pending, ""
+        self._emit(pending)
+    
+    def _emit(self, text: str):
+        if text:
+            self.emitted = True
+            self.emit(text)
+
+
+# ============================================
+# 응답 메타데이터 파싱 (인라인 태그 모드)
+# ============================================
+MAX_BUTTONS = 4
+MAX_BUTTON_CHARS = 30
+ALLOWED_STAGES = {
+    "initial", "symptom_explore", "sleep_check", "digestion_check", "tongue_select",
+    "concern_check", "history_check", "conversion", "complete",
+}
+ROUTE_MAP = {"hanbang": "hanbang", "gs": "gs", "nana": "nana", "law": "law", "math": "math", "lift": "lift"}
+
+
+def parse_response_tags(text: str, current_stage: str):
+    """[[STAGE:...]] 와 [[ROUTE:...]] 태그 파싱"""
+    body = text
+    new_stage = current_stage
+    route_to = None
+    
+    stage_match = re.search(r'\[\[STAGE:(\w+)\]\]', text)
+    if stage_match:
+        stage_val = stage_match.group(1).lower()
+        if stage_val in ALLOWED_STAGES:
+            new_stage = stage_val
+        body = re.sub(r'\[\[STAGE:\w+\]\]', '', body)
+    
+    route_match = re.search(r'\[\[ROUTE:(\w+)\]\]', text)
+    if route_match:
+        route_val = route_match.group(1).lower()
+        if route_val in ROUTE_MAP:
+            route_to = ROUTE_MAP[route_val]
+        body = re.sub(r'\[\[ROUTE:\w+\]\]', '', body)
+    
+    return body.strip(), new_stage, route_to
+
+
+# 추천 버튼 후보: [[BUTTONS:후보1|후보2|후보3]]
+BUTTON_INSTRUCTION = """
+[빠른 답변 버튼]
+답변 맨 끝에 고객이 바로 누를 수 있는 짧은 답변 후보 2~4개를 [[BUTTONS:후보1|후보2|후보3]] 형식으로 추가하라.
+(각 20자 이내, 고객 입장의 말투, 본문에는 버튼 언급 금지)
+"""
+
+
+def parse_button_tag(text: str):
+    """[[BUTTONS:a|b|c]] 태그 파싱 → (태그 제거된 본문, 버튼 리스트)"""
+    match = re.search(r'\[\[BUTTONS:([^\]]*)\]\]', text)
+    if not match:
+        return text, []
+    buttons = [b.strip() for b in match.group(1).split("|")]
+    buttons = [b for b in buttons if b and len(b) <= MAX_BUTTON_CHARS]
+    body = re.sub(r'\[\[BUTTONS:[^\]]*\]\]', '', text).strip()
+    return body, buttons[:MAX_BUTTONS]
+
+
+# ============================================
+# 구조화 응답 모드 (JSON 스키마)
+# ============================================
+# Gemini response_schema 형식 (OpenAPI 부분집합)
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "stage": {"type": "string", "enum": sorted(ALLOWED_STAGES)},
+        "route": {"type": "string", "enum": sorted(ROUTE_MAP), "nullable": True},
+        "buttons": {"type": "array", "items": {"type": "string"}},
+        "slots": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "key": {"type": "string"},
+                    "value": {"type": "string"},
+                },
+                "required": ["key", "value"],
+            },
+        },
+    },
+    "required": ["reply", "stage"],
+}
+
+STRUCTURED_INSTRUCTION = """
+[출력 형식 - 반드시 JSON]
+위 규칙에서 [[STAGE:x]] / [[ROUTE:x]] 태그를 붙이라고 한 부분은 태그 대신 아래 필드로 표현하라.
+- reply: 고객에게 보여줄 답변 본문 (태그 없이)
+- stage: 다음 대화 단계 (변화 없으면 현재 단계 그대로)
+- route: 업종 데모로 유도할 때만 클라이언트 ID, 아니면 null
+- buttons: 고객이 바로 누를 수 있는 짧은 답변 후보 2~4개 (각 20자 이내)
+- slots: 대화에서 확인된 사실 [{"key": "...", "value": "..."}]
+  (예: industry, symptom, age_group, concern, treatment_history, grade)
+"""
+
+def _validate_structured(data: Any, current_stage: str) -> Optional[Dict]:
+    """
+    JSON 응답을 스키마 기준으로 검증/정규화
+    reply가 없으면 None (태그 파싱 폴백), 나머지 필드는 잘못된 값만 버린다
+    """
+    if not isinstance(data, dict):
+        return None
+    reply = data.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        return None
+    
+    stage = data.get("stage")
+    if not isinstance(stage, str) or stage.lower() not in ALLOWED_STAGES:
+        stage = current_stage
+    
+    route = data.get("route")
+    route = ROUTE_MAP.get(route.lower()) if isinstance(route, str) else None
+    
+    buttons = []
+    for b in data.get("buttons") or []:
+        if isinstance(b, str) and b.strip() and len(b.strip()) <= MAX_BUTTON_CHARS:
+            buttons.append(b.strip())
+    
+    slots = {}
+    for item in data.get("slots") or []:
+        if isinstance(item, dict) and isinstance(item.get("key"), str) and item.get("value") not in (None, ""):
+            slots[item["key"].strip()] = str(item["value"]).strip()
+    
+    # 모델이 reply 안에 태그를 섞어 보낸 경우까지 정리
+    body, tag_stage, tag_route = parse_response_tags(reply, stage.lower())
+    return {
+        "reply": body,
+        "stage": tag_stage,
+        "route": route or tag_route,
+        "buttons": buttons[:MAX_BUTTONS],
+        "slots": slots,
+    }
+
+
+def _parse_structured(raw: str, current_stage: str) -> Optional[Dict]:
+    text = raw.strip()
+    # ```json ... ``` 코드펜스로 감싸 오는 경우 제거
+    if text.startswith("```"):
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return _validate_structured(data, current_stage)
+
+
+def _looks_like_json(raw: str) -> bool:
+    return raw.lstrip().startswith(("{", "```"))
+
+
+# 잘린 JSON에서 "reply": "..." 값 (닫는 따옴표가 없어도 끝까지)
+_REPLY_RE = re.compile(r'"reply"\s*:\s*"((?:[^"\\]|\\.)*)', re.DOTALL)
+
+
+def _salvage_structured(raw: str, current_stage: str) -> Optional[Dict]:
+    """JSON이 깨졌을 때 reply 문자열만 복구 (단계/버튼/슬롯은 버림)"""
+    match = _REPLY_RE.search(raw)
+    if match is None:
+        return None
+    # 잘린 이스케이프(끝의 '\' 또는 '\u12')는 버림
+    value = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", match.group(1))
+    try:
+        reply = json.loads(f'"{value}"')
+    except ValueError:
+        return None
+    body, new_stage, route_to = parse_response_tags(reply, current_stage)
+    if not body:
+        return None
+    return {"reply": body, "stage": new_stage, "route": route_to, "buttons": [], "slots": {}}
+
+
+def _tag_turn(raw: str, current_stage: str) -> Dict:
+    body, buttons = parse_button_tag(raw)
+    body, new_stage, route_to = parse_response_tags(body, current_stage)
+    return {"reply": body, "stage": new_stage, "route": route_to, "buttons": buttons, "slots": {}}
+
+
+# ============================================
+# 대화 롤링 요약 (예산 밖 오래된 턴)
+# ============================================
+SUMMARY_PROMPT = """다음은 상담 대화의 기존 요약과, 새로 요약에 합쳐야 할 대화 일부다.
+고객의 업종/직함, 호소한 증상·고민, 선택한 항목, 가격·일정 관련 언급 등
+다음 상담에 필요한 사실만 5줄 이내의 불릿으로 갱신하라. 추측 금지.
+
+[기존 요약]
+{previous}
+
+[추가 대화]
+{dialogue}
+
+[출력]
+갱신된 요약 불릿만."""
+
+
+def summarize_history(previous_summary, messages):
+    """
+    기존 요약 + 새 메시지 → 갱신된 요약
+    (백그라운드 스레드에서 호출됨, LLM 미연결 시 로컬 요약)
+    """
+    if not LLM_ENABLED:
+        return local_summary(previous_summary, messages)
+    
+    dialogue = "\n".join(
+        f"{'USER' if m.get('role') == 'user' else 'AI'}: {m.get('content') or m.get('text') or ''}"
+        for m in messages
+    )
+    prompt = SUMMARY_PROMPT.format(previous=previous_summary or "(없음)", dialogue=dialogue)
+    with usage_labels(purpose="summary"):
+        summary = _call_llm(prompt, temperature=0.2)
+    # 오류 문구가 요약으로 들어가지 않도록 로컬 요약으로 대체
+    if summary.startswith(("AI 오류", "AI 연결 실패", "AI 모델 초기화 실패", "API ", "응답 형식 오류")):
+        return local_summary(previous_summary, messages)
+    return summary
+
+
 # ============================================
 # Veritas 후기 생성 (페르소나별)
 # ============================================
@@ -653,6 +1223,11 @@ def generate_veritas_story(symptom="만성 피로", client_id="hanbang"):
     """
     페르소나에 맞는 후기 생성
     """
+    with span("veritas", persona=client_id), usage_labels(client_id=client_id, purpose="veritas"):
+        return _generate_veritas_story(symptom, client_id)
+
+
+def _generate_veritas_story(symptom, client_id):
     if not LLM_ENABLED:
         # 폴백: API 없을 때 페르소나별 하드코딩 예시
         fallback_stories = {
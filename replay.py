@@ -0,0 +1,439 @@
+"""
+IMD Sales Bot - Transcript Replay
+기록된 대화의 사용자 턴을 현재 프롬프트(SYSTEM_PROMPTS 등)로 다시 돌려서 프롬프트 수정의 회귀 확인
+- 입력: 대화 이벤트 로그(event_log, events/) 또는 replay.py export로 뽑은 JSONL 대화 파일
+- 턴마다 _build_prompt → _call_llm → 태그 파싱 (운영 generate_ai_turn과 같은 지시문)
+  스크립트 단계 입력(funnel_script가 LLM 없이 답하는 턴)은 건너뜀
+- 결과: 페르소나별 STAGE/BUTTONS 태그 출력률, 기록된 다음 단계와 일치율, 답변 길이 변화, 지연 p50/p95
+  (길이 비교는 conversion 진입 때 붙는 후기/사례 블록을 뗀 모델 답변 기준)
+- 예산 밖 오래된 턴은 운영처럼 [이전 대화 요약]으로 (LLM 요약 대신 결정적인 local_summary)
+- 프롬프트 변형: 기본은 세션에 기록된 변형(variant 이벤트, 없으면 control), --variant로 전체를 한 변형으로
+- 스레드/프로세스 풀 + 초당 호출 수 제한, 같은 프롬프트는 결과 캐시(.replay_cache/, 프롬프트 해시)
+- LLM: stub(오프라인, 기본) / gemini(GEMINI_API_KEY 있을 때, 과금 발생) / auto
+
+사용 예:
+    python replay.py export --events events -o transcripts.jsonl
+    python replay.py run --transcripts transcripts.jsonl --llm stub
+    python replay.py run --events events --llm gemini --workers 4 --rps 2 --min-tag-rate 0.95
+    python replay.py variants                                         # 정의된 변형 / 배정 비율 / 접두부 토큰
+    python replay.py run --transcripts transcripts.jsonl --variant short   # 새 변형으로 같은 대화 재실행
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".replay_cache")
+
+
+# ============================================
+# 대화 불러오기
+# ============================================
+def _read_events(events_dir: str) -> List[Dict]:
+    """raw JSONL 세그먼트(기록 중인 것 포함) + 압축된 Parquet"""
+    events: List[Dict] = []
+    raw = sorted(glob.glob(os.path.join(events_dir, "raw", "*.jsonl*")))
+    for path in raw:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    parquet_dir = os.path.join(events_dir, "parquet")
+    if os.path.isdir(parquet_dir):
+        try:
+            import pyarrow.dataset as ds
+        except Exception:
+            print("pyarrow가 없어 Parquet 이벤트는 건너뜁니다.", file=sys.stderr)
+        else:
+            table = ds.dataset(parquet_dir, format="parquet", partitioning="hive").to_table()
+            for row in table.to_pylist():
+                ts = row["ts"]
+                row["ts"] = int(ts.timestamp() * 1000) if hasattr(ts, "timestamp") else ts
+                events.append(row)
+    return events
+
+
+def transcripts_from_events(events: Iterable[Dict]) -> List[Dict]:
+    """
+    이벤트 → 세션별 대화
+
+    Returns:
+        [{'id', 'client_id', 'variant', 'messages': [{'role', 'text', 'kind', 'stage', 'stage_after'?}]}]
+        stage: 메시지 시점의 단계, stage_after: AI 답변 직후 바뀐 단계
+    """
+    by_session: Dict[tuple, List[Dict]] = defaultdict(list)
+    for event in events:
+        if event.get("session"):
+            by_session[(event["session"], event.get("persona") or "root")].append(event)
+
+    transcripts = []
+    for (session, persona), session_events in by_session.items():
+        session_events.sort(key=lambda e: e["ts"])
+        messages: List[Dict] = []
+        variant = ""
+        for event in session_events:
+            kind = event.get("kind")
+            if kind == "variant":
+                variant = event.get("text") or ""
+            elif kind in ("message", "click"):
+                messages.append({
+                    "role": event.get("role") or "user",
+                    "text": event.get("text") or "",
+                    "kind": "button" if kind == "click" else "text",
+                    "stage": event.get("stage") or "initial",
+                })
+            elif kind == "stage" and messages and messages[-1]["role"] == "ai":
+                messages[-1]["stage_after"] = event.get("text")
+        if any(m["role"] == "user" for m in messages):
+            transcripts.append({"id": session, "client_id": persona, "variant": variant, "messages": messages})
+    transcripts.sort(key=lambda t: (t["client_id"], t["id"]))
+    return transcripts
+
+
+def load_transcripts(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_jobs(transcripts: List[Dict], structured: bool, cache_dir: str, variant: str = "") -> List[Dict]:
+    """
+    LLM을 타는 사용자 턴만 골라 재실행 작업으로
+
+    Args:
+        variant: 프롬프트 변형 (빈 값이면 대화에 기록된 변형)
+    """
+    from prompt_engine import CONTROL_VARIANT
+    from conversation_engine import strip_veritas
+    from funnel_script import get_scripted_turn
+
+    jobs = []
+    for transcript in transcripts:
+        persona = transcript.get("client_id") or "root"
+        prompt_variant = variant or transcript.get("variant") or CONTROL_VARIANT
+        messages = transcript["messages"]
+        for i, message in enumerate(messages):
+            if message["role"] != "user":
+                continue
+            stage = message.get("stage") or "initial"
+            if get_scripted_turn(persona, stage, message["text"]) is not None:
+                continue
+            reply = messages[i + 1] if i + 1 < len(messages) and messages[i + 1]["role"] == "ai" else None
+            jobs.append({
+                "transcript": transcript.get("id", ""),
+                "persona": persona,
+                "variant": prompt_variant,
+                "stage": stage,
+                "text": message["text"],
+                "history": [{"role": m["role"], "text": m["text"]} for m in messages[: i + 1]],
+                "recorded_reply": strip_veritas(reply["text"]) if reply else None,
+                "recorded_stage": (reply.get("stage_after") or stage) if reply else None,
+                "structured": structured,
+                "cache_dir": cache_dir,
+            })
+    return jobs
+
+
+# ============================================
+# 호출 수 제한 / 캐시
+# ============================================
+class RateLimiter:
+    """초당 rate회 (토큰 버킷, 버스트 1)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], key + ".json")
+
+
+def _cache_get(cache_dir: str, key: str) -> Optional[Dict]:
+    try:
+        with open(_cache_path(cache_dir, key), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_put(cache_dir: str, key: str, value: Dict) -> None:
+    path = _cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# ============================================
+# 턴 재실행 (스레드/프로세스 공용)
+# ============================================
+_limiter: Optional[RateLimiter] = None
+
+
+def _init_worker(env: Dict[str, str], rps: float):
+    """프로세스 풀 워커: prompt_engine을 불러오기 전에 백엔드 설정"""
+    global _limiter
+    os.environ.update(env)
+    _limiter = RateLimiter(rps)
+
+
+def replay_turn(job: Dict) -> Dict:
+    import prompt_engine as pe
+    from metering import usage_labels
+
+    from context_window import HISTORY_TOKEN_BUDGET, local_summary, split_by_budget
+
+    context = {"client_id": job["persona"], "stage": job["stage"], "prompt_variant": job["variant"]}
+    # 운영과 같은 분할: 방금 사용자 메시지를 뺀 대화에서 예산 밖 턴은 요약으로
+    older, _ = split_by_budget(job["history"][:-1], HISTORY_TOKEN_BUDGET)
+    if older:
+        context["history_summary"] = local_summary("", older)
+        context["history_covered"] = len(older)
+    instruction = pe.STRUCTURED_INSTRUCTION if job["structured"] else pe.BUTTON_INSTRUCTION
+    prompt = pe._build_prompt(context, job["history"], job["text"], output_instruction=instruction)
+    model = pe.get_prompt_engine()["model_name"]
+    key = hashlib.sha256(f"{model}|{int(job['structured'])}|{job['variant']}|{prompt}".encode("utf-8")).hexdigest()
+
+    cached = _cache_get(job["cache_dir"], key) if job["cache_dir"] else None
+    if cached is not None:
+        raw, latency_ms = cached["raw"], cached["latency_ms"]
+    else:
+        if _limiter is not None:
+            _limiter.wait()
+        started = time.perf_counter()
+        with usage_labels(client_id=job["persona"], stage=job["stage"], purpose="replay", variant=job["variant"]):
+            if job["structured"]:
+                raw = pe._call_llm(prompt, response_schema=pe.RESPONSE_SCHEMA)
+            else:
+                raw = pe._call_llm(prompt)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if job["cache_dir"]:
+            _cache_put(job["cache_dir"], key, {"raw": raw, "latency_ms": latency_ms})
+
+    if job["structured"]:
+        turn = pe._parse_structured(raw, job["stage"])
+        stage_tag = buttons_tag = turn is not None
+        if turn is None:
+            turn = pe._tag_turn(raw, job["stage"])
+    else:
+        turn = pe._tag_turn(raw, job["stage"])
+        stage_tag = "[[STAGE:" in raw
+        buttons_tag = "[[BUTTONS:" in raw
+
+    recorded = job["recorded_reply"]
+    return {
+        "transcript": job["transcript"],
+        "persona": job["persona"],
+        "variant": job["variant"],
+        "stage": job["stage"],
+        "text": job["text"],
+        "stage_tag": stage_tag,
+        "buttons_tag": buttons_tag,
+        "new_stage": turn["stage"],
+        "recorded_stage": job["recorded_stage"],
+        "stage_match": job["recorded_stage"] is None or turn["stage"] == job["recorded_stage"],
+        "reply_chars": len(turn["reply"]),
+        "recorded_chars": len(recorded) if recorded is not None else None,
+        "latency_ms": round(latency_ms, 1),
+        "cached": cached is not None,
+    }
+
+
+# ============================================
+# 실행 / 리포트
+# ============================================
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(results: List[Dict]) -> Dict[str, Dict]:
+    """페르소나별 + 전체(*) 요약"""
+    groups: Dict[str, List[Dict]] = defaultdict(list)
+    for row in results:
+        groups[row["persona"]].append(row)
+        groups["*"].append(row)
+    summary = {}
+    for persona, rows in sorted(groups.items()):
+        n = len(rows)
+        compared = [r for r in rows if r["recorded_chars"]]
+        live = [r["latency_ms"] for r in rows if not r["cached"]]
+        summary[persona] = {
+            "turns": n,
+            "stage_tag_rate": round(sum(r["stage_tag"] for r in rows) / n, 3),
+            "buttons_tag_rate": round(sum(r["buttons_tag"] for r in rows) / n, 3),
+            "stage_match_rate": round(sum(r["stage_match"] for r in rows) / n, 3),
+            # 기록된 답변 대비 길이 변화 (평균, %)
+            "reply_len_change": round(
+                sum(r["reply_chars"] / r["recorded_chars"] - 1 for r in compared) / len(compared), 3
+            ) if compared else None,
+            "cached": sum(r["cached"] for r in rows),
+            "latency_p50_ms": round(_percentile(live, 50), 1),
+            "latency_p95_ms": round(_percentile(live, 95), 1),
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict], backend: str) -> None:
+    print(f"LLM: {backend}")
+    print(f"{'페르소나':<10}{'턴':>6}{'STAGE태그':>10}{'BUTTONS':>9}{'단계일치':>9}{'길이변화':>9}{'캐시':>6}{'p50(ms)':>9}{'p95(ms)':>9}")
+    for persona, s in summary.items():
+        change = f"{s['reply_len_change']:+.0%}" if s["reply_len_change"] is not None else "-"
+        print(f"{persona:<10}{s['turns']:>6}{s['stage_tag_rate']:>10.0%}{s['buttons_tag_rate']:>9.0%}"
+              f"{s['stage_match_rate']:>9.0%}{change:>9}{s['cached']:>6}{s['latency_p50_ms']:>9}{s['latency_p95_ms']:>9}")
+
+
+def _backend_env(args) -> Dict[str, str]:
+    backend = args.llm
+    if backend == "auto":
+        has_key = bool(os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+        backend = "gemini" if has_key else "stub"
+    env = {
+        "IMD_LLM_BACKEND": backend,
+        # 재실행 호출은 운영 사용량(usage.db) 리포트에 섞이지 않도록 임시 파일에 계측
+        "IMD_METER_PATH": os.path.join(tempfile.mkdtemp(prefix="imd-meter-"), "usage.db"),
+    }
+    if backend == "stub":
+        env["IMD_STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+        env["IMD_STUB_JITTER_MS"] = str(args.stub_latency_ms / 4)
+    return env
+
+
+def run(args) -> int:
+    env = _backend_env(args)
+    os.environ.update(env)
+
+    if args.transcripts:
+        transcripts = load_transcripts(args.transcripts)
+    else:
+        transcripts = transcripts_from_events(_read_events(args.events))
+    if args.personas:
+        wanted = set(args.personas.split(","))
+        transcripts = [t for t in transcripts if t.get("client_id") in wanted]
+    cache_dir = "" if args.no_cache else args.cache_dir
+    jobs = build_jobs(transcripts, args.structured, cache_dir, args.variant)
+    if args.variant:
+        from prompt_engine import CONTROL_VARIANT, list_variants
+        defined = {(row["client_id"], row["variant"]) for row in list_variants()}
+        missing = sorted({j["persona"] for j in jobs if (j["persona"], args.variant) not in defined})
+        if missing and args.variant != CONTROL_VARIANT:
+            print(f"변형 {args.variant!r}이 없는 페르소나는 control 프롬프트로 재실행: {', '.join(missing)}", file=sys.stderr)
+    if args.limit:
+        jobs = jobs[: args.limit]
+    if not jobs:
+        print("재실행할 사용자 턴이 없습니다.")
+        return 1
+
+    import prompt_engine
+    if not prompt_engine.LLM_ENABLED:
+        print("LLM을 쓸 수 없습니다 (GEMINI_API_KEY 미설정). --llm stub으로 실행하세요.")
+        return 1
+    backend = prompt_engine.get_prompt_engine()["model_name"]
+
+    started = time.perf_counter()
+    if args.pool == "process":
+        # 프로세스마다 제한을 나눠 가짐
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(env, args.rps / args.workers)) as pool:
+            results = list(pool.map(replay_turn, jobs))
+    else:
+        _init_worker(env, args.rps)
+        with ThreadPoolExecutor(args.workers) as pool:
+            results = list(pool.map(replay_turn, jobs))
+    wall = time.perf_counter() - started
+
+    summary = summarize(results)
+    print_summary(summary, backend)
+    print(f"\n{len(jobs)}턴 / {len(transcripts)}개 대화, {wall:.1f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": backend, "summary": summary, "turns": results}, f, ensure_ascii=False, indent=2)
+
+    overall = summary["*"]
+    if overall["stage_tag_rate"] < args.min_tag_rate:
+        print(f"STAGE 태그 출력률 {overall['stage_tag_rate']:.0%} < 기준 {args.min_tag_rate:.0%}")
+        return 1
+    return 0
+
+
+def show_variants(args) -> int:
+    from prompt_engine import list_variants
+
+    rows = list_variants()
+    if not rows:
+        print("정의된 프롬프트 변형이 없습니다 (PROMPT_VARIANTS / IMD_PROMPT_VARIANTS).")
+        return 1
+    print(f"{'persona':<10}{'variant':<14}{'share':>7}{'prefix tok':>12}")
+    for row in rows:
+        print(f"{row['client_id']:<10}{row['variant']:<14}{row['share']:>7.0%}{row['prefix_tokens']:>12}")
+    return 0
+
+
+def export(args) -> int:
+    transcripts = transcripts_from_events(_read_events(args.events))
+    with open(args.output, "w", encoding="utf-8") as f:
+        for transcript in transcripts:
+            f.write(json.dumps(transcript, ensure_ascii=False) + "\n")
+    print(f"{len(transcripts)}개 대화 → {args.output}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="기록된 대화로 프롬프트 회귀 확인")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="이벤트 로그 → 대화 JSONL")
+    exp.add_argument("--events", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "events"))
+    exp.add_argument("-o", "--output", default="transcripts.jsonl")
+
+    r = sub.add_parser("run", help="사용자 턴 재실행 + 태그/길이/지연 리포트")
+    source = r.add_mutually_exclusive_group()
+    source.add_argument("--transcripts", default="", help="replay.py export 결과 (JSONL)")
+    source.add_argument("--events", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "events"))
+    r.add_argument("--llm", default="stub", choices=["stub", "gemini", "auto"], help="gemini는 실제 과금 발생")
+    r.add_argument("--stub-latency-ms", type=float, default=50)
+    r.add_argument("--structured", action="store_true", help="JSON 모드(IMD_STRUCTURED_OUTPUT)로 재실행")
+    r.add_argument("--personas", default="", help="쉼표 구분 (기본: 전체)")
+    r.add_argument("--variant", default="", help="프롬프트 변형 (기본: 대화에 기록된 변형, 없으면 control)")
+    r.add_argument("--limit", type=int, default=0, help="최대 턴 수")
+    r.add_argument("--pool", default="thread", choices=["thread", "process"])
+    r.add_argument("--workers", type=int, default=4)
+    r.add_argument("--rps", type=float, default=0, help="초당 LLM 호출 수 제한 (0: 무제한)")
+    r.add_argument("--cache-dir", default=CACHE_DIR)
+    r.add_argument("--no-cache", action="store_true")
+    r.add_argument("--min-tag-rate", type=float, default=0.0, help="전체 STAGE 태그 출력률이 이보다 낮으면 종료 코드 1")
+    r.add_argument("--json", default="", help="턴별 결과까지 JSON으로 저장할 경로")
+    sub.add_parser("variants", help="정의된 프롬프트 변형 (배정 비율, 접두부 토큰)")
+    args = parser.parse_args(argv)
+
+    if args.command == "variants":
+        return show_variants(args)
+    return export(args) if args.command == "export" else run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
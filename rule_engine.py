@@ -0,0 +1,186 @@
+"""
+IMD Sales Bot - Rule Engine
+config.py의 규칙 테이블(RECOMMENDATION_RULES)을 컴파일해서 진단 결과를 O(1)로 조회
+- 차원(연령대/고민 부위/시술 경험)별 규칙을 인덱싱
+- 버튼 선택지의 모든 조합 결과를 미리 계산해 두고, 방문자에게는 조회만 수행
+- 전체 규칙 매트릭스를 오프라인에서 한 번에 검사 (python rule_engine.py lift)
+"""
+
+import itertools
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from config import get_config
+from text_norm import compact, contains_any
+
+# 자유 입력 값 → 규칙 번호 메모 상한 (버튼 값은 컴파일 시 인덱싱되어 제외)
+_MEMO_LIMIT = 1024
+
+
+class RuleTable:
+    """차원별 키워드 규칙을 컴파일한 조회 테이블"""
+
+    def __init__(self, rules: Dict, known_values: Optional[Dict[str, List[str]]] = None):
+        """
+        Args:
+            rules: {"dimensions": [...], "<차원>": [{"match": [...], <결과 필드>...}, ...]}
+            known_values: 차원별로 미리 인덱싱할 값 (버튼 선택지)
+        """
+        self.dimensions: List[str] = list(rules.get("dimensions", []))
+        self._rules: Dict[str, List[Dict]] = {dim: rules[dim] for dim in self.dimensions}
+        # 규칙 키워드는 붙여 쓴 형태로 한 번만 변환
+        self._match: Dict[str, List[Tuple[str, ...]]] = {
+            dim: [tuple(compact(kw) for kw in rule.get("match", [])) for rule in self._rules[dim]]
+            for dim in self.dimensions
+        }
+        self._known: Dict[str, List[str]] = {dim: list((known_values or {}).get(dim, [])) for dim in self.dimensions}
+
+        # 차원별 값 → 규칙 번호 인덱스
+        self._index: Dict[str, Dict[str, int]] = {dim: {} for dim in self.dimensions}
+        self._memo: Dict[str, Dict[str, int]] = {dim: {} for dim in self.dimensions}
+        for dim, values in self._known.items():
+            for value in values:
+                self._index[dim][value] = self._scan(dim, value)
+
+        # 규칙 번호 조합별 결과를 미리 병합 (조회 시 dict 하나만 꺼냄)
+        self._answers: Dict[Tuple[int, ...], Dict] = {}
+        ranges = [range(len(self._rules[dim])) for dim in self.dimensions]
+        for combo in itertools.product(*ranges):
+            merged: Dict = {}
+            for dim, rule_idx in zip(self.dimensions, combo):
+                merged.update({k: v for k, v in self._rules[dim][rule_idx].items() if k != "match"})
+            self._answers[combo] = merged
+
+    # --------------------------------------------------
+    # 매칭
+    # --------------------------------------------------
+    def _scan(self, dim: str, value: str) -> int:
+        """
+        위에서부터 첫 번째로 키워드가 포함된 규칙, 없으면 기본 규칙(match가 빈 규칙)
+        띄어쓰기/대소문자 무시 ("3년 이내" ↔ "3년이내요")
+        """
+        default_idx = len(self._rules[dim]) - 1
+        for idx, keywords in enumerate(self._match[dim]):
+            if not keywords:
+                default_idx = idx
+                continue
+            if contains_any(value, keywords):
+                return idx
+        return default_idx
+
+    def rule_index(self, dim: str, value: str) -> int:
+        """값이 걸리는 규칙 번호 (버튼 값은 O(1), 자유 입력은 1회 스캔 후 메모)"""
+        value = value or ""
+        idx = self._index[dim].get(value)
+        if idx is not None:
+            return idx
+        memo = self._memo[dim]
+        idx = memo.get(value)
+        if idx is None:
+            if len(memo) >= _MEMO_LIMIT:
+                memo.clear()
+            idx = memo[value] = self._scan(dim, value)
+        return idx
+
+    def lookup(self, **values: str) -> Dict:
+        """
+        차원 값으로 미리 병합된 결과 조회
+
+        Example:
+            table.lookup(age_group="40대", concern="깊어지는 팔자주름", treatment_history="없음(처음)")
+        """
+        key = tuple(self.rule_index(dim, values.get(dim, "")) for dim in self.dimensions)
+        return self._answers[key]
+
+    # --------------------------------------------------
+    # 오프라인 검사
+    # --------------------------------------------------
+    def matrix(self):
+        """
+        버튼 선택지 전체 조합의 결과 번호 매트릭스 (numpy 배열, 차원 순서대로)
+        각 칸 = 규칙 번호 조합을 하나의 정수로 인코딩한 값
+        """
+        import numpy as np
+
+        sizes = [len(self._rules[dim]) for dim in self.dimensions]
+        strides = np.cumprod([1] + sizes[::-1])[:-1][::-1]
+        axes = []
+        for axis, dim in enumerate(self.dimensions):
+            idx = np.array([self._index[dim][v] for v in self._known[dim]], dtype=np.int64)
+            shape = [1] * len(self.dimensions)
+            shape[axis] = len(idx)
+            axes.append((idx * strides[axis]).reshape(shape))
+        # 브로드캐스팅으로 전체 조합을 한 번에 계산
+        return sum(axes[1:], axes[0]) if axes else np.zeros(0, dtype=np.int64)
+
+    def check(self) -> List[str]:
+        """
+        규칙 테이블 검사 (문제 목록 반환, 비어 있으면 통과)
+        - 차원마다 기본 규칙(match가 빈 규칙)이 있는지
+        - 어떤 버튼 선택지에도 걸리지 않는 규칙이 있는지
+        - 전체 조합의 결과가 모두 존재하는지
+        """
+        import numpy as np
+
+        problems: List[str] = []
+        for dim in self.dimensions:
+            if not any(not rule.get("match") for rule in self._rules[dim]):
+                problems.append(f"[{dim}] 기본 규칙(match: [])이 없습니다.")
+            if not self._known[dim]:
+                continue
+            used = set(self._index[dim].values())
+            for idx, rule in enumerate(self._rules[dim]):
+                if idx not in used:
+                    problems.append(f"[{dim}] 규칙 {idx} {rule.get('match')}에 걸리는 선택지가 없습니다.")
+
+        if all(self._known[dim] for dim in self.dimensions):
+            codes = np.unique(self.matrix())
+            sizes = [len(self._rules[dim]) for dim in self.dimensions]
+            for code in codes.tolist():
+                combo = tuple(int(x) for x in np.unravel_index(code, sizes))
+                if combo not in self._answers:
+                    problems.append(f"조합 {combo}의 결과가 없습니다.")
+        return problems
+
+
+# ============================================
+# 페르소나별 테이블 캐시
+# ============================================
+_TABLES: Dict[str, Optional[RuleTable]] = {}
+
+
+def get_rule_table(client_id: str) -> Optional[RuleTable]:
+    """client_id의 RECOMMENDATION_RULES를 컴파일한 테이블 (규칙이 없으면 None)"""
+    if client_id not in _TABLES:
+        cfg = get_config(client_id)
+        rules = cfg.get("RECOMMENDATION_RULES")
+        table = None
+        if rules:
+            # 스크립트 단계의 버튼 선택지 = 차원별 인덱싱 대상 (슬롯 이름 = 차원 이름)
+            known: Dict[str, List[str]] = {}
+            for state in cfg.get("FUNNEL_SCRIPT", {}).values():
+                if state.get("slot"):
+                    known.setdefault(state["slot"], []).extend(state.get("options", {}))
+            table = RuleTable(rules, known)
+        _TABLES[client_id] = table
+    return _TABLES[client_id]
+
+
+def get_lift_recommendation(age_group, worry, history):
+    """고민 부위 + 연령대 + 시술 경험에 따른 맞춤 추천"""
+    result = get_rule_table("lift").lookup(age_group=age_group, concern=worry, treatment_history=history)
+    return result["treatment"], result["description"], result["urgency"], result["history_msg"]
+
+
+if __name__ == "__main__":
+    client = sys.argv[1] if len(sys.argv) > 1 else "lift"
+    table = get_rule_table(client)
+    if table is None:
+        print(f"{client}: RECOMMENDATION_RULES 없음")
+        sys.exit(0)
+    matrix = table.matrix()
+    print(f"{client}: 차원 {table.dimensions}, 선택지 조합 {matrix.size}개, 서로 다른 결과 {len(set(matrix.ravel().tolist()))}개")
+    issues = table.check()
+    for issue in issues:
+        print(" -", issue)
+    sys.exit(1 if issues else 0)
@@ -0,0 +1,322 @@
+"""
+IMD Sales Bot - Semantic Response Cache
+표현만 다른 같은 질문("얼마예요" / "가격이 어떻게 되나요" / "비용은?")에 최근 답변을 재사용해서 Gemini 호출 생략
+- 한국어 정규화(text_norm): NFKC/소문자 → 토큰화 → 조사·어미 제거 → 동의어 통일(얼마/비용/견적 → 가격) → 의문 표현 제거
+- 유사도: 토큰 + 글자 2-gram 집합의 자카드, MinHash 서명(NumPy) + LSH 밴드 버킷으로 후보만 비교
+- 범위: (페르소나, 단계, 프롬프트 변형, 부정/변경 표현)마다 따로, 유사도 기준(IMD_SEMANTIC_CACHE_THRESHOLD)과 TTL
+  ("부작용 있어요" ↔ "부작용 없어요", "예약 가능해요" ↔ "예약 취소 가능해요"는 토큰이 비슷해도 서로 다른 범위)
+- 저장: 태그가 정상 파싱된 자유 입력 턴만 (오류 문구/스크립트 턴 제외), 짧은 질문만 (긴 문장은 대화 맥락 의존)
+- 대화의 첫 질문만 저장/조회 (답변이 이전 대화에 의존하지 않음), 슬롯은 방문자별이라 저장하지 않음
+- 임베딩 API 없이 프로세스 메모리에서만 동작, 적중 시 수십 µs
+- 확인: python semantic_cache.py analyze "얼마예요" "가격이 어떻게 되나요" "비용은?"
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+from log_pipeline import get_logger
+from text_norm import analyze, query_terms
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+SEMANTIC_CACHE_ENABLED = os.getenv("IMD_SEMANTIC_CACHE", "1") != "0"
+# 쉼표 구분 페르소나 (* = 전체). 기본은 같은 질문이 가장 많이 반복되는 root
+SEMANTIC_CACHE_PERSONAS = os.getenv("IMD_SEMANTIC_CACHE_PERSONAS", "root")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("IMD_SEMANTIC_CACHE_THRESHOLD", "0.7"))
+SEMANTIC_CACHE_TTL = float(os.getenv("IMD_SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("IMD_SEMANTIC_CACHE_SIZE", "5000"))
+# 정규화 후 토큰이 이보다 많은 질문은 캐시하지 않음
+SEMANTIC_CACHE_MAX_TOKENS = int(os.getenv("IMD_SEMANTIC_CACHE_MAX_TOKENS", "6"))
+
+# MinHash 서명 길이 = 밴드 수 × 밴드당 행 수 (자카드 0.6 전후에서 후보로 잡힐 확률이 가파르게 오름)
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# 뜻을 뒤집거나 바꾸는 표현 (compact 형태) - 포함 여부가 같은 질문끼리만 비교
+MODIFIERS = ("안", "않", "없", "못", "말", "아니", "취소", "불가", "금지", "제외", "환불", "변경", "연기", "해지")
+
+
+# ============================================
+# 유사도
+# ============================================
+def shingles(tokens: Tuple[str, ...]) -> FrozenSet[str]:
+    """토큰 + 토큰 안 글자 2-gram (띄어쓰기/어순 차이에 덜 민감)"""
+    out: Set[str] = set()
+    for token in tokens:
+        out.add("w:" + token)
+        if len(token) == 1:
+            out.add(token)
+        for i in range(len(token) - 1):
+            out.add(token[i:i + 2])
+    return frozenset(out)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ============================================
+# MinHash / LSH
+# ============================================
+_rng = np.random.default_rng(0x1D5EED)
+_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+@lru_cache(maxsize=65536)
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def signature(shingle_set: FrozenSet[str]) -> np.ndarray:
+    """MinHash 서명 (곱셈-시프트 해시 NUM_PERM개를 한 번에)"""
+    x = np.fromiter((_shingle_hash(s) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    with np.errstate(over="ignore"):
+        return ((_A[:, None] * x[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+def band_keys(sig: np.ndarray) -> List[bytes]:
+    return [sig[i * ROWS:(i + 1) * ROWS].tobytes() for i in range(BANDS)]
+
+
+# ============================================
+# 캐시
+# ============================================
+Scope = Tuple[str, str, str]  # (persona, stage, variant)
+_Key = Tuple[Scope, FrozenSet[str]]  # (범위, 부정/변경 표현)
+
+
+def modifiers(text: str) -> FrozenSet[str]:
+    compacted = analyze(text).compact
+    return frozenset(word for word in MODIFIERS if word in compacted)
+
+
+class _Entry:
+    __slots__ = ("scope", "key", "shingles", "bands", "turn", "created")
+
+    def __init__(self, scope: _Key, key: str, shingle_set: FrozenSet[str], bands: List[bytes], turn: Dict):
+        self.scope = scope
+        self.key = key
+        self.shingles = shingle_set
+        self.bands = bands
+        self.turn = turn
+        self.created = time.monotonic()
+
+
+def _copy_turn(turn: Dict) -> Dict:
+    """슬롯은 답변을 만든 방문자의 대화에서 나온 값이라 빼고 복사"""
+    copied = dict(turn)
+    copied["buttons"] = list(turn.get("buttons") or [])
+    copied["slots"] = {}
+    return copied
+
+
+class SemanticCache:
+    """
+    범위별 근사 중복 질문 캐시 (LRU + TTL)
+    - 부정/변경 표현(MODIFIERS) 포함 여부가 다르면 비교하지 않음
+    - 정규화 결과가 완전히 같으면 dict 조회 한 번
+    - 아니면 MinHash LSH 버킷에서 후보를 모아 자카드가 가장 높은 항목 (기준 이상일 때만)
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_SIZE, max_tokens: int = SEMANTIC_CACHE_MAX_TOKENS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[_Key, str], int] = {}
+        self._buckets: Dict[Tuple[_Key, int, bytes], Set[int]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _analyze(self, text: str) -> Optional[Tuple[str, ...]]:
+        tokens = query_terms(text)
+        if not tokens or len(tokens) > self.max_tokens:
+            return None
+        return tokens
+
+    # ---------------- 조회 ----------------
+    def get(self, scope: Scope, text: str) -> Optional[Dict]:
+        """비슷한 질문의 캐시된 턴 ({'reply', 'stage', 'route', 'buttons', 'slots': {}}) 또는 None"""
+        tokens = self._analyze(text)
+        if tokens is None:
+            return None
+        scope = (scope, modifiers(text))
+        key = " ".join(tokens)
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._exact.get((scope, key))
+            if entry_id is not None:
+                entry = self._live(entry_id, now)
+                if entry is not None:
+                    self.hits += 1
+                    return _copy_turn(entry.turn)
+
+        shingle_set = shingles(tokens)
+        bands = band_keys(signature(shingle_set))
+        with self._lock:
+            candidates: Set[int] = set()
+            for i, band in enumerate(bands):
+                bucket = self._buckets.get((scope, i, band))
+                if bucket:
+                    candidates |= bucket
+            best, best_score = None, self.threshold
+            for entry_id in candidates:
+                entry = self._live(entry_id, now)
+                if entry is None:
+                    continue
+                score = jaccard(shingle_set, entry.shingles)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.near_hits += 1
+            return _copy_turn(best.turn)
+
+    def _live(self, entry_id: int, now: float) -> Optional[_Entry]:
+        """만료 안 된 항목 (만료됐으면 지움), lock 안에서 호출"""
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        if now - entry.created > self.ttl:
+            self._remove(entry_id)
+            return None
+        self._entries.move_to_end(entry_id)
+        return entry
+
+    # ---------------- 저장 ----------------
+    def put(self, scope: Scope, text: str, turn: Dict) -> bool:
+        """턴 저장 (정규화 결과가 같은 기존 항목은 새 답변으로 교체)"""
+        tokens = self._analyze(text)
+        if tokens is None:
+            return False
+        scope = (scope, modifiers(text))
+        key = " ".join(tokens)
+        shingle_set = shingles(tokens)
+        bands = band_keys(signature(shingle_set))
+        entry = _Entry(scope, key, shingle_set, bands, _copy_turn(turn))
+        with self._lock:
+            previous = self._exact.get((scope, key))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._exact[(scope, key)] = entry_id
+            for i, band in enumerate(bands):
+                self._buckets.setdefault((scope, i, band), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        if self._exact.get((entry.scope, entry.key)) == entry_id:
+            del self._exact[(entry.scope, entry.key)]
+        for i, band in enumerate(entry.bands):
+            bucket = self._buckets.get((entry.scope, i, band))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(entry.scope, i, band)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_CACHE: Optional[SemanticCache] = None
+_CACHE_LOCK = threading.Lock()
+_PERSONAS = frozenset(p.strip() for p in SEMANTIC_CACHE_PERSONAS.split(",") if p.strip())
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = SemanticCache()
+    return _CACHE
+
+
+def cache_enabled(persona: str) -> bool:
+    return SEMANTIC_CACHE_ENABLED and ("*" in _PERSONAS or persona in _PERSONAS)
+
+
+def lookup_turn(persona: str, stage: str, variant: str, text: str, first_question: bool) -> Optional[Dict]:
+    """
+    Args:
+        first_question: 이전 사용자 메시지가 없는 첫 질문인지 (이어지는 질문은 답변이 대화 맥락에 의존)
+    """
+    if not first_question or not cache_enabled(persona):
+        return None
+    return get_semantic_cache().get((persona, stage, variant), text)
+
+
+def store_turn(persona: str, stage: str, variant: str, text: str, turn: Dict, first_question: bool) -> bool:
+    """첫 질문의, 태그가 정상 파싱된 답변만 (추천 버튼이 없으면 오류 문구이거나 형식이 깨진 답변)"""
+    if not first_question or not cache_enabled(persona) or not turn.get("buttons"):
+        return False
+    return get_semantic_cache().put((persona, stage, variant), text, turn)
+
+
+# ============================================
+# CLI (정규화/유사도 확인)
+# ============================================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="의미 캐시 정규화/유사도 확인")
+    sub = parser.add_subparsers(dest="command", required=True)
+    analyze = sub.add_parser("analyze", help="문장별 정규화 토큰 + 첫 문장과의 유사도")
+    analyze.add_argument("texts", nargs="+")
+    args = parser.parse_args(argv)
+
+    base = shingles(query_terms(args.texts[0]))
+    base_modifiers = modifiers(args.texts[0])
+    for text in args.texts:
+        tokens = query_terms(text)
+        score = jaccard(base, shingles(tokens))
+        same_scope = modifiers(text) == base_modifiers
+        mark = "적중" if same_scope and score >= SEMANTIC_CACHE_THRESHOLD else "-"
+        extra = "" if same_scope else f" (부정/변경 표현 다름: {' '.join(sorted(modifiers(text))) or '없음'})"
+        print(f"{text!r:<30} → {' '.join(tokens) or '(없음)':<20} 유사도 {score:.2f} {mark}{extra}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""
+IMD Sales Bot - Session Store
+대화 세션을 st.session_state 밖에 저장해서 새로고침/재배포/기기 변경 후에도 이어가기
+- 메모리 / SQLite / 파일(JSONL) 저장소
+- 메시지는 한 건씩 추가만 (히스토리 전체를 다시 쓰지 않음)
+- 컨텍스트(단계, 슬롯, 요약)는 작은 JSON 한 줄로 덮어쓰기
+- 읽기는 프로세스 메모리 캐시 우선 (write-through)
+- 세션은 URL 토큰(?sid=)으로 식별
+"""
+
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+# memory | sqlite | file
+SESSION_STORE = os.getenv("IMD_SESSION_STORE", "sqlite")
+# sqlite: DB 파일 경로, file: 세션 디렉터리 (비우면 기본값)
+SESSION_PATH = os.getenv("IMD_SESSION_PATH", "")
+# 프로세스 메모리에 유지할 최근 세션 수
+SESSION_CACHE_SIZE = int(os.getenv("IMD_SESSION_CACHE_SIZE", "512"))
+# file: 컨텍스트 줄이 이만큼 쌓이면 파일을 메시지 + 마지막 컨텍스트 한 줄로 다시 씀
+SESSION_COMPACT_LINES = int(os.getenv("IMD_SESSION_COMPACT_LINES", "32"))
+
+_SID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def new_session_id() -> str:
+    """추측 불가능한 세션 토큰 (URL ?sid= 값)"""
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(sid: Optional[str]) -> bool:
+    return bool(sid) and bool(_SID_PATTERN.fullmatch(sid))
+
+
+def _new_session() -> Dict:
+    return {"messages": [], "state": {}}
+
+
+# ============================================
+# 저장소 인터페이스
+# ============================================
+class SessionStore:
+    """
+    세션 저장소 공통 인터페이스
+
+    세션 형식:
+        {
+            "messages": [메시지 dict, ...],   # 오래된 순
+            "state": {...},                   # user_context, interaction_count, history_summary
+        }
+    """
+
+    def load(self, sid: str) -> Optional[Dict]:
+        """저장된 세션 (없으면 None)"""
+        raise NotImplementedError
+
+    def append_message(self, sid: str, message: Dict) -> None:
+        """메시지 한 건 추가"""
+        raise NotImplementedError
+
+    def save_state(self, sid: str, state: Dict) -> None:
+        """컨텍스트 덮어쓰기"""
+        raise NotImplementedError
+
+    def clear(self, sid: str) -> None:
+        """세션 삭제 (새 상담 시작)"""
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """프로세스 메모리 저장소 (재시작 시 사라짐, 개발/테스트용)"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(sid)
+            return copy.deepcopy(session) if session else None
+
+    def append_message(self, sid: str, message: Dict) -> None:
+        with self._lock:
+            self._sessions.setdefault(sid, _new_session())["messages"].append(copy.deepcopy(message))
+
+    def save_state(self, sid: str, state: Dict) -> None:
+        with self._lock:
+            self._sessions.setdefault(sid, _new_session())["state"] = copy.deepcopy(state)
+
+    def clear(self, sid: str) -> None:
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite 저장소 (메시지 = 행 추가, 컨텍스트 = 세션 행 upsert)"""
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streamlit은 스크립트를 여러 스레드에서 실행하므로 연결 하나를 락으로 공유
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "sid TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT NOT NULL, body TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_sid ON messages (sid, id)")
+
+    def load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            bodies = self._conn.execute(
+                "SELECT body FROM messages WHERE sid = ? ORDER BY id", (sid,)
+            ).fetchall()
+        if row is None and not bodies:
+            return None
+        return {
+            "messages": [json.loads(body) for (body,) in bodies],
+            "state": json.loads(row[0]) if row else {},
+        }
+
+    def append_message(self, sid: str, message: Dict) -> None:
+        body = json.dumps(message, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute("INSERT INTO messages (sid, body) VALUES (?, ?)", (sid, body))
+
+    def save_state(self, sid: str, state: Dict) -> None:
+        body = json.dumps(state, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (sid, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (sid, body, datetime.now().isoformat()),
+            )
+
+    def clear(self, sid: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM messages WHERE sid = ?", (sid,))
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            self._conn.execute("COMMIT")
+
+
+class FileSessionStore(SessionStore):
+    """
+    파일 저장소 (세션당 JSONL 파일 하나, 모든 쓰기는 한 줄 추가)
+        {"m": 메시지}  → 메시지 추가
+        {"s": 컨텍스트} → 컨텍스트 교체 (마지막 줄이 유효)
+
+    컨텍스트 줄이 compact_lines개를 넘으면 메시지 + 마지막 컨텍스트로 파일을 다시 씀
+    (임시 파일 → os.replace, 세션 파일이 끝없이 커지지 않도록)
+    """
+
+    def __init__(self, directory: str = "sessions", compact_lines: int = SESSION_COMPACT_LINES):
+        self.directory = directory
+        self.compact_lines = compact_lines
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 세션별 컨텍스트 줄 수 (최근 세션만 유지 - 잊혀도 압축이 늦어질 뿐)
+        self._state_lines: "OrderedDict[str, int]" = OrderedDict()
+
+    def _path(self, sid: str) -> str:
+        return os.path.join(self.directory, f"{sid}.jsonl")
+
+    def _append(self, sid: str, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self._path(sid), "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def load(self, sid: str) -> Optional[Dict]:
+        path = self._path(sid)
+        if not os.path.exists(path):
+            return None
+        session = _new_session()
+        state_lines = 0
+        with self._lock, open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 쓰는 도중 종료된 마지막 줄
+                    continue
+                if "m" in record:
+                    session["messages"].append(record["m"])
+                elif "s" in record:
+                    session["state"] = record["s"]
+                    state_lines += 1
+            self._count_state_lines(sid, state_lines)
+        return session
+
+    def append_message(self, sid: str, message: Dict) -> None:
+        self._append(sid, {"m": message})
+
+    def save_state(self, sid: str, state: Dict) -> None:
+        line = json.dumps({"s": state}, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            state_lines = self._state_lines.pop(sid, 0) + 1
+            if state_lines > self.compact_lines and self._compact(sid, line):
+                state_lines = 1
+            else:
+                with open(self._path(sid), "a", encoding="utf-8") as f:
+                    f.write(line)
+            self._count_state_lines(sid, state_lines)
+
+    def clear(self, sid: str) -> None:
+        with self._lock:
+            self._state_lines.pop(sid, None)
+            try:
+                os.remove(self._path(sid))
+            except FileNotFoundError:
+                pass
+
+    def _count_state_lines(self, sid: str, count: int) -> None:
+        self._state_lines[sid] = count
+        self._state_lines.move_to_end(sid)
+        while len(self._state_lines) > SESSION_CACHE_SIZE:
+            self._state_lines.popitem(last=False)
+
+    def _compact(self, sid: str, state_line: str) -> bool:
+        """메시지 줄은 그대로 두고 컨텍스트는 새 줄 하나로 다시 씀 (_lock 보유 상태에서 호출, 실패 시 False)"""
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+                for line in src:
+                    if line.startswith('{"m":') and line.endswith("\n"):
+                        dst.write(line)
+                dst.write(state_line)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning("세션 파일 압축 실패 (%s): %s", path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+
+class WriteThroughCache(SessionStore):
+    """
+    저장소 앞단의 LRU 메모리 캐시
+    - 쓰기: 캐시와 저장소에 동시에 반영
+    - 읽기: 캐시에 있으면 저장소를 읽지 않음
+    """
+
+    def __init__(self, backend: SessionStore, max_sessions: int = SESSION_CACHE_SIZE):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, sid: str) -> Optional[Dict]:
+        session = self._cache.get(sid)
+        if session is not None:
+            self._cache.move_to_end(sid)
+        return session
+
+    def _put(self, sid: str, session: Dict) -> None:
+        self._cache[sid] = session
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.max_sessions:
+            self._cache.popitem(last=False)
+
+    def load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._cached(sid)
+            if session is not None:
+                return copy.deepcopy(session)
+        session = self.backend.load(sid)
+        with self._lock:
+            # 없는 세션도 빈 세션으로 캐시 (이후 쓰기가 캐시에 그대로 쌓임)
+            self._put(sid, copy.deepcopy(session) if session is not None else _new_session())
+        return session
+
+    def append_message(self, sid: str, message: Dict) -> None:
+        self.backend.append_message(sid, message)
+        with self._lock:
+            session = self._cached(sid)
+            if session is not None:
+                session["messages"].append(copy.deepcopy(message))
+
+    def save_state(self, sid: str, state: Dict) -> None:
+        self.backend.save_state(sid, state)
+        with self._lock:
+            session = self._cached(sid)
+            if session is not None:
+                session["state"] = copy.deepcopy(state)
+
+    def clear(self, sid: str) -> None:
+        self.backend.clear(sid)
+        with self._lock:
+            # 빈 세션으로 캐시해 두면 다음 load에서 저장소를 읽지 않음
+            self._put(sid, _new_session())
+
+
+# ============================================
+# 싱글톤
+# ============================================
+_STORE: Optional[SessionStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def create_session_store(kind: str = SESSION_STORE, path: str = SESSION_PATH) -> SessionStore:
+    """설정값으로 저장소 생성 (디스크 저장소를 열 수 없으면 메모리로 폴백)"""
+    if kind == "memory":
+        return MemorySessionStore()
+    try:
+        if kind == "file":
+            backend: SessionStore = FileSessionStore(path or "sessions")
+        else:
+            backend = SQLiteSessionStore(path or "sessions.db")
+    except Exception as e:
+        logger.warning("세션 저장소(%s) 초기화 실패, 메모리 저장소 사용: %s", kind, e)
+        return MemorySessionStore()
+    return WriteThroughCache(backend)
+
+
+def get_session_store() -> SessionStore:
+    """프로세스 공용 세션 저장소"""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = create_session_store()
+    return _STORE
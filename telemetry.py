@@ -0,0 +1,271 @@
+"""
+IMD Sales Bot - Telemetry
+턴 처리 구간별 소요 시간 측정 (span → 히스토그램 → Prometheus 텍스트)
+- 구간: prompt_build, llm, tag_parse, veritas, transcript_render, lead_save, turn, rerun
+- 라벨: persona(client_id), stage
+- 히스토그램은 프로세스 메모리에만 보관 (api_server의 GET /metrics로 노출)
+- Streamlit 프로세스(rerun, transcript_render 등)는 IMD_METRICS_PORT를 지정하면 같은 형식으로 별도 포트에서 노출
+- IMD_TRACE_PATH를 지정하면 span마다 JSONL 한 줄 기록 (느린 턴 하나를 끝까지 추적할 때)
+
+사용 예:
+    with span("llm", persona=client_id, stage=stage):
+        raw = _call_llm(prompt)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from log_pipeline import get_logger
+
+logger = get_logger(__name__)
+
+
+# ============================================
+# 설정
+# ============================================
+TELEMETRY_ENABLED = os.getenv("IMD_TELEMETRY", "1") != "0"
+TRACE_PATH = os.getenv("IMD_TRACE_PATH", "")
+# Streamlit 프로세스용 /metrics 포트 (0이면 끔 - api_server는 자체 /metrics 사용)
+METRICS_HOST = os.getenv("IMD_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("IMD_METRICS_PORT", "0") or 0)
+
+# 히스토그램 버킷 상한 (초) - 스크립트 처리(ms) ~ LLM 대기(수 초)까지
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_NAME = "imd_span_seconds"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ============================================
+# 히스토그램
+# ============================================
+class Histogram:
+    """고정 버킷 히스토그램 (버킷별 개수는 누적하지 않고 저장, 내보낼 때 누적)"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """버킷 상한 기준 근사 분위수 (초)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """(span, persona, stage) 별 히스토그램 모음"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists: Dict[Tuple[str, str, str], Histogram] = {}
+
+    def observe(self, name: str, persona: str, stage: str, seconds: float):
+        key = (name, persona or "", stage or "")
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = Histogram()
+            hist.observe(seconds)
+
+    def items(self) -> List[Tuple[Tuple[str, str, str], Histogram]]:
+        with self._lock:
+            return sorted(self._hists.items())
+
+    def reset(self):
+        with self._lock:
+            self._hists.clear()
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each stage of a conversation turn.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for (name, persona, stage), hist in self.items():
+            labels = f'span="{_escape(name)}",persona="{_escape(persona)}",stage="{_escape(stage)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, hist.counts):
+                cumulative += n
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_REGISTRY = Registry()
+
+
+def get_registry() -> Registry:
+    return _REGISTRY
+
+
+def render_prometheus() -> str:
+    return _REGISTRY.render_prometheus()
+
+
+# ============================================
+# /metrics 서버 (Streamlit 프로세스용)
+# ============================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+_metrics_lock = threading.Lock()
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    GET /metrics 데몬 서버 시작 (프로세스당 한 번, 이후 호출은 기존 서버 반환)
+
+    Streamlit은 스크립트를 매 클릭마다 다시 실행하므로 여러 번 호출돼도 안전해야 함.
+    port가 0이거나 포트를 열 수 없으면 None (경고만 남기고 앱은 계속)
+    """
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("/metrics 서버 시작 실패 (%s:%s): %s", host, port, e)
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="imd-metrics", daemon=True).start()
+            _metrics_server = server
+        return _metrics_server
+
+
+# ============================================
+# JSONL 트레이스
+# ============================================
+_trace_lock = threading.Lock()
+_trace_file = None
+
+
+def _write_trace(record: Dict):
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, "a", encoding="utf-8", buffering=1)
+        _trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# ============================================
+# Span
+# ============================================
+_current: ContextVar[Optional["Span"]] = ContextVar("imd_span", default=None)
+
+
+class Span:
+    """
+    구간 하나의 시간 측정
+    - with 블록: 중첩된 span이 같은 trace id / 부모 이름을 물려받음
+    - begin/end 방식: Streamlit 재실행처럼 with로 감쌀 수 없는 구간용
+    """
+
+    __slots__ = ("name", "persona", "stage", "trace_id", "parent", "started", "seconds", "ended", "_token")
+
+    def __init__(self, name: str, persona: str = "", stage: str = ""):
+        parent = _current.get()
+        self.name = name
+        self.persona = persona or (parent.persona if parent else "")
+        self.stage = stage or (parent.stage if parent else "")
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent = parent.name if parent else None
+        self.ended = False
+        self.seconds = 0.0
+        self._token = None
+        self.started = time.perf_counter()
+
+    def end(self, stage: Optional[str] = None) -> float:
+        """구간 종료 (두 번째 호출부터는 무시), 소요 시간(초) 반환"""
+        if self.ended:
+            return self.seconds
+        seconds = self.seconds = time.perf_counter() - self.started
+        self.ended = True
+        if stage:
+            self.stage = stage
+        # 대량 이벤트라 DEBUG (IMD_LOG_DEBUG_SAMPLE 비율만 기록)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "span %s", self.name,
+                extra={"persona": self.persona, "stage": self.stage, "fields": {
+                    "span": self.name, "parent": self.parent, "trace": self.trace_id,
+                    "latency_ms": round(seconds * 1000, 2),
+                }},
+            )
+        if TELEMETRY_ENABLED:
+            _REGISTRY.observe(self.name, self.persona, self.stage, seconds)
+            if TRACE_PATH:
+                _write_trace({
+                    "ts": round(time.time(), 3),
+                    "trace": self.trace_id,
+                    "span": self.name,
+                    "parent": self.parent,
+                    "persona": self.persona,
+                    "stage": self.stage,
+                    "ms": round(seconds * 1000, 2),
+                })
+        return seconds
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end()
+        return False
+
+
+def span(name: str, persona: str = "", stage: str = "") -> Span:
+    """
+    span 시작 (with 블록 또는 .end() 호출로 종료)
+
+    Args:
+        name: 구간 이름 (prompt_build, llm, tag_parse, veritas, transcript_render, lead_save, turn, rerun)
+        persona: client_id (비우면 부모 span에서 상속)
+        stage: 퍼널 단계 (비우면 부모 span에서 상속)
+    """
+    return Span(name, persona, stage)
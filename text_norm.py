@@ -0,0 +1,153 @@
+"""
+IMD Sales Bot - Korean Text Normalization
+사용자 입력 정규화/토큰화를 한 곳에서 (키워드 추출, 의미 캐시 키, 지식 검색, 증상 규칙 매칭이 같은 결과를 재사용)
+- analyze(text): NFKC/소문자/공백 정리 → 붙여 쓴 형태(띄어쓰기 무시) → 토큰 → 조사·어미 제거 → 동의어 통일
+- 결과는 불변 튜플이라 LRU(IMD_TEXT_NORM_CACHE)에 그대로 보관 → 같은 입력은 한 번만 분석
+  (한 턴 안에서 컨텍스트 추출, 의미 캐시, 지식 검색이 같은 문장을 각각 다시 훑지 않음)
+- 확인: python text_norm.py "비용은요?" "3년 이내요"
+"""
+
+import os
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+TEXT_NORM_CACHE_SIZE = int(os.getenv("IMD_TEXT_NORM_CACHE", "8192"))
+
+_TOKEN_RE = re.compile(r"[가-힣]+|[a-z0-9]+")
+_HANGUL_RE = re.compile(r"[가-힣]")
+_SPACE_RE = re.compile(r"\s+")
+_NON_WORD_RE = re.compile(r"[^0-9a-z가-힣]+")
+
+# 어미 (토큰 끝, 긴 것부터) - 떼고 나서 한 글자 이상 남을 때만
+_ENDINGS = tuple(sorted((
+    "입니까", "인가요", "이에요", "예요", "에요", "이요", "나요", "가요", "까요", "세요",
+    "어요", "아요", "해요", "네요", "죠", "요", "니까", "냐", "니",
+), key=len, reverse=True))
+# 조사 - 떼고 나서 두 글자 이상 남을 때만 ("평가" → "평" 방지)
+_PARTICLES = tuple(sorted((
+    "으로", "에서", "이랑", "하고", "은", "는", "이", "가", "을", "를", "도", "만", "의", "에", "로", "랑",
+), key=len, reverse=True))
+
+# 같은 뜻 → 대표 단어
+SYNONYMS: Dict[str, str] = {
+    "얼마": "가격", "비용": "가격", "견적": "가격", "금액": "가격", "요금": "가격", "단가": "가격",
+    "가격대": "가격", "돈": "가격", "값": "가격", "price": "가격", "cost": "가격",
+    "효능": "효과", "효과있": "효과",
+    "리뷰": "후기", "사례": "후기", "레퍼런스": "후기",
+    "문의": "상담", "연락": "상담",
+    "시연": "데모", "체험": "데모", "demo": "데모",
+    "적용": "도입",
+}
+
+# 의미 없는 의문/요청 표현
+STOPWORDS: FrozenSet[str] = frozenset((
+    "어떻게", "어떤", "어때", "어떠", "되", "되나", "돼", "하", "해", "하나", "할", "궁금", "궁금하", "알려",
+    "알려주", "주", "좀", "그", "저", "이거", "그거", "혹시", "정도", "있", "있나", "뭐", "무엇", "뭔",
+    "대략", "대충", "보통", "나", "알", "싶",
+))
+
+
+def strip_suffix(token: str) -> str:
+    """조사/어미 제거 ("비용은요" → "비용은" → "비용")"""
+    for _ in range(2):
+        for ending in _ENDINGS:
+            if token.endswith(ending) and len(token) > len(ending):
+                token = token[: -len(ending)]
+                break
+        else:
+            for particle in _PARTICLES:
+                if token.endswith(particle) and len(token) - len(particle) >= 2:
+                    token = token[: -len(particle)]
+                    break
+            else:
+                break
+    return token
+
+
+class Analyzed(NamedTuple):
+    """analyze() 결과 (캐시에서 공유되므로 불변)"""
+    text: str                 # NFKC + 소문자 + 공백 하나로
+    compact: str              # 공백/문장부호 제거 ("3년 이내요?" → "3년이내요")
+    tokens: Tuple[str, ...]   # 한글/영숫자 덩어리
+    stems: Tuple[str, ...]    # 조사·어미 제거
+    terms: Tuple[str, ...]    # 동의어 통일 + 의문 표현 제거 + 중복 제거 (질문 비교용)
+    has_hangul: bool
+
+
+@lru_cache(maxsize=TEXT_NORM_CACHE_SIZE)
+def analyze(text: str) -> Analyzed:
+    normalized = _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text or "").lower()).strip()
+    tokens = tuple(_TOKEN_RE.findall(normalized))
+    stems = tuple(strip_suffix(token) for token in tokens)
+    terms: List[str] = []
+    for raw, stem in zip(tokens, stems):
+        term = SYNONYMS.get(raw) or SYNONYMS.get(stem, stem)
+        if term and term not in STOPWORDS and term not in terms:
+            terms.append(term)
+    return Analyzed(
+        text=normalized,
+        compact=_NON_WORD_RE.sub("", normalized),
+        tokens=tokens,
+        stems=stems,
+        terms=tuple(terms),
+        has_hangul=_HANGUL_RE.search(normalized) is not None,
+    )
+
+
+# ============================================
+# 자주 쓰는 형태
+# ============================================
+def query_terms(text: str) -> Tuple[str, ...]:
+    """질문 비교용 대표 토큰 ("얼마예요" / "비용은?" → ('가격',))"""
+    return analyze(text).terms
+
+
+def keywords(text: str, min_len: int = 2) -> Tuple[str, ...]:
+    """한글 키워드 (조사·어미 제거, 순서 유지, 중복 제거)"""
+    seen: List[str] = []
+    for stem in analyze(text).stems:
+        if len(stem) >= min_len and _HANGUL_RE.match(stem) and stem not in seen:
+            seen.append(stem)
+    return tuple(seen)
+
+
+@lru_cache(maxsize=1024)
+def compact(text: str) -> str:
+    """띄어쓰기/문장부호 무시 비교용"""
+    return _NON_WORD_RE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def contains_any(text: str, words: Iterable[str]) -> bool:
+    """
+    단어 중 하나라도 포함 (띄어쓰기/대소문자 무시: "광고 비" ↔ "광고비")
+
+    Args:
+        words: compact() 형태 (공백 없는 소문자) - 상수 목록은 미리 변환해 둘 것
+    """
+    haystack = analyze(text).compact
+    return any(word in haystack for word in words)
+
+
+def has_hangul(text: str) -> bool:
+    return analyze(text).has_hangul
+
+
+def cache_info():
+    return analyze.cache_info()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    for text in (argv if argv is not None else sys.argv[1:]):
+        result = analyze(text)
+        print(f"{text!r}")
+        print(f"  compact: {result.compact}")
+        print(f"  stems:   {' '.join(result.stems)}")
+        print(f"  terms:   {' '.join(result.terms) or '(없음)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
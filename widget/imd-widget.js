@@ -0,0 +1,352 @@
+/*
+ * IMD Sales Bot - 임베드 채팅 위젯
+ * - 첫 화면(인사말 + 추천 버튼)은 personas.js 데이터로 즉시 그림 (서버 호출 없음)
+ * - 방문자가 처음 버튼을 누르거나 입력할 때만 백엔드 세션 생성 (POST /sessions/{id}/turns)
+ * - 답변은 SSE로 스트리밍
+ *
+ * 사용법:
+ *   <div id="imd-chat" data-api="https://api.example.com" data-client="lift"
+ *        data-fallback="https://imdimd.streamlit.app/"></div>
+ *   <script src="widget/personas.js"></script>
+ *   <script src="widget/imd-widget.js"></script>
+ *
+ *   data-api      : api_server.py 주소 (비우면 첫 입력 때 data-fallback의 Streamlit 앱으로 전환,
+ *                   현재 URL 파라미터(?sid=, 추적 파라미터 등)와 첫 입력(?first=)을 그대로 넘김)
+ *   data-client   : 페르소나 (비우면 URL ?client=, 그것도 없으면 root)
+ */
+(function () {
+  "use strict";
+
+  var STYLE = [
+    ".imd-w{font-family:-apple-system,BlinkMacSystemFont,'Apple SD Gothic Neo','Malgun Gothic',sans-serif;max-width:720px;margin:0 auto;height:100%;display:flex;flex-direction:column;background:#fff;color:#1F2937}",
+    ".imd-head{text-align:center;padding:20px 16px 8px}",
+    ".imd-head h1{font-size:22px;margin:0;color:#111827}",
+    ".imd-head div{font-size:14px;color:#4B5563;margin-top:4px}",
+    ".imd-log{flex:1;overflow-y:auto;padding:8px 16px}",
+    ".imd-ai{background:#F9FAFB;border:1px solid #E5E7EB;border-radius:18px 18px 18px 4px;padding:12px 16px;margin:10px 0;max-width:85%;font-size:16px;line-height:1.5}",
+    ".imd-me{text-align:right;margin:8px 0}",
+    ".imd-me span{display:inline-block;background:#E5E7EB;border-radius:18px 18px 4px 18px;padding:10px 16px;max-width:70%;font-size:16px;text-align:left}",
+    ".imd-chips{display:flex;flex-wrap:wrap;gap:8px;padding:4px 16px 8px}",
+    ".imd-chips button,.imd-form button{flex:1 1 45%;border:1px solid #D1D5DB;background:#fff;border-radius:10px;padding:10px;font-size:14px;cursor:pointer}",
+    ".imd-chips button:hover{background:#F3F4F6}",
+    ".imd-guide{width:100%;text-align:center;font-weight:600;margin:4px 0}",
+    ".imd-form{padding:8px 16px;border-top:1px solid #E5E7EB}",
+    ".imd-form h3{text-align:center;font-size:17px;margin:12px 0 4px}",
+    ".imd-form p{text-align:center;color:#6B7280;font-size:13px;margin:0 0 10px}",
+    ".imd-form input{width:100%;box-sizing:border-box;border:1px solid #D1D5DB;border-radius:8px;padding:10px;margin:4px 0 8px;font-size:15px}",
+    ".imd-form button{width:100%;background:#111827;color:#fff;border:none}",
+    ".imd-err{color:#B91C1C;font-size:13px;text-align:center}",
+    ".imd-input{display:flex;gap:8px;padding:10px 16px;border-top:1px solid #E5E7EB}",
+    ".imd-input input{flex:1;border:1px solid #D1D5DB;border-radius:20px;padding:10px 14px;font-size:15px}",
+    ".imd-input button{border:none;background:#111827;color:#fff;border-radius:20px;padding:0 16px;cursor:pointer}"
+  ].join("\n");
+
+  function el(tag, cls, text) {
+    var node = document.createElement(tag);
+    if (cls) node.className = cls;
+    if (text != null) node.textContent = text;
+    return node;
+  }
+
+  // 메시지 렌더링: HTML 이스케이프 후 **굵게**, 줄바꿈만 지원
+  function renderText(node, text) {
+    var safe = String(text)
+      .replace(/&/g, "&amp;")
+      .replace(/</g, "&lt;")
+      .replace(/>/g, "&gt;");
+    node.innerHTML = safe.replace(/\*\*(.+?)\*\*/g, "<strong>$1</strong>").replace(/\n/g, "<br>");
+  }
+
+  function newSessionId() {
+    var bytes = new Uint8Array(16);
+    (window.crypto || window.msCrypto).getRandomValues(bytes);
+    return Array.prototype.map.call(bytes, function (b) {
+      return ("0" + b.toString(16)).slice(-2);
+    }).join("");
+  }
+
+  function Widget(root) {
+    var params = new URLSearchParams(window.location.search);
+    this.root = root;
+    this.api = (root.getAttribute("data-api") || "").replace(/\/$/, "");
+    this.fallback = root.getAttribute("data-fallback") || "";
+    this.client = root.getAttribute("data-client") || params.get("client") || "root";
+    this.persona = (window.IMD_PERSONAS || {})[this.client] || (window.IMD_PERSONAS || {}).root;
+    this.storageKey = "imd-sid-" + this.client;
+    this.sid = null;
+    this.busy = false;
+    this.build();
+    // API 없이 이어가는 상담(?sid=)은 첫 입력을 기다리지 않고 바로 앱으로
+    if (!this.api && this.fallback && params.get("sid")) {
+      this.openFallback();
+      return;
+    }
+    this.resume();
+  }
+
+  Widget.prototype.build = function () {
+    var self = this;
+    var style = el("style");
+    style.textContent = STYLE;
+    document.head.appendChild(style);
+
+    var box = el("div", "imd-w");
+    var head = el("div", "imd-head");
+    head.appendChild(el("h1", null, this.persona.title));
+    head.appendChild(el("div", null, this.persona.sub));
+    this.log = el("div", "imd-log");
+    this.chips = el("div", "imd-chips");
+    this.extra = el("div");
+
+    var bar = el("form", "imd-input");
+    this.input = el("input");
+    this.input.placeholder = "메시지를 입력해주세요";
+    this.input.maxLength = 1000;
+    bar.appendChild(this.input);
+    bar.appendChild(el("button", null, "전송"));
+    bar.addEventListener("submit", function (e) {
+      e.preventDefault();
+      var text = self.input.value.trim();
+      if (!text) return;
+      self.input.value = "";
+      self.send(text, "text");
+    });
+
+    box.appendChild(head);
+    box.appendChild(this.log);
+    box.appendChild(this.chips);
+    box.appendChild(this.extra);
+    box.appendChild(bar);
+    this.root.appendChild(box);
+
+    // 첫 화면은 정적 데이터로 (서버 호출 없음)
+    this.addMessage("ai", this.persona.initial_msg);
+    this.setChips(this.persona.chips);
+  };
+
+  // 이미 대화한 적이 있는 방문자만 서버에서 이어받음
+  Widget.prototype.resume = function () {
+    var self = this;
+    var sid = this.api && window.localStorage ? localStorage.getItem(this.storageKey) : null;
+    if (!sid) return;
+    fetch(this.api + "/sessions/" + sid)
+      .then(function (r) { return r.ok ? r.json() : null; })
+      .then(function (session) {
+        if (!session) {
+          localStorage.removeItem(self.storageKey);
+          return;
+        }
+        self.sid = sid;
+        self.log.innerHTML = "";
+        session.messages.forEach(function (m) { self.addMessage(m.role, m.text); });
+        self.applySession(session);
+      })
+      .catch(function () {});
+  };
+
+  Widget.prototype.addMessage = function (role, text) {
+    var node;
+    if (role === "user") {
+      node = el("div", "imd-me");
+      node.appendChild(el("span", null, text));
+    } else {
+      node = el("div", "imd-ai");
+      renderText(node, text);
+    }
+    this.log.appendChild(node);
+    this.log.scrollTop = this.log.scrollHeight;
+    return node;
+  };
+
+  Widget.prototype.setChips = function (labels) {
+    var self = this;
+    this.chips.innerHTML = "";
+    (labels || []).forEach(function (label) {
+      var b = el("button", null, label);
+      b.type = "button";
+      b.addEventListener("click", function () { self.send(label, "button"); });
+      self.chips.appendChild(b);
+    });
+  };
+
+  // Streamlit 앱으로 전환 (API 미설정 시) - 방문자의 첫 입력은 앱이 ?first=로 이어서 처리
+  Widget.prototype.openFallback = function (text, kind) {
+    var params = new URLSearchParams(window.location.search);
+    if (this.root.getAttribute("data-client")) params.set("client", this.client);
+    if (text) {
+      params.set("first", text);
+      params.set("first_kind", kind);
+    }
+    params.set("embed", "true");
+    var frame = el("iframe");
+    frame.src = this.fallback + "?" + params.toString();
+    // Streamlit 하단 푸터는 프레임 밖으로 밀어서 숨김
+    frame.style.cssText = "width:100%;height:calc(100% + 40px);border:none;display:block;margin-bottom:-40px";
+    this.root.innerHTML = "";
+    this.root.appendChild(frame);
+  };
+
+  Widget.prototype.send = function (text, kind) {
+    if (this.busy) return;
+    if (!this.api) {
+      if (this.fallback) this.openFallback(text, kind);
+      return;
+    }
+    var self = this;
+    this.busy = true;
+    if (!this.sid) this.sid = newSessionId();
+    this.addMessage("user", text);
+    this.setChips([]);
+    this.extra.innerHTML = "";
+    var bubble = this.addMessage("ai", "…");
+    var streamed = "";
+
+    fetch(this.api + "/sessions/" + this.sid + "/turns", {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+      body: JSON.stringify({ text: text, type: kind, client_id: this.client })
+    }).then(function (resp) {
+      return readEvents(resp, function (event, data) {
+        if (event === "delta") {
+          streamed += data.text;
+          renderText(bubble, streamed);
+          self.log.scrollTop = self.log.scrollHeight;
+        } else if (event === "done") {
+          renderText(bubble, data.turn.reply);
+          if (window.localStorage) localStorage.setItem(self.storageKey, self.sid);
+          self.applySession(data.session, data.turn.route);
+        } else if (event === "error") {
+          renderText(bubble, data.error || "잠시 후 다시 시도해주세요.");
+        }
+      });
+    }).catch(function () {
+      renderText(bubble, "연결이 원활하지 않습니다. 잠시 후 다시 시도해주세요.");
+    }).then(function () {
+      self.busy = false;
+    });
+  };
+
+  Widget.prototype.post = function (path, body) {
+    return fetch(this.api + "/sessions/" + this.sid + path, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body)
+    }).then(function (r) { return r.json(); });
+  };
+
+  // 서버 세션 상태 → 버튼 / 선택 UI / 리드 폼 / 데모 이동
+  Widget.prototype.applySession = function (session, route) {
+    var self = this;
+    this.setChips(session.buttons);
+    this.extra.innerHTML = "";
+
+    if (route) {
+      var go = el("div", "imd-chips");
+      var b = el("button", null, "데모 체험하기 →");
+      b.type = "button";
+      b.addEventListener("click", function () {
+        window.location.search = "?client=" + encodeURIComponent(route);
+      });
+      go.appendChild(b);
+      this.extra.appendChild(go);
+    }
+
+    if (session.options && session.options.length) {
+      var box = el("div", "imd-chips");
+      box.appendChild(el("div", "imd-guide", this.persona.option_guide));
+      session.options.forEach(function (opt) {
+        var ob = el("button", null, (opt.emoji ? opt.emoji + " " : "") + opt.name);
+        ob.type = "button";
+        ob.addEventListener("click", function () {
+          self.post("/options", { key: opt.key }).then(function (data) {
+            if (data.turn) self.addMessage("ai", data.turn.reply);
+            if (data.session) self.applySession(data.session);
+          });
+        });
+        box.appendChild(ob);
+      });
+      this.extra.appendChild(box);
+    }
+
+    if (session.cta && session.cta.show) this.renderForm(session.cta.fields);
+  };
+
+  Widget.prototype.renderForm = function (fields) {
+    var self = this;
+    var p = this.persona;
+    var form = el("form", "imd-form");
+    form.appendChild(el("h3", null, p.cta_title));
+    form.appendChild(el("p", null, p.cta_sub));
+    var inputs = {};
+    fields.forEach(function (f) {
+      form.appendChild(el("label", null, f.label));
+      var input = el("input");
+      input.name = f.name;
+      input.placeholder = f.placeholder;
+      inputs[f.name] = input;
+      form.appendChild(input);
+    });
+    if (p.cta_note) form.appendChild(el("p", null, p.cta_note));
+    var err = el("div", "imd-err");
+    form.appendChild(err);
+    form.appendChild(el("button", null, p.form_button));
+    form.addEventListener("submit", function (e) {
+      e.preventDefault();
+      var body = {};
+      Object.keys(inputs).forEach(function (k) { body[k] = inputs[k].value.trim(); });
+      self.post("/leads", body).then(function (data) {
+        if (!data.ok) {
+          err.textContent = data.message || data.error || "";
+          return;
+        }
+        var last = data.session.messages[data.session.messages.length - 1];
+        self.addMessage("ai", last.text);
+        self.applySession(data.session);
+      });
+    });
+    this.extra.appendChild(form);
+  };
+
+  // fetch 응답 본문을 SSE 이벤트 단위로 파싱
+  function readEvents(resp, onEvent) {
+    var reader = resp.body.getReader();
+    var decoder = new TextDecoder("utf-8");
+    var buffer = "";
+
+    function flush() {
+      var idx;
+      while ((idx = buffer.indexOf("\n\n")) >= 0) {
+        var block = buffer.slice(0, idx);
+        buffer = buffer.slice(idx + 2);
+        var event = "message";
+        var data = "";
+        block.split("\n").forEach(function (line) {
+          if (line.indexOf("event: ") === 0) event = line.slice(7);
+          else if (line.indexOf("data: ") === 0) data += line.slice(6);
+        });
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+
+    function pump() {
+      return reader.read().then(function (chunk) {
+        if (chunk.done) return;
+        buffer += decoder.decode(chunk.value, { stream: true });
+        flush();
+        return pump();
+      });
+    }
+    return pump();
+  }
+
+  function mount() {
+    var root = document.getElementById("imd-chat");
+    if (root && window.IMD_PERSONAS) new Widget(root);
+  }
+
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", mount);
+  } else {
+    mount();
+  }
+})();
@@ -0,0 +1,223 @@
+// 자동 생성 파일 (python widget_export.py) - 직접 수정하지 마세요
+window.IMD_PERSONAS = {
+ "gs": {
+  "chips": [
+   "안경 없으면 잘 안 보여요",
+   "렌즈 끼면 눈이 충혈돼요",
+   "라식 얼마예요?"
+  ],
+  "cta_note": "",
+  "cta_sub": "야간/주말 문의 자동 응대로 검안 예약률을 높여드립니다",
+  "cta_title": "이 AI 시스템을 안과에 도입하시겠습니까?",
+  "form": [
+   {
+    "label": "병원명",
+    "name": "clinic_name",
+    "placeholder": "안과"
+   },
+   {
+    "label": "담당자 성함",
+    "name": "director_name",
+    "placeholder": "김담당"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "무료 도입 견적서 받기",
+  "initial_msg": "안녕하세요, 담당자님.\n\n\"라식 얼마예요?\" 묻고 나가는 환자들... 아깝지 않으십니까?\n\n저희 AI는 가격을 묻기 전에 '눈 상태'를 먼저 묻습니다.\n\n환자가 자신의 눈이 '단순 근시'가 아니라는 걸 알게 되면, 가격이 아니라 '안전한 수술'을 찾게 됩니다.\n\n지금부터 '시력이 떨어진 환자'가 되어 대화를 진행해보세요.",
+  "option_guide": "스마트폰을 멀리 두고, 아래 글씨가 어떻게 보이는지 선택해주세요",
+  "sub": "단순 가격 문의를 '검안 예약'으로 바꾸는 AI 솔루션",
+  "title": "안과 AI 정밀 검안 센터"
+ },
+ "hanbang": {
+  "chips": [
+   "요즘 만성 피로가 심해요",
+   "허리랑 다리가 저려요",
+   "소화가 잘 안 돼요"
+  ],
+  "cta_note": "",
+  "cta_sub": "지역구 독점권은 선착순입니다. 무료 도입 견적서를 보내드립니다",
+  "cta_title": "이 시스템을 한의원에 도입하시겠습니까?",
+  "form": [
+   {
+    "label": "병원명",
+    "name": "clinic_name",
+    "placeholder": "서울한의원"
+   },
+   {
+    "label": "원장님 성함",
+    "name": "director_name",
+    "placeholder": "홍길동"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "무료 도입 견적서 받기",
+  "initial_msg": "안녕하십니까, 원장님.\n\n원장님, 오늘 \"그냥 침만 맞을게요\"라는 말, 몇 번이나 들으셨습니까?\n\n그 한 마디에 날아간 매출이 이번 달에만 얼마인지 계산해 보셨나요?\n\n환자가 진료실 문을 열기 전, 이미 결제할 마음을 먹게 만드는 것. 그게 제가 하는 일입니다.\n\n저는 밥도 안 먹고, 퇴근도 안 하며, 감정 노동에 지치지도 않는 AI 세일즈 실장입니다.\n\n지금 바로, 제가 악성 환자를 어떻게 'VIP'로 바꾸는지 대화 내역을 눈으로 확인하세요.",
+  "option_guide": "거울을 보시고 본인의 혀와 가장 비슷한 사진을 선택해주세요",
+  "sub": "원장님의 진료 철학을 완벽하게 학습한 'AI 수석 실장'을 소개합니다",
+  "title": "IMD STRATEGIC CONSULTING"
+ },
+ "law": {
+  "chips": [
+   "남편이 외도를 했어요",
+   "이혼할 때 재산분할이 걱정돼요",
+   "배우자에게 폭행을 당했어요"
+  ],
+  "cta_note": "",
+  "cta_sub": "야간/주말 의뢰인 응대 자동화로 수임률을 높여드립니다",
+  "cta_title": "변호사님, 이런 시스템 어떠세요?",
+  "form": [
+   {
+    "label": "법무법인/사무소명",
+    "name": "clinic_name",
+    "placeholder": "법무법인 OO"
+   },
+   {
+    "label": "변호사님 성함",
+    "name": "director_name",
+    "placeholder": "김변호사"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "무료 도입 견적서 받기",
+  "initial_msg": "안녕하세요, 변호사님.\n\n변호사님, \"상담 좀 받고 싶은데요\"라고 밤 11시에 들어온 문의... 아침에 확인하면 이미 다른 로펌에 연락한 뒤더라고요.\n\n저희 AI는 야간에도 의뢰인의 **'사건 유형(가사/형사)'**을 자동 분류하고, **'증거 유무'**까지 파악해둡니다.\n\n변호사님은 다음 날 출근해서 **'정리된 사건 리포트'**만 확인하시면 됩니다.\n\n지금부터 **'법률 상담이 필요한 의뢰인'** 역할을 해주세요.",
+  "option_guide": "현재 상황과 가장 가까운 것을 선택해주세요",
+  "sub": "변호사님 퇴근 후에도, AI가 의뢰인의 '사건 유형'을 분류하고 증거를 파악합니다",
+  "title": "24시간 AI 사건 접수 시스템"
+ },
+ "lift": {
+  "chips": [
+   "20대",
+   "30대",
+   "40대",
+   "50대 이상"
+  ],
+  "cta_note": "",
+  "cta_sub": "추천 시술과 예상 비용을 확인하려면 연락처를 입력해주세요",
+  "cta_title": "🔒 맞춤 시술 리포트 잠금 해제",
+  "form": [
+   {
+    "label": "성함",
+    "name": "name",
+    "placeholder": "홍길동"
+   },
+   {
+    "label": "연락처",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "리포트 무료로 받기",
+  "initial_msg": "안녕하세요, AI 리프팅 진단 시스템입니다.\n\n**4만 건의 시술 데이터**를 학습한 AI가 고객님의 피부 타입에 딱 맞는 시술을 분석해 드립니다.\n\n간단한 질문 3가지만 답해주시면, **맞춤 시술 리포트**를 무료로 받아보실 수 있습니다.\n\n먼저, 고객님의 **연령대**를 선택해주세요.",
+  "option_guide": "버튼을 선택하거나, 직접 입력하셔도 됩니다",
+  "sub": "4만 건 데이터 기반 AI 분석",
+  "title": "내 얼굴형에 딱 맞는 리프팅 시술은?"
+ },
+ "math": {
+  "chips": [
+   "중2, 수학 4등급이에요",
+   "고1, 1~2등급 목표예요",
+   "고2, 5등급 이하예요"
+  ],
+  "cta_note": "",
+  "cta_sub": "리포트와 '원장님의 긴급 처방전'을 받으시려면 연락처를 입력해주세요",
+  "cta_title": "🔒 [맞춤형 리포트 잠금 해제]",
+  "form": [
+   {
+    "label": "학원명",
+    "name": "clinic_name",
+    "placeholder": "OO수학학원"
+   },
+   {
+    "label": "원장님 성함",
+    "name": "director_name",
+    "placeholder": "김원장"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "리포트 받기",
+  "initial_msg": "안녕하세요, 원장님.\n\n원장님, 학부모가 \"상담 좀 받고 싶은데요\" 하고 들어왔다가 정보만 얻고 나가는 경험 있으시죠?\n\n저희 AI는 다릅니다.\n\n**'증상을 맞히고 → 공포를 주고 → 해결책은 가린 채'** 번호를 받습니다.\n\n병은 무료로 알려주지만, **약은 DB를 받고 팝니다.**\n\n지금부터 **'수학 학원을 알아보는 학부모'** 역할을 해주세요.",
+  "option_guide": "자녀의 현재 수학 상황을 선택해주세요",
+  "sub": "대치동 1타 강사의 데이터를 학습한 AI가 '인서울 확률'을 냉정하게 진단합니다",
+  "title": "AI 입시 진단관"
+ },
+ "nana": {
+  "chips": [
+   "눈이 고민이에요",
+   "코가 고민이에요",
+   "얼굴 윤곽이 고민이에요"
+  ],
+  "cta_note": "",
+  "cta_sub": "야간/해외 환자 응대 자동화로 상담 전환율을 높여드립니다",
+  "cta_title": "이 AI 시스템을 나나성형외과에 도입하시겠습니까?",
+  "form": [
+   {
+    "label": "병원명",
+    "name": "clinic_name",
+    "placeholder": "나나성형외과"
+   },
+   {
+    "label": "담당자 성함",
+    "name": "director_name",
+    "placeholder": "김실장"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "무료 도입 견적서 받기",
+  "initial_msg": "안녕하세요, 실장님.\n\n퇴근 후에 들어오는 성형 문의... 놓치면 다 다른 병원으로 갑니다.\n\nAI가 환자의 '워너비 스타일'을 파악하고 내원까지 시키는 과정을 보여드립니다.\n\n지금부터 '성형을 고민하는 환자'가 되어보세요.",
+  "option_guide": "원장님께 보여드리고 싶은 '워너비 스타일'을 골라주세요",
+  "sub": "원장님이 수술 중일 때도, AI가 환자의 '니즈'를 파악합니다",
+  "title": "AI 뷰티 컨설턴트"
+ },
+ "root": {
+  "chips": [
+   "IMD는 뭐하는 회사야?",
+   "진짜 매출이 올라?",
+   "저는 병원 원장입니다"
+  ],
+  "cta_note": "",
+  "cta_sub": "맞춤형 매출 시스템 설계를 시작합니다",
+  "cta_title": "IMD 시스템 도입 문의",
+  "form": [
+   {
+    "label": "회사/병원명",
+    "name": "clinic_name",
+    "placeholder": "회사명 또는 병원명"
+   },
+   {
+    "label": "담당자 성함",
+    "name": "director_name",
+    "placeholder": "홍길동"
+   },
+   {
+    "label": "연락처 (직통)",
+    "name": "contact",
+    "placeholder": "010-1234-5678"
+   }
+  ],
+  "form_button": "무료 컨설팅 신청",
+  "initial_msg": "반갑습니다. 비즈니스 아키텍처 그룹 IMD입니다.\n\n대부분의 방문자는 '홈페이지 견적'을 물어보러 오지만,\n결국 **'매출 시스템'**을 계약하고 나갑니다.\n\n무엇을 설계해 드릴까요?",
+  "option_guide": "",
+  "sub": "매출을 설계하는 비즈니스 아키텍처 그룹",
+  "title": "IMD ARCHITECTURE GROUP"
+ }
+};
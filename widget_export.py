@@ -0,0 +1,51 @@
+"""
+IMD Sales Bot - Widget Export
+config.py의 페르소나 데이터를 정적 위젯용 JS 파일로 내보내기
+- 첫 화면(인사말, 추천 버튼, 폼 문구)은 서버 호출 없이 이 파일만으로 그림
+- config.py를 고치면 다시 실행: python widget_export.py
+"""
+
+import argparse
+import json
+import os
+
+from config import DATA, get_quick_replies
+from conversation_engine import lead_form_spec
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "widget", "personas.js")
+
+
+def export_personas() -> dict:
+    """위젯이 첫 화면을 그리는 데 필요한 페르소나별 정적 데이터"""
+    personas = {}
+    for client_id, cfg in DATA.items():
+        personas[client_id] = {
+            "title": cfg["HEADER_TITLE"],
+            "sub": cfg["HEADER_SUB"],
+            "initial_msg": cfg["INITIAL_MSG"],
+            "chips": get_quick_replies(client_id, "initial"),
+            "option_guide": cfg.get("TONGUE_GUIDE", ""),
+            "cta_title": cfg["CTA_TITLE"],
+            "cta_sub": cfg["CTA_SUB"],
+            "cta_note": cfg.get("CTA_NOTE", ""),
+            "form_button": cfg["FORM_BUTTON"],
+            "form": lead_form_spec(client_id),
+        }
+    return personas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="위젯용 페르소나 데이터 내보내기")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    payload = json.dumps(export_personas(), ensure_ascii=False, indent=1, sort_keys=True)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("// 자동 생성 파일 (python widget_export.py) - 직접 수정하지 마세요\n")
+        f.write(f"window.IMD_PERSONAS = {payload};\n")
+    print(f"{args.output}: {len(DATA)}개 페르소나")
+
+
+if __name__ == "__main__":
+    main()